@@ -0,0 +1,131 @@
+import pandas as pd
+import ppe_match as pp
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmark of TestingFramework.run, the strategies, and compute_metrics on synthetic instances of growing size.
+# The results (time and peak memory of each component for each size) are saved in a json file, which can be used
+# as the baseline of later executions (--compare) to catch performance regressions.
+
+parser = argparse.ArgumentParser(description='Benchmark suite on synthetic instances')
+parser.add_argument('--sizes', default='50x150,100x300,200x600,400x1200',
+					help='comma-separated list of instance sizes (donors x recipients)')
+parser.add_argument('--ppes', type=int, default=5, help='number of ppe types')
+parser.add_argument('--days', type=int, default=60, help='number of days')
+parser.add_argument('--arrival', default='uniform', help='arrival distribution (uniform, decreasing, peak)')
+parser.add_argument('--spread', type=float, default=8.0, help='geographic spread of the locations (degrees)')
+parser.add_argument('--interval', type=int, default=7, help='interval of the testing framework')
+parser.add_argument('--engine', default='array', help='simulation engine')
+parser.add_argument('--strategies', default='FCFM_strategy,proximity_match_strategy,fast_proximity_match_strategy',
+					help='comma-separated list of strategies of the module strategies')
+parser.add_argument('--seed', type=int, default=0, help='random seed of the instances')
+parser.add_argument('--repeat', type=int, default=3, help='number of executions timed for each component (the fastest is kept)')
+parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory (faster)')
+parser.add_argument('--output', default=os.path.join('..', 'results', 'benchmark_results.json'),
+					help='json file where the results are saved')
+parser.add_argument('--compare', default=None, help='json file of a baseline to compare the results with')
+parser.add_argument('--tolerance', type=float, default=0.25,
+					help='largest relative slowdown with respect to the baseline that is not a regression')
+parser.add_argument('--min-seconds', type=float, default=0.05,
+					help='components faster than this in the baseline are not checked for regressions')
+args = parser.parse_args()
+
+for name in ['testing_framework', 'strategies', 'engines']:
+	logging.getLogger(f'ppe_match.{name}').setLevel(logging.ERROR)
+
+
+def measure_time(function, after=None):
+	# fastest wall time of function() over args.repeat executions, and after() called after the fastest execution
+	best = None
+	for _ in range(args.repeat):
+		start = time.perf_counter()
+		result = function()
+		seconds = time.perf_counter() - start
+		if best is None or seconds < best[1]:
+			best = (result, seconds, after() if after is not None else None)
+	return best
+
+
+def measure_peak(function):
+	# peak memory allocated by function(), measured in a separate execution because tracemalloc slows it down
+	if args.no_memory:
+		return None
+	tracemalloc.start()
+	function()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return peak
+
+
+records = []
+with tempfile.TemporaryDirectory() as tmp:
+	for size in args.sizes.split(','):
+		n_donors, n_recipients = (int(n) for n in size.split('x'))
+		donors, recipients, distance_mat = pp.synthetic.generate_instance(
+			n_donors, n_recipients, n_ppes=args.ppes, n_days=args.days,
+			arrival=args.arrival, spread=args.spread, seed=args.seed)
+		paths = pp.synthetic.write_instance(os.path.join(tmp, size), donors, recipients, distance_mat)
+		instance = {'size': size, 'n_donors': n_donors, 'n_recipients': n_recipients,
+					'donor_requests': len(donors), 'recipient_requests': len(recipients)}
+		print(f'Instance {size}: {len(donors)} donor requests, {len(recipients)} recipient requests')
+
+		# loading the data: the framework reads them at their first use (load), and keeps them in a cache shared by the
+		# frameworks of the process, which is cleared so that each execution reads the files
+		def load():
+			pp.testing_framework._read_requests.cache_clear()
+			pp.testing_framework._read_distances.cache_clear()
+			return pp.TestingFramework(*paths, interval=args.interval, engine=args.engine).load()
+		s, seconds, _ = measure_time(load)
+		records.append(dict(instance, strategy=None, component='load', seconds=seconds, peak_bytes=measure_peak(load)))
+
+		for strategy_name in args.strategies.split(','):
+			s.set_strategy(getattr(pp.strategies, strategy_name))
+			# split the time of the run into its phases with the profiler
+			s.set_profile(True)
+			_, seconds, phases = measure_time(s.run, lambda: s.get_timings().groupby('phase')['seconds'].sum())
+			s.set_profile(False)
+			records.append(dict(instance, strategy=strategy_name, component='run', seconds=seconds, peak_bytes=measure_peak(s.run)))
+			for phase in ['strategy', 'ship', 'compute_metrics']:
+				records.append(dict(instance, strategy=strategy_name, component=phase,
+									seconds=float(phases.get(phase, 0.0)), peak_bytes=None))
+			_, seconds, _ = measure_time(s.compute_metrics)
+			records.append(dict(instance, strategy=strategy_name, component='compute_metrics_only', seconds=seconds,
+								peak_bytes=measure_peak(s.compute_metrics)))
+			print(f'\t{strategy_name}: run {records[-5]["seconds"]:.2f} seconds, strategy {records[-4]["seconds"]:.2f} seconds')
+
+results = pd.DataFrame(records)
+print(results.pivot_table(index=['strategy', 'component'], columns='size', values='seconds', dropna=False, sort=False))
+
+baseline = {
+	'machine': {'python': sys.version.split()[0], 'platform': platform.platform(), 'processor': platform.processor(),
+				'cpu_count': os.cpu_count(), 'pandas': pd.__version__},
+	'parameters': vars(args),
+	'results': records,
+}
+os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+with open(args.output, 'w') as f:
+	json.dump(baseline, f, indent=1)
+print(f'Results saved in {args.output}')
+
+if args.compare is not None:
+	with open(args.compare) as f:
+		reference = pd.DataFrame(json.load(f)['results'])
+	key = ['size', 'strategy', 'component']
+	cmp = results.merge(reference, on=key, suffixes=('', '_baseline'))
+	cmp['time_ratio'] = (cmp.seconds / cmp.seconds_baseline).where(cmp.seconds_baseline >= args.min_seconds)
+	cmp['memory_ratio'] = (cmp.peak_bytes / cmp.peak_bytes_baseline).astype(float)
+	columns = key + ['seconds_baseline', 'seconds', 'time_ratio', 'peak_bytes_baseline', 'peak_bytes', 'memory_ratio']
+	print(cmp[columns].to_string(index=False))
+	regressions = cmp[(cmp.time_ratio > 1 + args.tolerance) | (cmp.memory_ratio > 1 + args.tolerance)]
+	if len(regressions) > 0:
+		print(f'\n\n============================================\nERROR: {len(regressions)} components are more than {args.tolerance:.0%} slower (or use more memory) than the baseline\n============================================\n')
+		print(regressions[columns].to_string(index=False))
+		exit(1)
+	print('\n\n============================================\nNo performance regression with respect to the baseline\n============================================\n')
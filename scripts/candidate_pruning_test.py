@@ -0,0 +1,47 @@
+import pandas as pd
+import ppe_match as pp
+import logging
+import tempfile
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.strategies').setLevel(logging.ERROR)
+
+# Synthetic instance on which the pruning stage of the compatible pairs is checked
+donors, recipients, distance_mat = pp.synthetic.generate_instance(200, 800, n_days=30, seed=4)
+k, max_distance = 4, 400
+
+# The pairs kept are the pairs within max_distance among the k closest recipients of each donor and ppe
+agg_donors = donors.groupby(['don_id', 'ppe'], as_index=False).qty.sum()
+agg_recipients = recipients.groupby(['rec_id', 'ppe'], as_index=False).qty.sum()
+kept = pp.pruning.CandidatePruning(k=k, max_distance=max_distance).prune(None, agg_donors, agg_recipients, distance_mat)
+pairs = distance_mat.reset_index().merge(agg_donors[['don_id', 'ppe']]).merge(agg_recipients[['rec_id', 'ppe']])
+pairs = pairs[pairs.distance <= max_distance].sort_values(['distance', 'index'])
+expected = pairs[pairs.groupby(['don_id', 'ppe']).cumcount() < k].drop_duplicates(['don_id', 'rec_id']).sort_values('index')
+pd.testing.assert_frame_equal(kept, expected[['don_id', 'rec_id', 'distance']].reset_index(drop=True))
+print(f'{len(kept)} of {len(distance_mat)} pairs kept')
+
+# When k is larger than the number of recipients, nothing is pruned and the decisions do not change.
+# With the pruning, the decisions are made on the pairs kept, unless the period was solved again with all the pairs (fallback)
+with tempfile.TemporaryDirectory() as tmp:
+	paths = pp.synthetic.write_instance(tmp, donors, recipients, distance_mat)
+	for strategy in [pp.strategies.fast_proximity_match_strategy, pp.strategies.TransportationStrategy()]:
+		s = pp.TestingFramework(*paths, strategy=strategy, engine='array')
+		s.run()
+		full = s.get_decisions()
+
+		s.set_pruning(pp.pruning.CandidatePruning(k=len(recipients)))
+		s.run()
+		pd.testing.assert_frame_equal(full, s.get_decisions())
+		assert s.get_pruning_report().pruned_share.max() == 0
+
+		for fallback in [False, True]:
+			s.set_pruning(pp.pruning.CandidatePruning(k=k, max_distance=max_distance, fallback=fallback))
+			s.run()
+			report = s.get_pruning_report()
+			decisions = s.get_decisions().merge(report[['date', 'fallback']], on='date')
+			assert (decisions[~decisions.fallback].distance <= max_distance).all()
+			print(f'{s.get_strategy()}, fallback={fallback}: {len(s.get_decisions())} decisions '
+				f'(without pruning: {len(full)}), {report.kept_pairs.sum()} of {report.pairs.sum()} pairs kept, '
+				f'{report.fallback.sum()} fallbacks')
+
+print('\n\n============================================\nThe pruning stage kept the closest pairs\n============================================\n')
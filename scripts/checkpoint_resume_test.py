@@ -0,0 +1,45 @@
+import pandas as pd
+import ppe_match as pp
+import glob
+import logging
+import os
+import tempfile
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.strategies').setLevel(logging.ERROR)
+
+# Synthetic instance on which a run writes a checkpoint every 3 periods: resuming the run from any of its
+# checkpoints, with either engine, must give the same decisions and metrics as the run without interruption
+donors, recipients, distance_mat = pp.synthetic.generate_instance(100, 400, n_days=40, seed=6)
+
+with tempfile.TemporaryDirectory() as tmp:
+	paths = pp.synthetic.write_instance(tmp, donors, recipients, distance_mat)
+	for strategy in [pp.strategies.FCFM_strategy, pp.strategies.fast_proximity_match_strategy, pp.strategies.TransportationStrategy()]:
+		for engine in ['pandas', 'array']:
+			checkpoint_path = os.path.join(tmp, f'{engine}-{{period}}.ckpt')
+			s = pp.TestingFramework(*paths, strategy=strategy, interval=2, engine=engine,
+									checkpoint_path=checkpoint_path, checkpoint_every=3)
+			s.run()
+			decisions, metrics = s.get_decisions(), s.get_metrics()
+			checkpoints = sorted(glob.glob(os.path.join(tmp, f'{engine}-*.ckpt')))
+			for path in checkpoints:
+				for resume_engine in ['pandas', 'array']:
+					r = pp.TestingFramework(*paths, engine=resume_engine)
+					r.resume(path)
+					pd.testing.assert_frame_equal(decisions, r.get_decisions())
+					pd.testing.assert_frame_equal(metrics, r.get_metrics())
+				os.remove(path)
+			print(f'{s.get_strategy()}, {engine} engine: same decisions resuming from {len(checkpoints)} checkpoints')
+
+	# what-if: continue the run from a checkpoint with another strategy
+	s = pp.TestingFramework(*paths, strategy=pp.strategies.FCFM_strategy, interval=2, engine='array',
+							checkpoint_path=os.path.join(tmp, 'run.ckpt'), checkpoint_every=10)
+	s.run()
+	checkpoint = pp.checkpoint.Checkpoint.load(os.path.join(tmp, 'run.ckpt'))
+	s.resume(checkpoint, strategy=pp.strategies.fast_proximity_match_strategy)
+	what_if = s.get_decisions()
+	pd.testing.assert_frame_equal(pp.coding.decode(checkpoint.decisions), what_if[what_if.date <= checkpoint.d1].reset_index(drop=True),
+								check_dtype=False)
+	print(f'What-if from {checkpoint}: {len(what_if)} decisions')
+
+print('\n\n============================================\nThe runs resumed from the checkpoints made the same decisions\n============================================\n')
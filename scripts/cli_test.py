@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import ppe_match as pp
+import io
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.sweep').setLevel(logging.WARN)
+
+# Synthetic instance on which the command line interface is checked: the comparison table must contain the metrics
+# of sweep.run_sweep, with 1 and 2 jobs, for strategies of the package and user strategies given by dotted path,
+# and python -m ppe_match must write the same table as cli.main
+donors, recipients, distance_mat = pp.synthetic.generate_instance(150, 500, n_ppes=5, n_days=60, seed=10)
+
+with tempfile.TemporaryDirectory() as tmp:
+	donor_path, recipient_path, distance_path = pp.synthetic.write_instance(os.path.join(tmp, 'data'), donors, recipients, distance_mat)
+	with open(os.path.join(tmp, 'user_strategies.py'), 'w') as f:
+		f.write('from ppe_match import strategies\n\n'
+				'def user_fcfm(date, Dt, Rt, M):\n'
+				'    return strategies.FCFM_strategy(date, Dt, Rt, M)\n')
+	sys.path.insert(0, tmp)
+	data_args = ['--donors', donor_path, '--recipients', recipient_path, '--distances', distance_path]
+
+	s = pp.TestingFramework(donor_path, recipient_path, distance_path, engine='array', overall_metrics_only=True)
+	grid = pp.sweep.parameter_grid([pp.strategies.FCFM_strategy, pp.strategies.fast_proximity_match_strategy], [1, 7], [1000])
+	expected = pp.cli.comparison_table(pp.sweep.run_sweep(s, grid, max_workers=1))
+
+	for jobs in [1, 2]:
+		output = os.path.join(tmp, f'metrics_{jobs}.csv')
+		status = pp.cli.main(data_args + ['--strategies', 'FCFM_strategy,fast_proximity_match_strategy,user_strategies.user_fcfm',
+							'--intervals', '1,7', '--jobs', str(jobs), '--output', output])
+		assert status == 0
+		table = pd.read_csv(output)
+		pd.testing.assert_frame_equal(table[table.strategy != 'user_fcfm'].reset_index(drop=True), expected, check_dtype=False)
+		user = table[table.strategy == 'user_fcfm'].drop(columns='strategy').reset_index(drop=True)
+		fcfm = table[table.strategy == 'FCFM_strategy'].drop(columns='strategy').reset_index(drop=True)
+		pd.testing.assert_frame_equal(user, fcfm)
+		print(f'--jobs {jobs}: {len(table)} runs compared')
+
+	# the module entry point, with the phases of the runs
+	env = dict(os.environ, PYTHONPATH=os.pathsep.join([tmp, os.path.dirname(os.path.dirname(pp.__file__))]))
+	process = subprocess.run([sys.executable, '-m', 'ppe_match'] + data_args +
+							['--strategies', 'user_strategies:user_fcfm', '--intervals', '7', '--format', 'json', '--profile'],
+							capture_output=True, text=True, env=env, check=True)
+	table = pd.read_json(io.StringIO(process.stdout), orient='records')
+	assert np.allclose(table.drop(columns=['strategy', 'interval', 'max_donation_qty']).values[0],
+					fcfm[fcfm.interval == 7].drop(columns=['interval', 'max_donation_qty']).values[0])
+	assert 'compute_metrics' in process.stderr
+	print(f'python -m ppe_match --profile:\n{process.stderr}')
+
+	# a strategy that cannot be found is a usage error
+	process = subprocess.run([sys.executable, '-m', 'ppe_match', '--strategies', 'no_such_strategy'],
+							capture_output=True, text=True, env=env)
+	assert process.returncode == 2 and 'Unknown strategy' in process.stderr
+
+print('\n\n============================================\nThe command line interface compared the expected metrics\n============================================\n')
@@ -0,0 +1,39 @@
+import pandas as pd
+import ppe_match as pp
+import logging
+import time
+import os
+
+# TODO: set the data_directory variable as the directory containing the data set (anon_donors.csv, anon_recipients.csv, anon_distance_matrix.csv)
+data_directory = os.path.join(os.getcwd(), '..', 'data')
+
+# solve the matching problem every day, which is the most expensive setting
+interval = 1
+strategy = pp.strategies.FCFM_strategy
+
+donor_path = os.path.abspath(f'{data_directory}/anon_donors.csv')
+recipient_path = os.path.abspath(f'{data_directory}/anon_recipients.csv')
+distance_path = os.path.abspath(f'{data_directory}/anon_distance_matrix.csv')
+if not all(os.path.exists(f) for f in [donor_path, recipient_path, distance_path]):
+	print(f'===========================\nERROR:\nError reading the content of directory {data_directory}. Make sure that this directory exists and contains files anon_donors.csv, anon_recipients.csv, and anon_distance_matrix.csv\n==========================')
+	exit(1)
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+
+# Run the same simulation with the reference (pandas) engine and with the array engine
+times = {}
+results = {}
+for engine in ['pandas', 'array']:
+	s = pp.TestingFramework(donor_path, recipient_path, distance_path, strategy=strategy, interval=interval, engine=engine)
+	start = time.perf_counter()
+	s.run()
+	times[engine] = time.perf_counter() - start
+	results[engine] = (s.get_decisions(), s.get_metrics())
+	print(f'{engine} engine: {times[engine]:.2f} seconds, {len(s.get_decisions())} granular decisions')
+
+# Both engines must make exactly the same decisions and compute the same metrics
+pd.testing.assert_frame_equal(results['pandas'][0], results['array'][0])
+pd.testing.assert_frame_equal(results['pandas'][1], results['array'][1])
+
+print('\n\n============================================\nThe two engines produced the same decisions and metrics\n============================================\n')
+print(f'Speedup of the array engine: {times["pandas"] / times["array"]:.1f}x')
@@ -0,0 +1,56 @@
+import pandas as pd
+import ppe_match as pp
+import logging
+import os
+import tempfile
+import time
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.sweep').setLevel(logging.WARN)
+
+# Synthetic instance on which a sweep over max_donation_qty is run with a memoized strategy: the decisions must be
+# the same as without the cache, the rerun of the sweep must read all the decisions from the cache, and the cache
+# must not grow beyond max_bytes
+donors, recipients, distance_mat = pp.synthetic.generate_instance(200, 800, n_ppes=5, n_days=60, seed=8)
+donors.loc[donors.sample(frac=0.05, random_state=0).index, 'qty'] = 2000  # donations removed by max_donation_qty=1000
+
+with tempfile.TemporaryDirectory() as tmp:
+	paths = pp.synthetic.write_instance(os.path.join(tmp, 'data'), donors, recipients, distance_mat)
+	s = pp.TestingFramework(*paths, interval=3, engine='array')
+	strategy = pp.strategies.TransportationStrategy(warm_start=False)
+	grid = pp.sweep.parameter_grid([strategy], [3], [1000, 2000, 5000])
+	start = time.perf_counter()
+	metrics = pp.sweep.run_sweep(s, grid, max_workers=1)
+	print(f'Sweep without cache: {time.perf_counter() - start:.2f} seconds')
+
+	memoized = pp.memo.MemoizedStrategy(strategy, os.path.join(tmp, 'memo'))
+	grid = pp.sweep.parameter_grid([memoized], [3], [1000, 2000, 5000])
+	for execution in ['first', 'second']:
+		# the memoized strategy is copied for each run of the sweep, so the hits are counted on the cache entries
+		entries = len(pp.memo.cache_entries(memoized.cache_dir))
+		start = time.perf_counter()
+		memo_metrics = pp.sweep.run_sweep(s, grid, max_workers=1)
+		seconds = time.perf_counter() - start
+		pd.testing.assert_frame_equal(metrics, memo_metrics)
+		new_entries = len(pp.memo.cache_entries(memoized.cache_dir)) - entries
+		print(f'Sweep with cache ({execution} execution): {seconds:.2f} seconds, {new_entries} problems solved')
+	assert new_entries == 0
+
+	# hit rate of the runs with max_donation_qty 2000 and 5000, which share the periods without large donations
+	s.set_strategy(memoized)
+	for max_donation_qty in [2000, 5000]:
+		memoized.reset_stats()
+		s.set_max_donation_qty(max_donation_qty)
+		s.run()
+		print(f'max_donation_qty {max_donation_qty}: {memoized.stats()}')
+	assert memoized.stats()['hit_rate'] == 1.0
+
+	# the least recently used entries are removed when the cache exceeds max_bytes
+	bounded = pp.memo.MemoizedStrategy(strategy, os.path.join(tmp, 'bounded'), max_bytes=20000)
+	s.set_strategy(bounded)
+	s.run()
+	entries = pp.memo.cache_entries(bounded.cache_dir)
+	assert entries.bytes.sum() <= bounded.max_bytes and bounded.misses > len(entries)
+	print(f'Bounded cache: {len(entries)} of {bounded.misses} entries kept, {entries.bytes.sum()} bytes')
+
+print('\n\n============================================\nThe memoized strategy made the same decisions\n============================================\n')
@@ -0,0 +1,65 @@
+import pandas as pd
+import ppe_match as pp
+import gzip
+import glob
+import logging
+import os
+import tempfile
+import time
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+
+# Synthetic instance run with writeFiles=True: the background writer must write the same files as the writer that
+# blocks the simulation, the single compressed csv files must contain the tables of all the periods, and the file
+# all_decisions must be written into the output directory
+def read(path):
+	# the gzip headers contain the time of writing, so the uncompressed contents are compared
+	with (gzip.open(path) if path.endswith('.gz') else open(path, 'rb')) as f:
+		return f.read()
+
+
+donors, recipients, distance_mat = pp.synthetic.generate_instance(200, 600, n_ppes=5, n_days=60, seed=7)
+
+with tempfile.TemporaryDirectory() as tmp:
+	paths = pp.synthetic.write_instance(os.path.join(tmp, 'data'), donors, recipients, distance_mat)
+	s = pp.TestingFramework(*paths, strategy=pp.strategies.fast_proximity_match_strategy, interval=1, engine='array')
+	s.run()
+	decisions = s.get_decisions()
+
+	runs = {}
+	for output_format, output_queue in [('directories', 0), ('directories', 8), ('csv', 0), ('csv', 8)]:
+		directory = os.path.join(tmp, f'{output_format}-{output_queue}')
+		s = pp.TestingFramework(*paths, strategy=pp.strategies.fast_proximity_match_strategy, interval=1, engine='array',
+								writeFiles=True, output_directory=directory, output_format=output_format,
+								output_queue=output_queue, profile=True)
+		start = time.perf_counter()
+		s.run()
+		seconds = time.perf_counter() - start
+		pd.testing.assert_frame_equal(decisions, s.get_decisions())
+		waiting = s.get_timings().groupby('phase').seconds.sum()['write_files']
+		print(f'{output_format}, queue {output_queue}: {seconds:.2f} seconds, of which {waiting:.2f} waiting for the files')
+		runs[output_format, output_queue] = directory
+
+	# same files with and without the background writer
+	for output_format in ['directories', 'csv']:
+		files = sorted(os.path.relpath(path, runs[output_format, 0])
+					for path in glob.glob(os.path.join(runs[output_format, 0], '**', '*.csv*'), recursive=True))
+		assert files == sorted(os.path.relpath(path, runs[output_format, 8])
+							for path in glob.glob(os.path.join(runs[output_format, 8], '**', '*.csv*'), recursive=True))
+		for file in files:
+			assert read(os.path.join(runs[output_format, 0], file)) == read(os.path.join(runs[output_format, 8], file)), file
+		print(f'{output_format}: the background writer wrote the same {len(files)} files')
+
+	# the compressed csv files contain the decisions of all the periods
+	directory = runs['csv', 8]
+	assert os.path.exists(os.path.join(runs['directories', 8], 'all_decisions.csv'))
+	written = pd.read_csv(os.path.join(directory, 'decisions.csv.gz'))
+	assert len(written) == len(decisions)
+	assert (written.period == written.date).all()
+	assert written.qty.sum() == decisions.qty.sum()
+	all_decisions = pd.read_csv(os.path.join(directory, 'all_decisions.csv.gz'), index_col=0)
+	assert len(all_decisions) == len(decisions)
+	periods = pd.read_csv(os.path.join(directory, 'donors.csv.gz')).period.nunique()
+	print(f'csv: decisions.csv.gz contains the {len(written)} decisions of the run, donors.csv.gz the tables of {periods} periods')
+
+print('\n\n============================================\nThe output writers wrote the same files\n============================================\n')
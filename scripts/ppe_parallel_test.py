@@ -0,0 +1,38 @@
+import pandas as pd
+import ppe_match as pp
+import logging
+import tempfile
+import time
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.strategies').setLevel(logging.ERROR)
+
+# Synthetic instance with 10 ppes: splitting each period by ppe and solving the subproblems in a pool of threads or
+# processes must give the same decisions as the strategy on the whole period (up to the order of the ppes)
+donors, recipients, distance_mat = pp.synthetic.generate_instance(150, 600, n_ppes=10, n_days=30, seed=5)
+key = ['date', 'ppe', 'don_id', 'rec_id']
+
+
+def sorted_decisions(s):
+	return s.get_decisions().sort_values(key, kind='stable').reset_index(drop=True)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+	paths = pp.synthetic.write_instance(tmp, donors, recipients, distance_mat)
+	for strategy in [pp.strategies.FCFM_strategy, pp.strategies.fast_proximity_match_strategy,
+					pp.strategies.TransportationStrategy(warm_start=False)]:
+		s = pp.TestingFramework(*paths, strategy=strategy, engine='array')
+		start = time.perf_counter()
+		s.run()
+		serial = sorted_decisions(s)
+		metrics = s.get_metrics()
+		print(f'{s.get_strategy()}: {len(serial)} decisions, {time.perf_counter() - start:.2f} seconds')
+		for executor in ['thread', 'process']:
+			s.set_ppe_jobs(4, executor)
+			start = time.perf_counter()
+			s.run()
+			pd.testing.assert_frame_equal(serial, sorted_decisions(s))
+			pd.testing.assert_frame_equal(metrics, s.get_metrics())
+			print(f'\t4 workers ({executor}): same decisions, {time.perf_counter() - start:.2f} seconds')
+
+print('\n\n============================================\nThe ppe subproblems solved in parallel gave the same decisions\n============================================\n')
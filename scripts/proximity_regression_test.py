@@ -0,0 +1,72 @@
+import pandas as pd
+import numpy as np
+import ppe_match as pp
+import logging
+import os
+
+# TODO: set the data_directory variable as the directory containing the tables (Table1.csv, Table2.csv, Table3.csv)
+data_directory = os.path.join(os.getcwd(), 'test_data')
+
+# number of randomized instances
+n_instances = 200
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.strategies').setLevel(logging.WARN)
+
+
+def check_same_decisions(date, Dt, Rt, M):
+	# run both implementations of the proximity-matching strategy on the same inputs
+	expected = pp.strategies.proximity_match_strategy(date, Dt, Rt, M)
+	result = pp.strategies.fast_proximity_match_strategy(date, Dt, Rt, M)
+	pd.testing.assert_frame_equal(expected.reset_index(drop=True), result.reset_index(drop=True))
+	return expected
+
+
+def random_instance(rng):
+	# random requests of a few donors and recipients; distances are integers so that there are many ties
+	n_don = rng.integers(1, 25)
+	n_rec = rng.integers(1, 40)
+	ppes = [f'ppe{i}' for i in range(rng.integers(1, 4))]
+	date = pd.Timestamp('2020-04-01', tz='UTC')
+	Dt = pd.DataFrame([(f'D{d}', ppe, date, float(rng.integers(1, 100)))
+						for d in range(n_don) for ppe in ppes if rng.random() < 0.7],
+						columns=['don_id', 'ppe', 'date', 'qty'])
+	Rt = pd.DataFrame([(f'R{r}', ppe, date, float(rng.integers(1, 100)))
+						for r in range(n_rec) for ppe in ppes if rng.random() < 0.7],
+						columns=['rec_id', 'ppe', 'date', 'qty'])
+	pairs = Dt[['don_id', 'ppe']].merge(Rt[['rec_id', 'ppe']], on='ppe')[['don_id', 'rec_id']].drop_duplicates()
+	pairs = pairs.sample(frac=1, random_state=int(rng.integers(1000))).reset_index(drop=True)
+	max_distance = rng.choice([3, 20, 1000])
+	pairs['distance'] = rng.integers(0, max_distance, len(pairs)).astype(float)
+	return date, Dt, Rt, pairs
+
+
+# Section 3 data set: compare the decisions of the two strategies within the testing framework
+test_rec = f'{data_directory}/Table1.csv'
+test_don = f'{data_directory}/Table2.csv'
+test_distance = f'{data_directory}/Table3.csv'
+results = []
+for strategy in [pp.strategies.proximity_match_strategy, pp.strategies.fast_proximity_match_strategy]:
+	s = pp.TestingFramework(test_don, test_rec, test_distance, strategy=strategy, interval=1)
+	s.run()
+	results.append(s.get_decisions())
+pd.testing.assert_frame_equal(results[0], results[1])
+print(f'Section 3 data set: same {len(results[0])} decisions')
+
+# Section 3 data set: compare the two strategies on all the pending requests of Tables 1-3
+R = pd.read_csv(test_rec, parse_dates=['date'], index_col=0)
+D = pd.read_csv(test_don, parse_dates=['date'], index_col=0)
+M = pd.read_csv(test_distance, index_col=0)
+Dt = D.groupby(['don_id', 'ppe']).agg({'date': 'min', 'qty': 'sum'}).reset_index()
+Rt = R.groupby(['rec_id', 'ppe']).agg({'date': 'min', 'qty': 'sum'}).reset_index()
+check_same_decisions(D.date.max(), Dt, Rt, M)
+print('Section 3 tables: same decisions')
+
+# Randomized instances
+rng = np.random.default_rng(0)
+n_decisions = 0
+for _ in range(n_instances):
+	n_decisions += len(check_same_decisions(*random_instance(rng)))
+print(f'{n_instances} randomized instances: same {n_decisions} decisions')
+
+print('\n\n============================================\nfast_proximity_match_strategy makes the same decisions as proximity_match_strategy\n============================================\n')
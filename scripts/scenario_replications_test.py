@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import ppe_match as pp
+import logging
+import os
+import tempfile
+import time
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.scenarios').setLevel(logging.WARN)
+
+# Synthetic instance on which the Monte Carlo replications are checked: the replications of the scenario without
+# perturbations must give the metrics of TestingFramework.run, the perturbations must have the requested effect,
+# and the replications must not depend on the number of workers
+donors, recipients, distance_mat = pp.synthetic.generate_instance(150, 500, n_ppes=5, n_days=60, seed=9)
+
+with tempfile.TemporaryDirectory() as tmp:
+	paths = pp.synthetic.write_instance(os.path.join(tmp, 'data'), donors, recipients, distance_mat)
+	s = pp.TestingFramework(*paths, strategy=pp.strategies.fast_proximity_match_strategy, engine='array')
+	s.run()
+	s.compute_metrics(overall_only=True)
+	metrics = s.get_metrics().set_index('metric_name').value
+
+	summary = pp.scenarios.run_replications(s, pp.scenarios.Scenario(), 3, max_workers=1)
+	assert np.allclose(summary.set_index('metric_name')['mean'], metrics.loc[summary.metric_name], equal_nan=True)
+	assert (summary['std'].fillna(0) == 0).all()
+	print('The scenario without perturbations gives the metrics of the historical data')
+
+	# the perturbations of a replication
+	scenario = pp.scenarios.Scenario(bootstrap_donors=True, demand_scale=1.5, date_jitter=3)
+	D, R = scenario.generate(s.all_donors, s.all_recipients, (0, 0))
+	assert len(D) == len(s.all_donors) and D.date.is_monotonic_increasing and R.date.is_monotonic_increasing
+	assert abs(R.qty.sum() / s.all_recipients.qty.sum() - 1.5) < 0.05
+	print(f'Replication 0: {D.don_id.nunique()} of {s.all_donors.don_id.nunique()} donors, '
+		f'{R.qty.sum() / s.all_recipients.qty.sum():.3f} times the demand')
+
+	# the replications do not depend on the number of workers
+	start = time.perf_counter()
+	summary, all_metrics = pp.scenarios.run_replications(s, scenario, 8, seed=1, max_workers=1, return_metrics=True)
+	serial = time.perf_counter() - start
+	start = time.perf_counter()
+	parallel_summary, parallel_metrics = pp.scenarios.run_replications(s, scenario, 8, seed=1, max_workers=4, return_metrics=True)
+	parallel = time.perf_counter() - start
+	pd.testing.assert_frame_equal(all_metrics, parallel_metrics)
+	pd.testing.assert_frame_equal(summary, parallel_summary)
+	assert (summary.ci_low <= summary['mean']).all() and (summary['mean'] <= summary.ci_high).all()
+	print(f'8 replications: {serial:.2f} seconds with 1 worker, {parallel:.2f} seconds with 4 workers')
+	print(summary[['metric_name', 'mean', 'std', 'ci_low', 'ci_high']].to_string(index=False))
+
+	# the intervals of 8 replications use the quantile of t with 7 degrees of freedom, not the normal quantile
+	defined = summary[summary['std'] > 0]
+	half_width = (defined.ci_high - defined['mean']) * np.sqrt(defined.replications) / defined['std']
+	assert np.allclose(half_width[defined.replications == 8], 2.3646, atol=1e-3)
+	print(f'The intervals of {len(defined)} metrics use the quantile 2.3646 of t with 7 degrees of freedom')
+
+# the quantiles of t, with or without scipy: tabulated values, and the expansion beyond the table
+assert np.allclose(pp.scenarios.t_quantile(0.95, np.array([1, 4, 9, 29])), [12.7062, 2.7764, 2.2622, 2.0452], atol=1e-3)
+assert np.allclose(pp.scenarios.t_quantile(0.99, np.array([2, 30, 60, 120])), [9.9248, 2.7500, 2.6603, 2.6174], atol=1e-3)
+assert abs(pp.scenarios.t_quantile(0.9, 1000) - 1.6464) < 1e-3
+
+print('\n\n============================================\nThe replications gave the expected metrics\n============================================\n')
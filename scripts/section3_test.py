@@ -40,7 +40,7 @@ result = s.get_metrics()
 print(result)
 
 try:
-	result.to_csv('..\\results\\section3_test_results.csv')
+	result.to_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'results', 'section3_test_results.csv'))
 except:
 	print(f'===========================\nError saving the metrics above to file. Please verify path in the code\n==========================')
 
@@ -0,0 +1,52 @@
+import pandas as pd
+import numpy as np
+import ppe_match as pp
+import logging
+import os
+import tempfile
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+
+# Synthetic instance with the locations of donors and recipients: the distances computed on the fly by
+# spatial.GeoDistances must be the distances of the matrix M (rounded to 4 decimals), and the k-nearest and
+# radius queries of the spatial index must give the same recipients as a brute-force search
+donors, recipients, distance_mat, donor_locations, recipient_locations = pp.synthetic.generate_instance(
+	200, 600, seed=1, locations=True)
+geo = pp.spatial.GeoDistances.from_frames(donor_locations, recipient_locations)
+print(geo)
+
+merged = geo.to_frame().merge(distance_mat, on=['don_id', 'rec_id'], suffixes=('', '_matrix'))
+assert len(merged) == len(distance_mat)
+assert np.allclose(merged.distance, merged.distance_matrix, atol=1e-3)
+
+all_don = np.arange(len(geo.donors))
+all_rec = np.arange(len(geo.recipients))
+full = geo.submatrix(all_don, all_rec)
+candidates = all_rec[::4]
+for k in [1, 5, 1000]:
+	_, distance = geo.kneighbors(all_don, k)
+	assert np.allclose(distance, np.sort(full, axis=1)[:, :k])
+	_, distance = geo.kneighbors(all_don, k, candidates)
+	assert np.allclose(distance, np.sort(full[:, candidates], axis=1)[:, :k])
+for radius in [50, 200, 1000]:
+	dons, recs, _ = geo.within(all_don, radius)
+	expected = np.argwhere(full <= radius)
+	assert (np.unique(np.column_stack([dons, recs]), axis=0) == np.unique(expected, axis=0)).all()
+print('The k-nearest and radius queries match the brute-force search')
+
+# The simulation with the distances computed on the fly makes the same decisions as with the distance matrix
+with tempfile.TemporaryDirectory() as tmp:
+	paths = pp.synthetic.write_instance(tmp, donors, recipients, distance_mat)
+	location_paths = pp.synthetic.write_locations(tmp, donor_locations, recipient_locations)
+	for engine in ['pandas', 'array']:
+		for strategy in [pp.strategies.FCFM_strategy, pp.strategies.proximity_match_strategy]:
+			s = pp.TestingFramework(*paths, strategy=strategy, engine=engine)
+			s.run()
+			s_geo = pp.TestingFramework(paths[0], paths[1], strategy=strategy, engine=engine,
+										distances=pp.spatial.GeoDistances.from_csv(*location_paths))
+			s_geo.run()
+			columns = ['don_id', 'rec_id', 'ppe', 'date', 'qty', 'holding_time']
+			pd.testing.assert_frame_equal(s.get_decisions()[columns], s_geo.get_decisions()[columns])
+			print(f'{engine}, {strategy.__name__}: same {len(s.get_decisions())} decisions')
+
+print('\n\n============================================\nThe distances computed from the locations match the distance matrix\n============================================\n')
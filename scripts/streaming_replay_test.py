@@ -0,0 +1,44 @@
+import pandas as pd
+import ppe_match as pp
+import asyncio
+import logging
+import os
+
+# TODO: set the data_directory variable as the directory containing the tables (Table1.csv, Table2.csv, Table3.csv)
+data_directory = os.path.join(os.getcwd(), 'test_data')
+
+logging.getLogger('ppe_match.testing_framework').setLevel(logging.WARN)
+logging.getLogger('ppe_match.streaming').setLevel(logging.WARN)
+
+test_rec = f'{data_directory}/Table1.csv'
+test_don = f'{data_directory}/Table2.csv'
+test_distance = f'{data_directory}/Table3.csv'
+
+
+def concat_decisions(decisions):
+	# same columns as TestingFramework.get_decisions
+	empty = pd.DataFrame(columns=['don_id', 'rec_id', 'ppe', 'date', 'qty', 'distance', 'holding_time'])
+	return pd.concat([empty] + list(decisions), ignore_index=True)
+
+
+async def replay_async(donors, recipients, freq):
+	for batch in pp.streaming.replay(donors, recipients, freq):
+		yield batch
+
+
+async def collect(s, freq):
+	return [decisions async for decisions in pp.streaming.astream_decisions(s, replay_async(s.all_donors, s.all_recipients, freq))]
+
+
+# Replay Tables 1 and 2 as streams of batches of different sizes, and compare the decisions with the batch run
+for strategy in [pp.strategies.FCFM_strategy, pp.strategies.proximity_match_strategy]:
+	for interval in [1, 3]:
+		s = pp.TestingFramework(test_don, test_rec, test_distance, strategy=strategy, interval=interval)
+		s.run()
+		for freq in ['1H', '1D', '7D']:
+			streamed = pp.streaming.stream_decisions(s, pp.streaming.replay(s.all_donors, s.all_recipients, freq))
+			pd.testing.assert_frame_equal(s.get_decisions(), concat_decisions(streamed))
+			pd.testing.assert_frame_equal(s.get_decisions(), concat_decisions(asyncio.run(collect(s, freq))))
+		print(f'{strategy.__name__}, interval {interval}: same {len(s.get_decisions())} decisions')
+
+print('\n\n============================================\nThe streaming mode made the same decisions as TestingFramework.run\n============================================\n')
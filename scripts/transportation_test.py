@@ -0,0 +1,87 @@
+import numpy as np
+import ppe_match as pp
+
+# number of randomized instances
+n_instances = 400
+
+rng = np.random.default_rng(0)
+
+
+def random_instance(rng):
+	# random supplies, demands, and integer costs (many ties), with some missing pairs (np.inf)
+	n_don = rng.integers(1, 15)
+	n_rec = rng.integers(1, 25)
+	supply = rng.integers(1, 50, n_don).astype(float)
+	demand = rng.integers(1, 50, n_rec).astype(float)
+	cost = rng.integers(0, rng.choice([3, 20, 1000]), (n_don, n_rec)).astype(float)
+	cost[rng.random((n_don, n_rec)) < rng.choice([0.0, 0.3, 0.8])] = np.inf
+	return supply, demand, cost
+
+
+def check_optimal(x, supply, demand, cost):
+	# feasibility, then the optimality conditions on the residual graph (source S, donors, recipients, sink T):
+	# the flow is maximum if no recipient with residual demand is reachable from a donor with residual supply,
+	# and it is of minimum cost among the flows of the same value if the residual graph has no negative cycle
+	tol = 1e-6
+	n_don, n_rec = cost.shape
+	assert (x >= -tol).all() and (x[~np.isfinite(cost)] == 0).all()
+	res_supply = supply - x.sum(axis=1)
+	res_demand = demand - x.sum(axis=0)
+	assert (res_supply >= -tol).all() and (res_demand >= -tol).all()
+
+	forward = np.isfinite(cost)
+	backward = x > tol
+	reached_don = res_supply > tol
+	reached_rec = np.zeros(n_rec, dtype=bool)
+	while True:
+		new_rec = forward[reached_don].any(axis=0) & ~reached_rec
+		reached_rec |= new_rec
+		new_don = backward[:, reached_rec].any(axis=1) & ~reached_don
+		reached_don |= new_don
+		if not new_rec.any() and not new_don.any():
+			break
+	assert not (reached_rec & (res_demand > tol)).any(), 'the flow is not maximum'
+
+	# Bellman-Ford from a virtual node at distance 0 from all nodes: nodes 0..n_don-1 donors, then recipients, S, T
+	S, T = n_don + n_rec, n_don + n_rec + 1
+	arcs = [(i, n_don + j, cost[i, j]) for i, j in zip(*np.nonzero(forward))]
+	arcs += [(n_don + j, i, -cost[i, j]) for i, j in zip(*np.nonzero(backward))]
+	arcs += [(S, i, 0.0) for i in np.flatnonzero(res_supply > tol)] + [(i, S, 0.0) for i in np.flatnonzero(x.sum(axis=1) > tol)]
+	arcs += [(n_don + j, T, 0.0) for j in np.flatnonzero(res_demand > tol)] + [(T, n_don + j, 0.0) for j in np.flatnonzero(x.sum(axis=0) > tol)]
+	u, v, w = (np.array(a) for a in zip(*arcs)) if arcs else (np.zeros(0, int), np.zeros(0, int), np.zeros(0))
+	u, v = u.astype(int), v.astype(int)
+	dist = np.zeros(n_don + n_rec + 2)
+	for _ in range(len(dist)):
+		relaxed = dist[u] + w
+		new = dist.copy()
+		np.minimum.at(new, v, relaxed)
+		if (new >= dist - tol).all():
+			return
+		dist = new
+	raise AssertionError('the flow is not of minimum cost: the residual graph has a negative cycle')
+
+
+def total_cost(x, cost):
+	return float((x * np.where(np.isfinite(cost), cost, 0)).sum())
+
+
+for k in range(n_instances):
+	supply, demand, cost = random_instance(rng)
+	x, potentials = pp.transportation.solve_ssp(supply, demand, cost)
+	check_optimal(x, supply, demand, cost)
+
+	# warm start with the potentials of a previous instance on the same recipients (other supplies and demands)
+	_, previous = pp.transportation.solve_ssp(rng.integers(1, 50, len(supply)).astype(float),
+											rng.integers(1, 50, len(demand)).astype(float), cost)
+	x_warm, _ = pp.transportation.solve_ssp(supply, demand, cost, previous)
+	check_optimal(x_warm, supply, demand, cost)
+	assert np.isclose(x_warm.sum(), x.sum()) and np.isclose(total_cost(x_warm, cost), total_cost(x, cost)), \
+		f'instance {k}: the warm start changed the units shipped or the cost'
+
+	if pp.transportation.linprog is not None:
+		x_lp = pp.transportation.solve_linprog(supply, demand, cost)
+		assert np.isclose(x_lp.sum(), x.sum()) and np.isclose(total_cost(x_lp, cost), total_cost(x, cost), rtol=1e-6), \
+			f'instance {k}: solve_ssp and solve_linprog disagree'
+
+print(f'\n\n============================================\nsolve_ssp found the optimal shipments of {n_instances} instances, with and without warm start' +
+	  ('' if pp.transportation.linprog is None else ', as solve_linprog') + '\n============================================\n')
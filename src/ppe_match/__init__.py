@@ -1,8 +1,75 @@
-from . import testing_framework
-from . import strategies
-from .testing_framework import TestingFramework
+"""The submodules of the package, and the classes TestingFramework and DistanceMatrix, are imported
+at their first use (e.g., ppe_match.strategies or ppe_match.TestingFramework), so that importing
+the package does not import pandas and numpy.
+
+The log records of all the submodules are written by one handler of the logger of the package.
+"""
+
+import importlib
+import logging
 
 __all__ = [
     'testing_framework',
-    'strategies'
+    'strategies',
+    'engines',
+    'distances',
+    'transportation',
+    'sweep',
+    'cache',
+    'streaming',
+    'profiling',
+    'pruning',
+    'decomposition',
+    'checkpoint',
+    'output',
+    'memo',
+    'scenarios',
+    'coding',
+    'cli',
+    'spatial',
+    'synthetic'
 ]
+
+# classes exported by the package, and their modules
+_CLASSES = {
+    'TestingFramework': 'testing_framework',
+    'DistanceMatrix': 'distances',
+}
+
+# default level of the loggers of the submodules that report the progress of the runs; the other
+# submodules report only warnings. A level set before the package is imported is kept
+_LOG_LEVELS = {
+    'testing_framework': logging.INFO,
+    'engines': logging.INFO,
+    'sweep': logging.INFO,
+    'scenarios': logging.INFO,
+    'streaming': logging.INFO,
+}
+
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    stream_hdlr = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+    stream_hdlr.setFormatter(formatter)
+    logger.addHandler(stream_hdlr)
+if logger.level == logging.NOTSET:
+    logger.setLevel(logging.WARN)
+for _name, _level in _LOG_LEVELS.items():
+    if logging.getLogger(f'{__name__}.{_name}').level == logging.NOTSET:
+        logging.getLogger(f'{__name__}.{_name}').setLevel(_level)
+del _name, _level
+
+
+def __getattr__(name):
+    if name in __all__:
+        # import_module also sets the submodule as an attribute of the package
+        return importlib.import_module(f'.{name}', __name__)
+    if name in _CLASSES:
+        value = getattr(importlib.import_module(f'.{_CLASSES[name]}', __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_CLASSES))
@@ -0,0 +1,199 @@
+"""Module defining the binary cache of the input tables (donors, recipients, distance matrix).
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+The first time a csv file is read, it is converted into one .npy file for each column
+(ids and ppes as categorical codes, dates as int64 timestamps) in a directory of the
+cache. The next reads load the .npy files instead of parsing the csv file: the columns of
+strings are returned as categoricals, with the stored codes and categories, which the testing
+framework keeps (see the module coding). The columns of the tables and the distance matrix
+(stored as a DistanceMatrix) are memory-mapped read-only, so that all the processes that read
+them (e.g., the workers of a sweep) share the same pages.
+
+An entry of the cache is valid while its source file has the same size and modification
+time. If the modification time changed, the entry is still used if the SHA-256 hash of
+the source file did not change; otherwise the entry is rebuilt.
+"""
+
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from .distances import DistanceMatrix
+
+import logging
+logger = logging.getLogger(__name__)
+
+# increase when the format of the entries changes, to invalidate the existing entries
+CACHE_VERSION = 2
+
+
+def read_requests(path, cache_dir=None):
+	"""Read a table of requests, same as pd.read_csv(path, parse_dates=['date'], index_col=0). When the
+	table is loaded from the cache, its columns of strings are categoricals and its arrays are read-only
+
+	:param path: the csv file of the table
+	:type path: str
+	:param cache_dir: the directory of the cache, defaults to None (no cache)
+	:type cache_dir: str, optional
+	:rtype: pandas.DataFrame
+	"""
+	if cache_dir is None:
+		return pd.read_csv(path, parse_dates=['date'], index_col=0)
+	entry = _find_entry(path, cache_dir, 'requests')
+	if entry is not None:
+		return _load_frame(entry)
+	requests = pd.read_csv(path, parse_dates=['date'], index_col=0)
+	_write_entry(path, cache_dir, 'requests', lambda directory: _save_frame(requests, directory))
+	return requests
+
+
+def read_distance_matrix(path, cache_dir=None):
+	"""Read a distance matrix, same as DistanceMatrix.from_csv(path)
+
+	:param path: the csv file of the matrix (don_id,rec_id,distance)
+	:type path: str
+	:param cache_dir: the directory of the cache, defaults to None (no cache)
+	:type cache_dir: str, optional
+	:rtype: DistanceMatrix
+	"""
+	if cache_dir is None:
+		return DistanceMatrix.from_csv(path)
+	entry = _find_entry(path, cache_dir, 'distances')
+	if entry is not None:
+		return DistanceMatrix.load(entry)
+	distances = DistanceMatrix.from_csv(path)
+	entry = _write_entry(path, cache_dir, 'distances', distances.save)
+	# memory-map the saved matrix, so that this process shares its pages too
+	return DistanceMatrix.load(entry) if entry is not None else distances
+
+
+def clear(cache_dir):
+	"""Remove all the entries of the cache"""
+	if os.path.isdir(cache_dir):
+		shutil.rmtree(cache_dir)
+
+
+def _entry_path(path, cache_dir, kind):
+	# one entry for each source file, named after the file and its absolute path
+	source = os.path.abspath(path)
+	digest = hashlib.sha1(source.encode()).hexdigest()[:12]
+	return os.path.join(cache_dir, f'{os.path.basename(source)}.{kind}.{digest}')
+
+
+def _file_hash(path):
+	sha = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+
+def _find_entry(path, cache_dir, kind):
+	"""Directory of the valid entry of the source file, None if there is no valid entry"""
+	entry = _entry_path(path, cache_dir, kind)
+	try:
+		with open(os.path.join(entry, 'meta.json')) as f:
+			meta = json.load(f)
+	except (OSError, ValueError):
+		return None
+	stat = os.stat(path)
+	if meta.get('version') != CACHE_VERSION or meta.get('size') != stat.st_size:
+		return None
+	if meta.get('mtime_ns') != stat.st_mtime_ns:
+		if meta.get('sha256') != _file_hash(path):
+			logger.info(f'The cache of {path} is out of date')
+			return None
+		# the file was touched but not modified: keep the entry
+		meta['mtime_ns'] = stat.st_mtime_ns
+		_write_meta(entry, meta)
+	return entry
+
+
+def _write_meta(directory, meta):
+	with open(os.path.join(directory, 'meta.json'), 'w') as f:
+		json.dump(meta, f, indent=1)
+
+
+def _write_entry(path, cache_dir, kind, save):
+	"""Write the entry of the source file with save(directory). The entry is written in a
+	temporary directory and then renamed, so that readers never see a partial entry
+
+	:return: the directory of the entry, None if it could not be written
+	:rtype: str
+	"""
+	stat = os.stat(path)
+	meta = {'version': CACHE_VERSION, 'source': os.path.abspath(path), 'size': stat.st_size,
+			'mtime_ns': stat.st_mtime_ns, 'sha256': _file_hash(path)}
+	entry = _entry_path(path, cache_dir, kind)
+	try:
+		os.makedirs(cache_dir, exist_ok=True)
+		tmp = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+		try:
+			save(tmp)
+			_write_meta(tmp, meta)
+			if os.path.isdir(entry):
+				shutil.rmtree(entry)
+			os.rename(tmp, entry)
+		except BaseException:
+			shutil.rmtree(tmp, ignore_errors=True)
+			raise
+	except (OSError, ValueError, TypeError) as e:
+		logger.warning(f'Could not write the cache of {path}: {e}')
+		return None
+	return entry
+
+
+def _save_frame(df, directory):
+	"""Save a DataFrame as one .npy file for each column. Columns of strings are stored
+	as categorical codes and categories, datetime columns as int64 timestamps"""
+	columns = []
+	for k, (name, values) in enumerate([(df.index.name, df.index.to_series())] + list(df.items())):
+		dtype = values.dtype
+		if dtype == object:
+			if pd.api.types.infer_dtype(values, skipna=True) not in ['string', 'empty']:
+				raise TypeError(f'column {name} contains values that are not strings')
+			cat = pd.Categorical(values)
+			np.save(os.path.join(directory, f'{k}.codes.npy'), cat.codes)
+			np.save(os.path.join(directory, f'{k}.categories.npy'), np.asarray(cat.categories, dtype=str))
+			kind = 'category'
+		elif str(dtype).startswith('datetime64[ns'):
+			np.save(os.path.join(directory, f'{k}.npy'), values.values.view(np.int64))
+			kind = 'datetime'
+		elif dtype.kind in 'biuf':
+			np.save(os.path.join(directory, f'{k}.npy'), values.to_numpy())
+			kind = 'numeric'
+		else:
+			raise TypeError(f'column {name} has an unsupported type {dtype}')
+		columns.append({'name': name, 'kind': kind, 'dtype': str(dtype)})
+	with open(os.path.join(directory, 'columns.json'), 'w') as f:
+		json.dump(columns, f, indent=1)
+
+
+def _load_frame(directory, mmap_mode='r'):
+	"""Load a DataFrame saved with _save_frame. The columns of strings are categoricals (the index
+	is decoded), and the arrays are memory-mapped with the given mmap_mode of numpy.load"""
+	with open(os.path.join(directory, 'columns.json')) as f:
+		columns = json.load(f)
+	values = []
+	for k, column in enumerate(columns):
+		if column['kind'] == 'category':
+			codes = np.load(os.path.join(directory, f'{k}.codes.npy'), mmap_mode=mmap_mode)
+			categories = np.load(os.path.join(directory, f'{k}.categories.npy')).astype(object)
+			values.append(pd.Categorical.from_codes(codes, categories))
+		elif column['kind'] == 'datetime':
+			dates = pd.Series(np.load(os.path.join(directory, f'{k}.npy'), mmap_mode=mmap_mode).view('M8[ns]'))
+			tz = getattr(pd.api.types.pandas_dtype(column['dtype']), 'tz', None)
+			values.append((dates.dt.tz_localize('UTC').dt.tz_convert(tz) if tz is not None else dates).array)
+		else:
+			values.append(np.load(os.path.join(directory, f'{k}.npy'), mmap_mode=mmap_mode))
+	index = pd.Index(np.asarray(values[0], dtype=object) if columns[0]['kind'] == 'category' else values[0],
+					 name=columns[0]['name'])
+	# one column of each type, so the DataFrame keeps the arrays instead of copying them into blocks
+	return pd.DataFrame({column['name']: v for column, v in zip(columns[1:], values[1:])}, index=index, copy=False)
@@ -0,0 +1,115 @@
+"""Module defining the checkpoints of the simulation loop of the testing framework.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+A checkpoint is the state of a run between two periods: the next period (d1,d2) to solve,
+the pending requests (cur_donors and cur_recipients, with their remaining qty), the granular
+decisions made so far, and the strategy (with its state, e.g., the potentials of
+TransportationStrategy) and parameters of the run. TestingFramework.run writes a checkpoint
+every checkpoint_every periods, and TestingFramework.resume continues a run from a checkpoint,
+with the same strategy or with another one (e.g., to compare what-if strategy changes from a
+mid-horizon snapshot).
+
+A checkpoint is a single binary file: the state pickled with the highest protocol and
+compressed with gzip. It is written to a temporary file and renamed, so that a crash while
+writing never leaves a partial checkpoint.
+"""
+
+import gzip
+import os
+import pickle
+import tempfile
+
+import logging
+logger = logging.getLogger(__name__)
+
+# increase when the content of the checkpoints changes, to refuse the older checkpoints
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+	""" State of a run between two periods
+	"""
+	def __init__(self, d1, d2, period, cur_donors, cur_recipients, decisions,
+				strategy=None, interval=None, max_donation_qty=None, engine=None):
+		"""Initialize the checkpoint
+
+		:param d1: the start of the next period to solve
+		:type d1: pandas.Timestamp
+		:param d2: the end of the next period to solve
+		:type d2: pandas.Timestamp
+		:param period: the number of periods solved before the checkpoint
+		:type period: int
+		:param cur_donors: the pending donor requests (don_id,date,ppe,qty), with the index of the table D
+		:type cur_donors: pandas.DataFrame
+		:param cur_recipients: the pending recipient requests (rec_id,date,ppe,qty), with the index of the table R
+		:type cur_recipients: pandas.DataFrame
+		:param decisions: the granular decisions made before the checkpoint
+		:type decisions: pandas.DataFrame
+		:param strategy: the strategy of the run, None if it cannot be pickled, defaults to None
+		:type strategy: a function with 4 inputs: current date, D^t, R^t, M, optional
+		:param interval: the interval of the run, defaults to None
+		:type interval: int, optional
+		:param max_donation_qty: the max_donation_qty of the run, defaults to None
+		:type max_donation_qty: int, optional
+		:param engine: the engine of the run, defaults to None
+		:type engine: str, optional
+		"""
+		self.d1 = d1
+		self.d2 = d2
+		self.period = period
+		self.cur_donors = cur_donors
+		self.cur_recipients = cur_recipients
+		self.decisions = decisions
+		self.strategy = strategy
+		self.interval = interval
+		self.max_donation_qty = max_donation_qty
+		self.engine = engine
+
+	def __repr__(self):
+		return (f'Checkpoint(period {self.period}, next period from {self.d1} to {self.d2}, '
+				f'{len(self.cur_donors)} pending donor requests, {len(self.cur_recipients)} pending recipient requests, '
+				f'{len(self.decisions)} decisions)')
+
+	def save(self, path, compresslevel=1):
+		"""Write the checkpoint into a file, replacing it atomically
+
+		:param path: the file of the checkpoint
+		:type path: str
+		:param compresslevel: the gzip compression level, from 1 (fastest) to 9 (smallest), defaults to 1
+		:type compresslevel: int, optional
+		"""
+		state = dict(vars(self), version=CHECKPOINT_VERSION)
+		try:
+			pickle.dumps(self.strategy, protocol=pickle.HIGHEST_PROTOCOL)
+		except Exception as e:
+			logger.warning(f'The strategy cannot be saved in the checkpoint ({e}): resume needs a strategy')
+			state['strategy'] = None
+		directory = os.path.dirname(os.path.abspath(path))
+		os.makedirs(directory, exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+		try:
+			with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=compresslevel) as f:
+				pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+			os.replace(tmp, path)
+		except BaseException:
+			if os.path.exists(tmp):
+				os.remove(tmp)
+			raise
+
+	@classmethod
+	def load(cls, path):
+		"""Read a checkpoint written with save
+
+		:param path: the file of the checkpoint
+		:type path: str
+		:rtype: Checkpoint
+		"""
+		with gzip.open(path, 'rb') as f:
+			state = pickle.load(f)
+		version = state.pop('version', None)
+		if version != CHECKPOINT_VERSION:
+			raise ValueError(f'The checkpoint {path} has version {version}, this version of ppe_match reads version {CHECKPOINT_VERSION}')
+		return cls(**state)
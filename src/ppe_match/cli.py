@@ -0,0 +1,198 @@
+"""Module defining the command line interface of the package (python -m ppe_match).
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+The command runs one or more strategies, for one or more intervals and values of
+max_donation_qty, on the tables D, R, and M given as files, and writes a table comparing the
+metrics of the runs (one row for each run, one column for each metric) as csv or json. The
+runs are executed in parallel by the module sweep (--jobs). For example:
+
+	python -m ppe_match --donors D.csv --recipients R.csv --distances M.csv \\
+		--strategies FCFM_strategy,fast_proximity_match_strategy,mypackage.mymodule.my_strategy \\
+		--intervals 1,7 --jobs 4 --output metrics.csv
+
+The strategies are the functions and classes of the module strategies, given by name, or user
+strategies, given by their dotted path (module.function, or module:function); classes are
+instantiated without arguments. With --profile, the wall time of each phase of each run (see
+the module profiling) is written too.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+# the modules of the package (and pandas) are imported when they are needed, so that --help and
+# the errors in the arguments do not wait for them
+OUTPUT_FORMATS = ['csv', 'json']
+
+
+def resolve_strategy(name):
+	"""The strategy with the given name
+
+	:param name: the name of a function or class of the module strategies (e.g., FCFM_strategy), or the dotted path of a user strategy (e.g., mypackage.mymodule.my_strategy or mypackage.mymodule:my_strategy)
+	:type name: str
+	:return: the strategy; classes are instantiated without arguments
+	:rtype: a function with 4 inputs: current date, D^t, R^t, M
+	"""
+	if ':' in name:
+		module_name, attribute = name.split(':', 1)
+	elif '.' in name:
+		module_name, attribute = name.rsplit('.', 1)
+	else:
+		module_name, attribute = None, name
+	if module_name is None:
+		from . import strategies
+		strategy = strategies
+	else:
+		try:
+			strategy = importlib.import_module(module_name)
+		except ImportError as e:
+			raise ValueError(f'Cannot import the module {module_name} of the strategy {name}: {e}') from e
+	for part in attribute.split('.'):
+		if not hasattr(strategy, part):
+			raise ValueError(f'Unknown strategy {name}')
+		strategy = getattr(strategy, part)
+	if isinstance(strategy, type):
+		strategy = strategy()
+	if not callable(strategy):
+		raise ValueError(f'The strategy {name} is not callable')
+	return strategy
+
+
+def comparison_table(metrics):
+	"""Table comparing the metrics of the runs of a sweep
+
+	:param metrics: the metrics of the runs (strategy,interval,max_donation_qty,metric_name,description,value), as returned by sweep.run_sweep
+	:type metrics: pandas.DataFrame
+	:return: one row for each run (strategy,interval,max_donation_qty), in the order of the sweep, and one column for each metric, in the order of get_metrics
+	:rtype: pandas.DataFrame
+	"""
+	from .sweep import CONFIGURATION_COLUMNS
+	configurations = metrics[CONFIGURATION_COLUMNS].drop_duplicates()
+	table = metrics.set_index(CONFIGURATION_COLUMNS + ['metric_name'])['value'].unstack('metric_name')
+	table = table.reindex(index=configurations.set_index(CONFIGURATION_COLUMNS).index,
+						columns=metrics['metric_name'].unique())
+	table.columns.name = None
+	return table.reset_index()
+
+
+def phase_table(timings):
+	"""Table of the total wall time of each phase of the runs of a sweep
+
+	:param timings: the timings of the runs (strategy,interval,max_donation_qty,date,phase,seconds,allocated_bytes), as returned by sweep.run_sweep
+	:type timings: pandas.DataFrame
+	:return: one row for each phase of each run (strategy,interval,max_donation_qty,phase,seconds,share), with the share of the phase in the wall time of the run
+	:rtype: pandas.DataFrame
+	"""
+	from .sweep import CONFIGURATION_COLUMNS
+	table = timings.groupby(CONFIGURATION_COLUMNS + ['phase'], sort=False)['seconds'].sum().reset_index()
+	table['share'] = table['seconds'] / table.groupby(CONFIGURATION_COLUMNS, sort=False)['seconds'].transform('sum')
+	return table
+
+
+def build_parser():
+	"""The parser of the arguments of the command
+
+	:rtype: argparse.ArgumentParser
+	"""
+	parser = argparse.ArgumentParser(prog='python -m ppe_match',
+									description='Run PPE matching strategies on the tables D, R, and M, and compare their metrics')
+	parser.add_argument('--donors', default=None, help='csv file of the donor requests D (default: the data set of the package)')
+	parser.add_argument('--recipients', default=None, help='csv file of the recipient requests R (default: the data set of the package)')
+	parser.add_argument('--distances', default=None, help='csv file of the distance matrix M (default: the data set of the package)')
+	parser.add_argument('--strategies', default='proximity_match_strategy',
+						help='comma-separated list of strategies: names of the module strategies, or dotted paths of user strategies')
+	parser.add_argument('--intervals', default='7', help='comma-separated list of intervals, in days')
+	parser.add_argument('--max-donation-qty', default='1000', help='comma-separated list of values of max_donation_qty')
+	parser.add_argument('--engine', default='array', choices=['array', 'pandas'],
+						help='simulation engine; both make the same decisions (default: array)')
+	parser.add_argument('--jobs', type=int, default=1, help='number of runs executed in parallel worker processes')
+	parser.add_argument('--all-metrics', action='store_true',
+						help='compare the metrics of each recipient and ppe too, not only the five overall metrics')
+	parser.add_argument('--cache-dir', default=None, help='directory of the parsed copies of the csv files (see the module cache)')
+	parser.add_argument('--output', default='-', help='file of the metrics comparison table (default: standard output)')
+	parser.add_argument('--format', default='csv', choices=OUTPUT_FORMATS, help='format of the tables (default: csv)')
+	parser.add_argument('--profile', action='store_true',
+						help='record the wall time of each phase of each run, and write the total of each phase')
+	parser.add_argument('--profile-output', default=None,
+						help='file of the table of the phases with --profile (default: standard error, as text)')
+	parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+						help='level of the log messages of the package (default: WARNING)')
+	return parser
+
+
+def main(argv=None):
+	"""Run the command
+
+	:param argv: the arguments, defaults to sys.argv[1:]
+	:type argv: list of str, optional
+	:return: the exit status
+	:rtype: int
+	"""
+	parser = build_parser()
+	args = parser.parse_args(argv)
+	if args.jobs < 1:
+		parser.error('--jobs must be at least 1')
+	_set_log_level(args.log_level)
+	from . import sweep
+	from .testing_framework import TestingFramework
+	try:
+		strategy_list = [resolve_strategy(name) for name in _split(args.strategies)]
+		intervals = [int(value) for value in _split(args.intervals)]
+		max_donation_qtys = [int(value) for value in _split(args.max_donation_qty)]
+	except ValueError as e:
+		parser.error(str(e))
+	names = [sweep._strategy_name(strategy) for strategy in strategy_list]
+	if len(set(names)) < len(names):
+		parser.error(f'The strategies must have different names: {names}')
+
+	# the paths are relative to the current directory, not to the package (see TestingFramework)
+	paths = {parameter: os.path.abspath(path) for parameter, path in
+			[('donor_path', args.donors), ('recipient_path', args.recipients), ('distance_matrix_path', args.distances)]
+			if path is not None}
+	framework = TestingFramework(**paths, engine=args.engine, cache_dir=args.cache_dir,
+								overall_metrics_only=not args.all_metrics, profile=args.profile)
+	grid = sweep.parameter_grid(strategy_list, intervals, max_donation_qtys)
+	if args.profile:
+		metrics, timings = sweep.run_sweep(framework, grid, max_workers=args.jobs, return_timings=True)
+	else:
+		metrics = sweep.run_sweep(framework, grid, max_workers=args.jobs)
+
+	_write_table(comparison_table(metrics), args.output, args.format)
+	if args.profile:
+		phases = phase_table(timings)
+		if args.profile_output is None:
+			sys.stderr.write(phases.to_string(index=False, float_format=lambda x: f'{x:.3f}') + '\n')
+		else:
+			_write_table(phases, args.profile_output, args.format)
+	return 0
+
+
+def _split(values):
+	return [value.strip() for value in values.split(',') if value.strip()]
+
+
+def _set_log_level(level):
+	# the package sets the level of the loggers of some modules (see __init__); the others inherit the level of the package
+	for name in list(logging.root.manager.loggerDict):
+		if name == __package__ or name.startswith(f'{__package__}.'):
+			logging.getLogger(name).setLevel(level)
+
+
+def _write_table(table, path, output_format):
+	if output_format == 'json':
+		text = table.to_json(orient='records', date_format='iso')
+	else:
+		text = table.to_csv(index=False)
+	if path == '-':
+		sys.stdout.write(text if text.endswith('\n') else text + '\n')
+	else:
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		with open(path, 'w', newline='') as f:
+			f.write(text)
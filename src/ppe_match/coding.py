@@ -0,0 +1,105 @@
+"""Module defining the categorical coding of the ids and ppes of the testing framework.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+The testing framework interns the columns don_id, rec_id, and ppe of the tables D and R once,
+when they are loaded, into pandas categoricals: one integer code for each row, and one
+dictionary of the strings (the categories) shared by all the tables derived from D and R during
+a run (the pending requests, D^t, R^t, the compatible pairs, and the decisions). The donors and
+the recipients share the dictionary of the ppes. Joins and group-bys on these columns then
+compare integer codes instead of hashing strings, and each table stores 1-4 bytes for each id.
+
+The categories are sorted, so sorting by a coded column gives the order of the strings. The
+group-bys on coded columns must pass observed=True, otherwise pandas adds a group for each
+combination of categories. The strings are decoded at the boundary of the framework: by
+get_decisions, and in the tables passed to the strategy, unless the strategy is marked as
+categorical-aware (see categorical_aware) and can work on the codes. The dates are already
+compact: datetime64 columns are int64 timestamps.
+"""
+
+import pandas as pd
+import numpy as np
+
+CODED_COLUMNS = ['don_id', 'rec_id', 'ppe']
+
+
+def categorical_aware(strategy):
+	"""Mark a strategy as categorical-aware, e.g., as a decorator: the strategy receives the tables
+	D^t, R^t, and M with the coded columns, instead of decoded copies. Its group-bys on these columns
+	must pass observed=True
+
+	:param strategy: a function (date,Dt,Rt,M), or an object with a method __call__
+	:return: the same strategy
+	"""
+	strategy.categorical_aware = True
+	return strategy
+
+
+def is_categorical_aware(strategy):
+	"""Whether the strategy was marked as categorical-aware"""
+	return getattr(strategy, 'categorical_aware', False)
+
+
+def categories(values):
+	"""The categories of a coded column, or the sorted unique values of a column of strings
+
+	:param values: the column
+	:type values: pandas.Series
+	:rtype: list
+	"""
+	if isinstance(values.dtype, pd.CategoricalDtype):
+		return list(values.cat.categories)
+	return sorted(values.dropna().unique())
+
+
+def encode_requests(all_donors, all_recipients):
+	"""Code the ids and the ppes of the tables D and R, with one dictionary of the ppes for both tables
+
+	:param all_donors: the table D of donor requests (don_id,date,ppe,qty)
+	:type all_donors: pandas.DataFrame
+	:param all_recipients: the table R of recipient requests (rec_id,date,ppe,qty)
+	:type all_recipients: pandas.DataFrame
+	:return: the tables D and R with the columns don_id, rec_id, and ppe coded
+	:rtype: tuple of pandas.DataFrame
+	"""
+	ppe_dtype = pd.CategoricalDtype(sorted(set(categories(all_donors.ppe)).union(categories(all_recipients.ppe))))
+	return _with_columns(all_donors, don_id=all_donors.don_id.astype('category'), ppe=all_donors.ppe.astype(ppe_dtype)), \
+		_with_columns(all_recipients, rec_id=all_recipients.rec_id.astype('category'), ppe=all_recipients.ppe.astype(ppe_dtype))
+
+
+def _with_columns(frame, **columns):
+	# same as frame.assign(**columns), without copying the other columns (e.g., memory-mapped by the module cache)
+	return pd.DataFrame({name: columns.get(name, frame[name]) for name in frame.columns}, index=frame.index, copy=False)
+
+
+def decode(frame):
+	"""The table with the coded columns decoded into strings (object columns)
+
+	:param frame: the table
+	:type frame: pandas.DataFrame
+	:return: the table itself if it has no coded column, otherwise a decoded copy
+	:rtype: pandas.DataFrame
+	"""
+	coded = {column: object for column in CODED_COLUMNS
+			if column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)}
+	return frame.astype(coded) if coded else frame
+
+
+def get_indexer(index, values):
+	"""Position in index of each value, -1 for the values that are not in index. For coded values,
+	only the categories are looked up in index
+
+	:param index: the index of the ids
+	:type index: pandas.Index
+	:param values: the ids to look up, strings or coded
+	:type values: pandas.Series or array-like
+	:rtype: numpy.ndarray
+	"""
+	if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+		cat = values.array if isinstance(values, pd.Series) else values
+		# the code -1 (missing value) takes the last position, -1
+		positions = np.append(index.get_indexer(cat.categories), -1)
+		return positions[cat.codes]
+	return index.get_indexer(values)
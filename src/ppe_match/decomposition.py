@@ -0,0 +1,114 @@
+"""Module defining the decomposition of the matching problem of a period by ppe.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+The units of a ppe can only fill the requests of the same ppe, so many strategies solve one
+independent subproblem for each ppe. A strategy marked as ppe-separable (see ppe_separable)
+promises that its decisions on (D^t,R^t,M) are the union of its decisions on the subproblems
+(D^t_p,R^t_p,M_p) of the ppes p, where D^t_p and R^t_p are the requests of p and M_p the
+distances of the pairs that share p. The testing framework can then split each period by ppe
+and solve the subproblems in parallel, in a pool of threads or processes (parameter ppe_jobs).
+
+Threads share the strategy, so a stateful strategy (e.g., TransportationStrategy, which keeps
+the potentials of each ppe) keeps its state between periods, but pure-Python strategies gain
+little because of the GIL. Processes run the subproblems truly in parallel, but receive a copy
+of the strategy, so its state is not kept between periods: the testing framework logs a warning
+when a strategy marked as stateful (see is_stateful) is run with ppe_executor='process'.
+"""
+
+import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import logging
+logger = logging.getLogger(__name__)
+
+EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+
+def ppe_separable(strategy):
+	"""Mark a strategy as ppe-separable, e.g., as a decorator
+
+	:param strategy: a function (date,Dt,Rt,M), or an object with a method __call__
+	:return: the same strategy
+	"""
+	strategy.ppe_separable = True
+	return strategy
+
+
+def is_ppe_separable(strategy):
+	"""Whether the strategy was marked as ppe-separable"""
+	return getattr(strategy, 'ppe_separable', False)
+
+
+def is_stateful(strategy):
+	"""Whether the strategy keeps a state between periods (attribute stateful), which is lost
+	when the subproblems are solved in a pool of processes"""
+	return getattr(strategy, 'stateful', False)
+
+
+def pairs_by_ppe(cur_distance_mat, agg_cur_donors, agg_cur_recipients):
+	"""The pairs (don_id,rec_id,distance,pos,ppe), one for each ppe shared by the donor and the
+	recipient of the pair at position pos of cur_distance_mat
+
+	:rtype: pandas.DataFrame
+	"""
+	pairs = cur_distance_mat[['don_id', 'rec_id', 'distance']].assign(pos=np.arange(len(cur_distance_mat)))
+	pairs = pairs.merge(agg_cur_donors[['don_id', 'ppe']], on='don_id')
+	return pairs.merge(agg_cur_recipients[['rec_id', 'ppe']], on=['rec_id', 'ppe'])
+
+
+def split_by_ppe(agg_cur_donors, agg_cur_recipients, cur_distance_mat):
+	"""Split the matching problem of a period into one subproblem for each ppe requested by donors and recipients
+
+	:param agg_cur_donors: the table D^t (don_id,ppe,date,qty)
+	:type agg_cur_donors: pandas.DataFrame
+	:param agg_cur_recipients: the table R^t (rec_id,ppe,date,qty)
+	:type agg_cur_recipients: pandas.DataFrame
+	:param cur_distance_mat: the distance matrix of the period (don_id,rec_id,distance)
+	:type cur_distance_mat: pandas.DataFrame
+	:return: the subproblems (ppe,D^t_p,R^t_p,M_p), sorted by ppe; the rows of each table are in the original order
+	:rtype: list of tuples
+	"""
+	ppes = sorted(set(agg_cur_donors.ppe.unique()).intersection(agg_cur_recipients.ppe.unique()))
+	pairs = pairs_by_ppe(cur_distance_mat, agg_cur_donors, agg_cur_recipients)
+	positions = pairs.groupby('ppe', observed=True).pos.apply(np.sort)
+	subproblems = []
+	for ppe in ppes:
+		pos = positions.get(ppe, np.empty(0, dtype=np.int64))
+		subproblems.append((ppe,
+							agg_cur_donors[agg_cur_donors.ppe == ppe],
+							agg_cur_recipients[agg_cur_recipients.ppe == ppe],
+							cur_distance_mat.iloc[pos].reset_index(drop=True)))
+	return subproblems
+
+
+def solve_by_ppe(strategy, date, agg_cur_donors, agg_cur_recipients, cur_distance_mat, executor=None):
+	"""Solve the matching problem of a period with a ppe-separable strategy, one ppe at a time
+
+	:param strategy: the ppe-separable strategy
+	:type strategy: a function with 4 inputs: current date, D^t, R^t, M
+	:param date: the current date
+	:type date: pandas.Timestamp
+	:param agg_cur_donors: the table D^t (don_id,ppe,date,qty)
+	:type agg_cur_donors: pandas.DataFrame
+	:param agg_cur_recipients: the table R^t (rec_id,ppe,date,qty)
+	:type agg_cur_recipients: pandas.DataFrame
+	:param cur_distance_mat: the distance matrix of the period (don_id,rec_id,distance)
+	:type cur_distance_mat: pandas.DataFrame
+	:param executor: the pool that solves the subproblems, defaults to None (one after the other)
+	:type executor: concurrent.futures.Executor, optional
+	:return: the decisions of all the subproblems, in the order of the ppes
+	:rtype: pandas.DataFrame (don_id,rec_id,ppe,qty)
+	"""
+	subproblems = split_by_ppe(agg_cur_donors, agg_cur_recipients, cur_distance_mat)
+	if len(subproblems) <= 1:
+		return strategy(date, agg_cur_donors, agg_cur_recipients, cur_distance_mat)
+	if executor is None:
+		results = [strategy(date, Dt, Rt, M) for _, Dt, Rt, M in subproblems]
+	else:
+		futures = [executor.submit(strategy, date, Dt, Rt, M) for _, Dt, Rt, M in subproblems]
+		results = [future.result() for future in futures]
+	return pd.concat(results, ignore_index=True)
@@ -0,0 +1,227 @@
+"""Module defining the distance matrix M between donors and recipients.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+
+from . import coding
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DistanceProvider:
+	""" Base class of the objects that give the distance between donors and recipients, such as
+	DistanceMatrix and spatial.GeoDistances. Subclasses define the Index of the donors and of the
+	recipients (donors, recipients) and the distance of a batch of pairs of codes (lookup)
+	"""
+	def donor_codes(self, don_ids):
+		"""Integer codes of the given donors, -1 for unknown donors"""
+		return coding.get_indexer(self.donors, don_ids)
+
+	def recipient_codes(self, rec_ids):
+		"""Integer codes of the given recipients, -1 for unknown recipients"""
+		return coding.get_indexer(self.recipients, rec_ids)
+
+	def lookup(self, don_codes, rec_codes):
+		"""Distances of the pairs (don_codes[i],rec_codes[i]), NaN for missing pairs"""
+		raise NotImplementedError
+
+	def get(self, don_id, rec_id):
+		"""Distance between a donor and a recipient, NaN if the pair is missing"""
+		i = self.donors.get_indexer([don_id])
+		j = self.recipients.get_indexer([rec_id])
+		return self.lookup(i, j)[0]
+
+	def pairs_frame(self, don_rec):
+		"""DataFrame (don_id,rec_id,distance) of the given pairs that have a distance, in the same order
+
+		:param don_rec: the pairs (don_id,rec_id)
+		:type don_rec: pandas.DataFrame
+		:rtype: pandas.DataFrame
+		"""
+		distance = self.lookup(self.donor_codes(don_rec['don_id']), self.recipient_codes(don_rec['rec_id']))
+		known = ~np.isnan(distance)
+		return pd.DataFrame({
+			'don_id': don_rec['don_id'].values[known],
+			'rec_id': don_rec['rec_id'].values[known],
+			'distance': distance[known],
+		})
+
+
+class DistanceMatrix(DistanceProvider):
+	""" Distance matrix M indexed by integer donor and recipient codes. The distances
+	are kept in a dense matrix (don x rec), or in a sparse CSR matrix when most
+	(don,rec) pairs are missing. Missing pairs have distance NaN.
+
+	The distances are returned as float64 whatever the type in which they are stored. With
+	dtype=np.float32 the matrix takes half the memory, but float32 keeps only about 7
+	significant digits: distances of the csv file that differ in the 4th decimal become equal
+	above 1024 miles, which can change the decisions of the strategies that sort by distance
+	"""
+	def __init__(self, don_ids, rec_ids, distances, dtype=np.float64, max_sparsity=0.5):
+		"""Build the matrix from the long format (don_id,rec_id,distance)
+
+		:param don_ids: the donor of each pair
+		:type don_ids: array-like of str
+		:param rec_ids: the recipient of each pair
+		:type rec_ids: array-like of str
+		:param distances: the distance of each pair
+		:type distances: array-like of float
+		:param dtype: the type of the stored distances, defaults to np.float64
+		:type dtype: numpy dtype, optional
+		:param max_sparsity: largest fraction of missing pairs for which the dense matrix is used, defaults to 0.5
+		:type max_sparsity: float, optional
+		"""
+		dons = pd.Categorical(don_ids)
+		recs = pd.Categorical(rec_ids)
+		self.donors = pd.Index(dons.categories)
+		self.recipients = pd.Index(recs.categories)
+		self.dtype = np.dtype(dtype)
+		rows = dons.codes.astype(np.int64)
+		cols = recs.codes.astype(np.int64)
+		values = np.asarray(distances, dtype=self.dtype)
+
+		n_cells = len(self.donors) * len(self.recipients)
+		self.sparse = n_cells > 0 and 1 - len(values) / n_cells > max_sparsity
+		if self.sparse:
+			# CSR: the pairs sorted by (row,col), with indptr[i]:indptr[i+1] the pairs of donor i
+			flat = rows * len(self.recipients) + cols
+			order = np.argsort(flat, kind='stable')
+			flat, keep = np.unique(flat[order], return_index=True)
+			# when a pair is repeated, keep its last distance
+			last = np.r_[keep[1:] - 1, len(order) - 1]
+			self._flat = flat
+			self.indices = flat % len(self.recipients)
+			self.data = values[order][last]
+			self.indptr = np.searchsorted(flat // len(self.recipients), np.arange(len(self.donors) + 1))
+			self._matrix = None
+		else:
+			self._matrix = np.full((len(self.donors), len(self.recipients)), np.nan, dtype=self.dtype)
+			self._matrix[rows, cols] = values
+
+	@classmethod
+	def from_frame(cls, distance_mat, **kwargs):
+		"""Build the matrix from a DataFrame (don_id,rec_id,distance)"""
+		return cls(distance_mat['don_id'].values, distance_mat['rec_id'].values, distance_mat['distance'].values, **kwargs)
+
+	@classmethod
+	def from_csv(cls, path, **kwargs):
+		"""Build the matrix from a csv file with columns (don_id,rec_id,distance)"""
+		distance_mat = pd.read_csv(path, usecols=['don_id', 'rec_id', 'distance'])
+		return cls.from_frame(distance_mat, **kwargs)
+
+	def save(self, directory):
+		"""Save the matrix as .npy files in the given (existing) directory, see load"""
+		np.save(os.path.join(directory, 'donors.npy'), self.donors.values.astype(str))
+		np.save(os.path.join(directory, 'recipients.npy'), self.recipients.values.astype(str))
+		if self.sparse:
+			for name in ['_flat', 'indices', 'data', 'indptr']:
+				np.save(os.path.join(directory, f'{name.lstrip("_")}.npy'), getattr(self, name))
+		else:
+			np.save(os.path.join(directory, 'matrix.npy'), self._matrix)
+
+	@classmethod
+	def load(cls, directory, mmap_mode='r'):
+		"""Load a matrix saved with save. With mmap_mode='r' the distances are memory-mapped
+		read-only, so that the processes that load the same files share their pages
+
+		:param directory: the directory of the .npy files
+		:type directory: str
+		:param mmap_mode: the mmap_mode of numpy.load, defaults to 'r'
+		:type mmap_mode: str or None, optional
+		:rtype: DistanceMatrix
+		"""
+		self = cls.__new__(cls)
+		self.donors = pd.Index(np.load(os.path.join(directory, 'donors.npy')).astype(object))
+		self.recipients = pd.Index(np.load(os.path.join(directory, 'recipients.npy')).astype(object))
+		self.sparse = not os.path.exists(os.path.join(directory, 'matrix.npy'))
+		if self.sparse:
+			for name in ['_flat', 'indices', 'data', 'indptr']:
+				setattr(self, name, np.load(os.path.join(directory, f'{name.lstrip("_")}.npy'), mmap_mode=mmap_mode))
+			self._matrix = None
+		else:
+			self._matrix = np.load(os.path.join(directory, 'matrix.npy'), mmap_mode=mmap_mode)
+		self.dtype = (self.data if self.sparse else self._matrix).dtype
+		return self
+
+	def __len__(self):
+		"""Number of (don,rec) pairs with a distance"""
+		return len(self.data) if self.sparse else int(np.count_nonzero(~np.isnan(self._matrix)))
+
+	def __repr__(self):
+		kind = 'sparse' if self.sparse else 'dense'
+		return f'DistanceMatrix({len(self.donors)} donors x {len(self.recipients)} recipients, {kind}, {self.nbytes / 2**20:.1f} MB)'
+
+	@property
+	def nbytes(self):
+		if self.sparse:
+			return self._flat.nbytes + self.indices.nbytes + self.data.nbytes + self.indptr.nbytes
+		return self._matrix.nbytes
+
+	def lookup(self, don_codes, rec_codes):
+		"""Distances of the pairs (don_codes[i],rec_codes[i]), NaN for missing pairs
+
+		:param don_codes: donor codes, as returned by donor_codes
+		:type don_codes: numpy.ndarray of int
+		:param rec_codes: recipient codes, as returned by recipient_codes
+		:type rec_codes: numpy.ndarray of int
+		:return: the distance of each pair
+		:rtype: numpy.ndarray of float64
+		"""
+		don_codes = np.asarray(don_codes, dtype=np.int64)
+		rec_codes = np.asarray(rec_codes, dtype=np.int64)
+		result = np.full(len(don_codes), np.nan, dtype=np.float64)
+		known = (don_codes >= 0) & (rec_codes >= 0)
+		if self.sparse:
+			flat = don_codes[known] * len(self.recipients) + rec_codes[known]
+			pos = np.minimum(np.searchsorted(self._flat, flat), max(len(self._flat) - 1, 0))
+			found = self._flat[pos] == flat if len(self._flat) > 0 else np.zeros(len(flat), dtype=bool)
+			values = np.full(len(flat), np.nan, dtype=np.float64)
+			values[found] = self.data[pos[found]]
+			result[known] = values
+		else:
+			result[known] = self._matrix[don_codes[known], rec_codes[known]]
+		return result
+
+	def row(self, don_code):
+		"""Recipients with a distance from the donor don_code and their distances
+
+		:return: the recipient codes and the distances
+		:rtype: tuple of numpy.ndarray
+		"""
+		if self.sparse:
+			lo, hi = self.indptr[don_code], self.indptr[don_code + 1]
+			return self.indices[lo:hi], self.data[lo:hi].astype(np.float64)
+		values = self._matrix[don_code]
+		cols = np.flatnonzero(~np.isnan(values))
+		return cols, values[cols].astype(np.float64)
+
+	def submatrix(self, don_codes, rec_codes):
+		"""Dense matrix of the distances between the given donors (rows) and recipients (columns)"""
+		don_codes = np.asarray(don_codes, dtype=np.int64)
+		rec_codes = np.asarray(rec_codes, dtype=np.int64)
+		if not self.sparse and (don_codes >= 0).all() and (rec_codes >= 0).all():
+			return self._matrix[np.ix_(don_codes, rec_codes)].astype(np.float64)
+		rows = np.repeat(don_codes, len(rec_codes))
+		cols = np.tile(rec_codes, len(don_codes))
+		return self.lookup(rows, cols).reshape(len(don_codes), len(rec_codes))
+
+	def to_frame(self):
+		"""DataFrame view (don_id,rec_id,distance) of all the pairs with a distance"""
+		if self.sparse:
+			rows = np.repeat(np.arange(len(self.donors)), np.diff(self.indptr))
+			cols, values = self.indices, self.data
+		else:
+			rows, cols = np.nonzero(~np.isnan(self._matrix))
+			values = self._matrix[rows, cols]
+		return pd.DataFrame({
+			'don_id': self.donors.values[rows],
+			'rec_id': self.recipients.values[cols],
+			'distance': values.astype(np.float64),
+		})
@@ -0,0 +1,569 @@
+"""Module defining the simulation engines used by the testing framework to keep
+track of the pending donor and recipient requests.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+An engine owns the pending requests (cur_donors and cur_recipients) of a run. At
+every period the testing framework asks the engine to
+(1) add the requests received in the time window (d1,d2),
+(2) aggregate the pending requests by (id,ppe) to build D^t and R^t,
+(3) list the compatible donor-recipient pairs and their distances, and
+(4) turn the aggregated decisions of the strategy into granular decisions,
+    shipping the units of the oldest requests first.
+"""
+
+import pandas as pd
+import numpy as np
+
+from . import coding
+
+import logging
+logger = logging.getLogger(__name__)
+
+GRANULAR_COLUMNS = ['don_id', 'rec_id', 'ppe', 'date', 'qty', 'holding_time']
+
+
+class PandasEngine:
+	""" Engine that keeps the pending requests in pandas DataFrames. This is the
+	reference implementation of the simulation
+	"""
+	def __init__(self, all_donors, all_recipients):
+		"""Initialize the engine with no pending requests
+
+		:param all_donors: the table D of donor requests (don_id,date,ppe,qty)
+		:type all_donors: pandas.DataFrame
+		:param all_recipients: the table R of recipient requests (rec_id,date,ppe,qty)
+		:type all_recipients: pandas.DataFrame
+		"""
+		self.all_donors = all_donors
+		self.all_recipients = all_recipients
+		self.cur_donors = all_donors.drop(index=all_donors.index)
+		self.cur_recipients = all_recipients.drop(index=all_recipients.index)
+
+	def pending(self):
+		"""The pending requests, with their remaining qty and the index of the tables D and R
+
+		:return: the pending donor requests (don_id,date,ppe,qty) and recipient requests (rec_id,date,ppe,qty), in the order of arrival
+		:rtype: tuple of pandas.DataFrame
+		"""
+		return self.cur_donors.copy(), self.cur_recipients.copy()
+
+	def restore(self, cur_donors, cur_recipients):
+		"""Replace the pending requests, e.g., with those of a checkpoint (see pending)"""
+		self.cur_donors = cur_donors.copy()
+		self.cur_recipients = cur_recipients.copy()
+
+	def add_requests(self, d1, d2):
+		"""Add the requests received strictly between d1 and d2 to the pending requests"""
+		self.cur_recipients = pd.concat([
+									self.cur_recipients,
+									self.all_recipients.loc[(self.all_recipients.date > d1) & (self.all_recipients.date < d2)].copy()
+									])
+		self.cur_donors = pd.concat([
+								self.cur_donors,
+								self.all_donors.loc[(self.all_donors.date > d1) & (self.all_donors.date < d2)].copy()
+								])
+
+	def aggregate(self):
+		"""Aggregate the pending requests by (id,ppe)
+
+		:return: the tables D^t (don_id,ppe,date,qty) and R^t (rec_id,ppe,date,qty)
+		:rtype: tuple of pandas.DataFrame
+		"""
+		'''
+		cur_donors and cur_recipients could have multiple rows for each donor
+		(or recipient) for the same ppe. We need to create new dataframes with
+		one row for each donor_id (or recipient_id) and ppe.
+		'''
+		# with observed=True, pandas does not sort the groups: sort_index sorts them by code, i.e., by id and ppe
+		agg_cur_donors = self.cur_donors.groupby(['don_id', 'ppe'], observed=True)\
+							.agg({'date': 'min', 'qty': 'sum'})\
+							.sort_index().reset_index()
+		agg_cur_recipients = self.cur_recipients.groupby(['rec_id', 'ppe'], observed=True)\
+							.agg({'date': 'min', 'qty': 'sum'})\
+							.sort_index().reset_index()
+		return agg_cur_donors, agg_cur_recipients
+
+	def compatible_pairs(self, agg_cur_donors, agg_cur_recipients):
+		"""List the (don_id,rec_id) pairs that share at least one ppe, sorted by don_id and rec_id"""
+		don_rec = pd.DataFrame(agg_cur_donors.merge(agg_cur_recipients, on=['ppe'])\
+								.groupby(['don_id', 'rec_id'], observed=True).groups.keys())
+		if len(don_rec) > 0:
+			don_rec.columns = ['don_id', 'rec_id']
+			# keep the codes of the ids (see the module coding)
+			don_rec = don_rec.astype({'don_id': agg_cur_donors.don_id.dtype, 'rec_id': agg_cur_recipients.rec_id.dtype})\
+							.sort_values(['don_id', 'rec_id'], ignore_index=True)
+		return don_rec
+
+	def pair_distances(self, don_rec, distances):
+		"""Distance matrix of the current period: the pairs of don_rec that have a distance in M
+
+		:param don_rec: the compatible pairs, as returned by compatible_pairs
+		:type don_rec: pandas.DataFrame
+		:param distances: the distance matrix M, or another distance provider
+		:type distances: distances.DistanceProvider
+		:return: the distance matrix of the current period (don_id,rec_id,distance)
+		:rtype: pandas.DataFrame
+		"""
+		return distances.pairs_frame(don_rec)
+
+	def ship(self, agg_decisions):
+		"""Turn the aggregated decisions into granular decisions and update the pending requests
+
+		:param agg_decisions: the decisions of the strategy (don_id,rec_id,ppe,qty,date,...)
+		:type agg_decisions: pandas.DataFrame
+		:return: the granular decisions (don_id,rec_id,ppe,date,qty,holding_time)
+		:rtype: pandas.DataFrame
+		"""
+		cur_donors = self.cur_donors
+		cur_recipients = self.cur_recipients
+		granular_decisions = pd.DataFrame(columns=GRANULAR_COLUMNS)
+		for _, cur_dec in agg_decisions.iterrows():
+			don = cur_dec.don_id
+			rec = cur_dec.rec_id
+			ppe = cur_dec.ppe
+			dd = cur_dec.date
+			totremqty = cur_dec.qty
+			don_df = cur_donors[(cur_donors.don_id == don) & \
+								(cur_donors.ppe == ppe)]\
+								.sort_values('date')  # just this ppe and don-rec
+			rec_df = cur_recipients[(cur_recipients.rec_id == rec) & \
+									(cur_recipients.ppe == ppe)]\
+									.sort_values('date')
+
+			dilocx = 0
+			rilocx = 0
+			while totremqty > 0:
+				drow = don_df.iloc[dilocx]
+				rrow = rec_df.iloc[rilocx]
+				dix = drow.name
+				rix = rrow.name
+				shipped_qty = min(drow.qty, rrow.qty, totremqty)
+				# make the granular decision of shipping
+				granular_decisions.loc[len(granular_decisions)] = [
+					drow.don_id, rrow.rec_id, ppe, dd, shipped_qty, np.round((dd - drow.date).total_seconds() / 24 / 3600)]
+
+				# update quantities
+				totremqty -= shipped_qty
+
+				# update donors table
+				cur_donors.loc[dix, 'qty'] -= shipped_qty
+				don_df.loc[dix, 'qty'] -= shipped_qty
+
+				# update recipient qty
+				cur_recipients.loc[rix, 'qty'] -= shipped_qty
+				rec_df.loc[rix, 'qty'] -= shipped_qty
+
+				'''
+				This shipping action has one of the following outcomes:
+				(1) brings rrow.qty to 0,
+				(2) brings drow.qty to 0,
+				(3) brings neither to 0
+				'''
+
+				if rec_df.loc[rix, 'qty'] == 0:
+					rilocx += 1
+					if rilocx == len(rec_df) and totremqty > 0:
+						# The decisions is infeasible because I am trying to
+						# ship more than requested
+						logger.error(
+							'The decisions is infeasible because I am trying to ship more than requested')
+				elif don_df.loc[dix, 'qty'] == 0:
+					dilocx += 1
+					if dilocx == len(don_df) and totremqty > 0:
+						# The decisions is infeasible because I am trying to
+						# ship more than supplied
+						logger.error(
+							'The decisions is infeasible because I am trying to ship more than supplied')
+				else:
+					# should be totremqty == 0
+					if totremqty != 0:
+						logger.error(
+							'Weird error. If I am here, I should have totremqty == 0')
+
+			# remove from tables those with qty == 0
+			cur_donors = cur_donors.loc[cur_donors.qty > 0]
+			cur_recipients = cur_recipients.loc[cur_recipients.qty > 0]
+
+		self.cur_donors = cur_donors
+		self.cur_recipients = cur_recipients
+		return granular_decisions
+
+
+def to_dates(values, dtype):
+	"""Convert an array of int64 UTC nanoseconds into a Series of the given datetime dtype"""
+	dates = pd.Series(np.asarray(values, dtype=np.int64).view('M8[ns]'))
+	tz = getattr(dtype, 'tz', None)
+	if tz is not None:
+		dates = dates.dt.tz_localize('UTC').dt.tz_convert(tz)
+	return dates
+
+
+class _RequestArrays:
+	""" Integer-coded view of a table of requests (id,date,ppe,qty) with one
+	FIFO queue of pending rows for each (id,ppe). The aggregated table (min date,
+	total qty) of each (id,ppe) is kept up to date incrementally: only the keys
+	touched by arrivals and shipments since the last aggregation are recomputed
+	"""
+	def __init__(self, requests, id_col, ppe_dtype):
+		# the codes of the ids are those of the coded table (see the module coding)
+		ids = pd.Categorical(requests[id_col])
+		self.id_col = id_col
+		self.index = requests.index
+		self.id_dtype = ids.dtype
+		self.names = np.asarray(ids.categories, dtype=object)
+		self.id = ids.codes.astype(np.int64)
+		self.ppe = pd.Categorical(requests['ppe'], dtype=ppe_dtype).codes.astype(np.int64)
+		self.n_ppe = len(ppe_dtype.categories)
+		self.key = self.id * self.n_ppe + self.ppe
+		self.date = requests['date'].values.view(np.int64)
+		self.date_dtype = requests['date'].dtype
+		self.qty = requests['qty'].to_numpy(copy=True)
+
+		# rows sorted by date, to slice the arrivals of each time window
+		self.by_date = np.argsort(self.date, kind='stable')
+		self.sorted_date = self.date[self.by_date]
+
+		self.active = np.zeros(len(self.qty), dtype=bool)
+		self.queues = {}  # (id,ppe) key -> row numbers of the pending requests, oldest first
+		self.unpurged = []  # pending rows that arrived with a non-positive qty
+
+		# aggregated pending requests of each (id,ppe) key
+		n_keys = len(self.names) * self.n_ppe
+		self.pending = np.zeros(n_keys, dtype=bool)
+		self.agg_date = np.zeros(n_keys, dtype=np.int64)
+		self.agg_qty = np.zeros(n_keys, dtype=self.qty.dtype)
+		self.changed = set()  # keys whose queue changed since the last refresh
+
+	def add_requests(self, d1, d2):
+		lo = np.searchsorted(self.sorted_date, d1.value, side='right')
+		hi = np.searchsorted(self.sorted_date, d2.value, side='left')
+		if hi <= lo:
+			return
+		rows = self.by_date[lo:hi]
+		self.active[rows] = True
+		queues = self.queues
+		keys = self.key[rows].tolist()
+		for row, key in zip(rows.tolist(), keys):
+			q = queues.get(key)
+			if q is None:
+				queues[key] = [row]
+			else:
+				q.append(row)
+		self.changed.update(keys)
+		self.unpurged.extend(rows[~(self.qty[rows] > 0)].tolist())
+
+	def pending_frame(self, ppe_dtype):
+		"""The pending rows as a table (id,date,ppe,qty) with the index of the requests, in the order of arrival"""
+		rows = np.flatnonzero(self.active)
+		rows = rows[np.argsort(self._arrival[rows], kind='stable')]
+		return pd.DataFrame({
+			self.id_col: self.ids(self.id[rows]),
+			'date': to_dates(self.date[rows], self.date_dtype).array,
+			'ppe': pd.Categorical.from_codes(self.ppe[rows], dtype=ppe_dtype),
+			'qty': self.qty[rows],
+		}, index=self.index[rows])
+
+	def to_float(self):
+		"""Store the quantities as float64, as PandasEngine does when a fractional quantity is shipped"""
+		if self.qty.dtype.kind != 'f':
+			self.qty = self.qty.astype(np.float64)
+			self.agg_qty = self.agg_qty.astype(np.float64)
+
+	def ids(self, codes):
+		"""Coded column of the ids with the given codes"""
+		return pd.Categorical.from_codes(codes, dtype=self.id_dtype)
+
+	def restore(self, pending):
+		"""Replace the pending rows with the rows of the table pending (see pending_frame)"""
+		rows = self.index.get_indexer(pending.index)
+		if (rows < 0).any():
+			raise ValueError(f'{(rows < 0).sum()} pending requests are not in the table of requests')
+		self.changed.update(self.queues)
+		self.active[:] = False
+		self.queues = {}
+		if pending['qty'].dtype.kind == 'f':
+			self.to_float()
+		self.qty[rows] = pending['qty'].to_numpy()
+		self.active[rows] = True
+		# the queues are in the order of arrival, as built by add_requests
+		rows = rows[np.argsort(self._arrival[rows], kind='stable')]
+		for row, key in zip(rows.tolist(), self.key[rows].tolist()):
+			self.queues.setdefault(key, []).append(row)
+		self.changed.update(self.queues)
+		self.unpurged = rows[~(self.qty[rows] > 0)].tolist()
+
+	@property
+	def _arrival(self):
+		"""Position of each row in the order of arrival"""
+		arrival = np.empty(len(self.by_date), dtype=np.int64)
+		arrival[self.by_date] = np.arange(len(self.by_date))
+		return arrival
+
+	def refresh(self):
+		"""Recompute the aggregated requests of the keys that changed since the last refresh
+
+		:return: the keys that became pending and the keys that are no longer pending
+		:rtype: tuple of numpy.ndarray
+		"""
+		added, removed = [], []
+		for key in self.changed:
+			q = self.queues.get(key)
+			if q:
+				# the queue is sorted by date, so its first row has the min date
+				self.agg_date[key] = self.date[q[0]]
+				self.agg_qty[key] = np.nansum(self.qty[q])
+				if not self.pending[key]:
+					self.pending[key] = True
+					added.append(key)
+			elif self.pending[key]:
+				self.pending[key] = False
+				removed.append(key)
+		self.changed = set()
+		return np.array(sorted(added), dtype=np.int64), np.array(sorted(removed), dtype=np.int64)
+
+	def aggregate(self, ppe_dtype):
+		keys = np.flatnonzero(self.pending)
+		return pd.DataFrame({
+			self.id_col: self.ids(keys // self.n_ppe),
+			'ppe': pd.Categorical.from_codes(keys % self.n_ppe, dtype=ppe_dtype),
+			'date': to_dates(self.agg_date[keys], self.date_dtype),
+			'qty': self.agg_qty[keys],
+		})
+
+	def purge(self, keys):
+		"""Remove the rows with qty <= 0 from the queues of the given keys and from the
+		pending rows that arrived with qty <= 0"""
+		if self.unpurged:
+			keys = set(keys).union(self.key[self.unpurged].tolist())
+			self.unpurged = []
+		# the quantities of these keys changed even if none of their rows is removed
+		self.changed.update(keys)
+		qty = self.qty
+		for key in keys:
+			q = self.queues.get(key)
+			if q is None:
+				continue
+			kept = [row for row in q if qty[row] > 0]
+			if len(kept) != len(q):
+				self.active[[row for row in q if not qty[row] > 0]] = False
+				if kept:
+					self.queues[key] = kept
+				else:
+					del self.queues[key]
+
+
+class ArrayEngine:
+	""" Engine that keeps the pending requests in integer-coded NumPy arrays
+	(id,ppe,date,remaining qty) with one FIFO queue for each (id,ppe). It produces
+	the same decisions as the PandasEngine without any row-by-row pandas operation.
+
+	The state is incremental: the aggregated tables D^t and R^t and the set of
+	compatible pairs are updated only from the arrivals and shipments of each
+	period, instead of being rebuilt from the whole backlog of pending requests
+	"""
+	def __init__(self, all_donors, all_recipients):
+		"""Initialize the engine with no pending requests
+
+		:param all_donors: the table D of donor requests (don_id,date,ppe,qty)
+		:type all_donors: pandas.DataFrame
+		:param all_recipients: the table R of recipient requests (rec_id,date,ppe,qty)
+		:type all_recipients: pandas.DataFrame
+		"""
+		# same dictionary of the ppes as the coded tables (see the module coding)
+		self.ppe_dtype = pd.CategoricalDtype(sorted(set(coding.categories(all_donors.ppe)).union(coding.categories(all_recipients.ppe))))
+		self.ppe_categories = np.asarray(self.ppe_dtype.categories, dtype=object)
+		self.donors = _RequestArrays(all_donors, 'don_id', self.ppe_dtype)
+		self.recipients = _RequestArrays(all_recipients, 'rec_id', self.ppe_dtype)
+		self._pairs = np.empty(0, dtype=np.int64)
+		self._distances = None
+
+		# compatible pairs: _shared[d][r] is the number of ppes that donor d and recipient r both
+		# have pending, for each donor d with a pending request; (d,r) is compatible if it is > 0
+		n_ppe = len(self.ppe_categories)
+		self._ppe_donors = [set() for _ in range(n_ppe)]  # donors with each ppe pending
+		self._ppe_recipients = np.zeros((n_ppe, len(self.recipients.names)), dtype=bool)  # recipients with each ppe pending
+		self._shared = {}
+		self._don_n_ppe = {}  # number of ppes pending for each donor in _shared
+
+	def pending(self):
+		"""The pending requests, with their remaining qty and the index of the tables D and R
+
+		:return: the pending donor requests (don_id,date,ppe,qty) and recipient requests (rec_id,date,ppe,qty), in the order of arrival
+		:rtype: tuple of pandas.DataFrame
+		"""
+		return self.donors.pending_frame(self.ppe_dtype), self.recipients.pending_frame(self.ppe_dtype)
+
+	def restore(self, cur_donors, cur_recipients):
+		"""Replace the pending requests, e.g., with those of a checkpoint (see pending)"""
+		self.donors.restore(cur_donors)
+		self.recipients.restore(cur_recipients)
+
+	def add_requests(self, d1, d2):
+		"""Add the requests received strictly between d1 and d2 to the pending requests"""
+		self.recipients.add_requests(d1, d2)
+		self.donors.add_requests(d1, d2)
+
+	def aggregate(self):
+		"""Aggregate the pending requests by (id,ppe)
+
+		:return: the tables D^t (don_id,ppe,date,qty) and R^t (rec_id,ppe,date,qty)
+		:rtype: tuple of pandas.DataFrame
+		"""
+		self._update_pairs(self.donors.refresh(), self.recipients.refresh())
+		return self.donors.aggregate(self.ppe_dtype), self.recipients.aggregate(self.ppe_dtype)
+
+	def _update_pairs(self, don_changes, rec_changes):
+		"""Update the compatible pairs with the (id,ppe) keys that became pending and those no longer pending"""
+		n_ppe = len(self.ppe_categories)
+		n_rec = len(self.recipients.names)
+		# first the recipients change, against the current donors...
+		for keys, sign in zip(rec_changes, (1, -1)):
+			rec_id, rec_ppe = keys // n_ppe, keys % n_ppe
+			self._ppe_recipients[rec_ppe, rec_id] = sign > 0
+			for ppe in np.unique(rec_ppe):
+				recs = rec_id[rec_ppe == ppe]
+				for don in self._ppe_donors[ppe]:
+					self._shared[don][recs] += sign
+		# ...then the donors change, against the updated recipients
+		for keys, sign in zip(don_changes, (1, -1)):
+			for key in keys.tolist():
+				don, ppe = divmod(key, n_ppe)
+				if sign > 0:
+					self._ppe_donors[ppe].add(don)
+					if don not in self._shared:
+						self._shared[don] = np.zeros(n_rec, dtype=np.int32)
+						self._don_n_ppe[don] = 0
+					self._shared[don] += self._ppe_recipients[ppe]
+					self._don_n_ppe[don] += 1
+				else:
+					self._ppe_donors[ppe].discard(don)
+					self._shared[don] -= self._ppe_recipients[ppe]
+					self._don_n_ppe[don] -= 1
+					if self._don_n_ppe[don] == 0:
+						del self._shared[don]
+						del self._don_n_ppe[don]
+
+	def compatible_pairs(self, agg_cur_donors, agg_cur_recipients):
+		"""List the (don_id,rec_id) pairs that share at least one ppe, sorted by don_id and rec_id"""
+		n_rec = len(self.recipients.names)
+		pairs = [don * n_rec + np.flatnonzero(self._shared[don]) for don in sorted(self._shared)]
+		self._pairs = np.concatenate(pairs) if pairs else np.empty(0, dtype=np.int64)
+		if len(self._pairs) == 0:
+			return pd.DataFrame()
+		return pd.DataFrame({
+			'don_id': self.donors.ids(self._pairs // n_rec),
+			'rec_id': self.recipients.ids(self._pairs % n_rec),
+		})
+
+	def pair_distances(self, don_rec, distances):
+		"""Distance matrix of the current period: the pairs of don_rec that have a distance in M
+
+		:param don_rec: the compatible pairs, as returned by compatible_pairs
+		:type don_rec: pandas.DataFrame
+		:param distances: the distance matrix M, or another distance provider
+		:type distances: distances.DistanceProvider
+		:return: the distance matrix of the current period (don_id,rec_id,distance)
+		:rtype: pandas.DataFrame
+		"""
+		if self._distances is not distances:
+			# translate the codes of the engine into the codes of the distance matrix once
+			self._distances = distances
+			self._don_to_matrix = distances.donor_codes(self.donors.names)
+			self._rec_to_matrix = distances.recipient_codes(self.recipients.names)
+		n_rec = len(self.recipients.names)
+		don_codes = self._pairs // n_rec
+		rec_codes = self._pairs % n_rec
+		distance = distances.lookup(self._don_to_matrix[don_codes], self._rec_to_matrix[rec_codes])
+		known = ~np.isnan(distance)
+		return pd.DataFrame({
+			'don_id': self.donors.ids(don_codes[known]),
+			'rec_id': self.recipients.ids(rec_codes[known]),
+			'distance': distance[known],
+		})
+
+	def ship(self, agg_decisions):
+		"""Turn the aggregated decisions into granular decisions and update the pending requests
+
+		:param agg_decisions: the decisions of the strategy (don_id,rec_id,ppe,qty,date,...)
+		:type agg_decisions: pandas.DataFrame
+		:return: the granular decisions (don_id,rec_id,ppe,date,qty,holding_time)
+		:rtype: pandas.DataFrame
+		"""
+		donors, recipients = self.donors, self.recipients
+		qty = pd.to_numeric(agg_decisions.qty).to_numpy(dtype=np.float64)
+		if (qty != np.floor(qty)).any():
+			# a fractional quantity (e.g., of the linprog solver) would be truncated by integer quantities
+			donors.to_float()
+			recipients.to_float()
+		don_qty, rec_qty = donors.qty, recipients.qty
+		n_ppe = len(self.ppe_categories)
+		# codes of the decisions, -1 for unknown ids and ppes
+		don_codes = pd.Categorical(agg_decisions.don_id, dtype=donors.id_dtype).codes.tolist()
+		rec_codes = pd.Categorical(agg_decisions.rec_id, dtype=recipients.id_dtype).codes.tolist()
+		ppe_codes = pd.Categorical(agg_decisions.ppe, dtype=self.ppe_dtype).codes.tolist()
+		don_rows, rec_rows, ppes, dates, shipped = [], [], [], [], []
+		for don, rec, ppe_code, dd, totremqty in zip(don_codes, rec_codes, ppe_codes, agg_decisions.date, agg_decisions.qty):
+			don_key = don * n_ppe + ppe_code
+			rec_key = rec * n_ppe + ppe_code
+			don_q = donors.queues.get(don_key, []) if ppe_code >= 0 else []
+			rec_q = recipients.queues.get(rec_key, []) if ppe_code >= 0 else []
+
+			dilocx = 0
+			rilocx = 0
+			while totremqty > 0:
+				dix = don_q[dilocx]
+				rix = rec_q[rilocx]
+				shipped_qty = min(don_qty[dix], rec_qty[rix], totremqty)
+				don_rows.append(dix)
+				rec_rows.append(rix)
+				ppes.append(ppe_code)
+				dates.append(dd)
+				shipped.append(shipped_qty)
+
+				totremqty -= shipped_qty
+				don_qty[dix] -= shipped_qty
+				rec_qty[rix] -= shipped_qty
+
+				# same three outcomes as in PandasEngine.ship
+				if rec_qty[rix] == 0:
+					rilocx += 1
+					if rilocx == len(rec_q) and totremqty > 0:
+						logger.error(
+							'The decisions is infeasible because I am trying to ship more than requested')
+				elif don_qty[dix] == 0:
+					dilocx += 1
+					if dilocx == len(don_q) and totremqty > 0:
+						logger.error(
+							'The decisions is infeasible because I am trying to ship more than supplied')
+				else:
+					if totremqty != 0:
+						logger.error(
+							'Weird error. If I am here, I should have totremqty == 0')
+
+			# remove from the queues the requests with qty == 0
+			donors.purge([don_key])
+			recipients.purge([rec_key])
+
+		if not shipped:
+			return pd.DataFrame(columns=GRANULAR_COLUMNS)
+		don_rows = np.asarray(don_rows, dtype=np.int64)
+		rec_rows = np.asarray(rec_rows, dtype=np.int64)
+		dates = pd.Series(pd.DatetimeIndex(dates))
+		holding_time = np.round((dates.values.view(np.int64) - donors.date[don_rows]) / 1e9 / 24 / 3600)
+		return pd.DataFrame({
+			'don_id': donors.ids(donors.id[don_rows]),
+			'rec_id': recipients.ids(recipients.id[rec_rows]),
+			'ppe': pd.Categorical.from_codes(ppes, dtype=self.ppe_dtype),
+			'date': dates,
+			'qty': shipped,
+			'holding_time': holding_time,
+		})
+
+
+ENGINES = {
+	'pandas': PandasEngine,
+	'array': ArrayEngine,
+}
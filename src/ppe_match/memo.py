@@ -0,0 +1,206 @@
+"""Module defining the memoization of the decisions of a strategy.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+In a parameter sweep, many periods give the strategy the same inputs (date,D^t,R^t,M) in
+different runs, e.g., the first periods of the runs with different max_donation_qty, or the
+same run executed again. MemoizedStrategy wraps a strategy and stores its decisions on disk,
+in a file named after a hash of the inputs, so that a strategy called again with the same
+inputs (in this run, in another run, or in another process of the sweep) reads its decisions
+instead of solving the problem again.
+
+The hash covers the name of the strategy, the date, and the columns and rows of D^t, R^t, and M
+(in their order, but not their index). The strategy must be a function of these inputs only:
+e.g., TransportationStrategy with warm_start=False, but not with warm starts, whose decisions
+may depend on the previous periods. Strategies with different parameters need different keys.
+
+The size of the cache is bounded: when it exceeds max_bytes, the least recently used entries
+are removed. The time of the last use of each entry is the modification time of its file.
+"""
+
+import pandas as pd
+import numpy as np
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+from . import coding
+from . import decomposition
+
+import logging
+logger = logging.getLogger(__name__)
+
+# increase when the hash or the format of the entries changes, to invalidate the existing entries
+MEMO_VERSION = 1
+ENTRY_SUFFIX = '.memo'
+
+
+class MemoizedStrategy:
+	""" Strategy that reads the decisions of another strategy from a cache on disk, when the inputs were already solved
+	"""
+	def __init__(self, strategy, cache_dir, max_bytes=1 << 30, key=None):
+		"""Initialize the memoized strategy
+
+		:param strategy: the strategy to memoize, whose decisions depend only on its inputs
+		:type strategy: a function with 4 inputs: current date, D^t, R^t, M
+		:param cache_dir: the directory of the cache, which can be shared by several processes
+		:type cache_dir: str
+		:param max_bytes: the largest size of the cache, defaults to 1 GiB
+		:type max_bytes: int, optional
+		:param key: the name of the strategy in the hash of the inputs, defaults to the module and the name of the strategy
+		:type key: str, optional
+		"""
+		self.strategy = strategy
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		name = getattr(strategy, '__name__', type(strategy).__name__)
+		self.key = key if key is not None else f'{getattr(strategy, "__module__", None)}.{name}'
+		self.__name__ = name
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self._bytes = None  # size of the cache, scanned at the first write
+
+	@property
+	def ppe_separable(self):
+		# the subproblems of the ppes are memoized one by one, so a period with a changed ppe reuses the others
+		return decomposition.is_ppe_separable(self.strategy)
+
+	@property
+	def categorical_aware(self):
+		return coding.is_categorical_aware(self.strategy)
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state['_lock']
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.Lock()
+
+	def __call__(self, date, Dt, Rt, M):
+		"""Return the decisions of the strategy on the inputs, from the cache if they were already solved
+
+		:return: the decisions of the strategy (don_id,rec_id,ppe,qty)
+		:rtype: pandas.DataFrame
+		"""
+		digest = self.digest(date, Dt, Rt, M)
+		path = os.path.join(self.cache_dir, digest + ENTRY_SUFFIX)
+		try:
+			with open(path, 'rb') as f:
+				decisions = pickle.load(f)
+			os.utime(path)  # most recent use
+		except (OSError, EOFError, pickle.UnpicklingError):
+			decisions = None
+		with self._lock:
+			if decisions is not None:
+				self.hits += 1
+			else:
+				self.misses += 1
+		if decisions is not None:
+			return decisions
+		decisions = self.strategy(date, Dt, Rt, M)
+		self._write(path, decisions)
+		return decisions
+
+	def digest(self, date, Dt, Rt, M):
+		"""Hash of the inputs of the strategy, the name of its entry in the cache
+
+		:rtype: str
+		"""
+		h = hashlib.blake2b(f'{MEMO_VERSION}|{self.key}|{pd.Timestamp(date).isoformat()}'.encode(), digest_size=20)
+		for frame in [Dt, Rt, M]:
+			h.update(f'|{list(frame.columns)}|{list(map(str, frame.dtypes))}|{len(frame)}|'.encode())
+			h.update(np.ascontiguousarray(pd.util.hash_pandas_object(frame, index=False).values).data)
+		return h.hexdigest()
+
+	def stats(self):
+		"""Hits and misses of the calls of this strategy (in this process)
+
+		:return: a dict (hits, misses, hit_rate)
+		:rtype: dict
+		"""
+		calls = self.hits + self.misses
+		return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / calls if calls > 0 else 0.0}
+
+	def reset_stats(self):
+		"""Set the hits and misses to 0"""
+		self.hits = 0
+		self.misses = 0
+
+	def _write(self, path, decisions):
+		"""Write an entry, replacing it atomically, and remove the least recently used entries if the cache is too large"""
+		try:
+			os.makedirs(self.cache_dir, exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+			try:
+				with os.fdopen(fd, 'wb') as f:
+					pickle.dump(decisions, f, protocol=pickle.HIGHEST_PROTOCOL)
+				size = os.path.getsize(tmp)
+				os.replace(tmp, path)
+			except BaseException:
+				if os.path.exists(tmp):
+					os.remove(tmp)
+				raise
+		except (OSError, pickle.PicklingError) as e:
+			logger.warning(f'Could not write the decisions into the cache {self.cache_dir}: {e}')
+			return
+		with self._lock:
+			self._bytes = self._bytes + size if self._bytes is not None else None
+			if self._bytes is None or self._bytes > self.max_bytes:
+				# the other processes sharing the cache also write entries, so the size is scanned again
+				self._bytes = evict(self.cache_dir, self.max_bytes)
+
+
+def cache_entries(cache_dir):
+	"""The entries of a cache
+
+	:param cache_dir: the directory of the cache
+	:type cache_dir: str
+	:return: one row for each entry (path,bytes,last_used), from the least to the most recently used
+	:rtype: pandas.DataFrame
+	"""
+	rows = []
+	if os.path.isdir(cache_dir):
+		for entry in os.scandir(cache_dir):
+			if entry.name.endswith(ENTRY_SUFFIX):
+				try:
+					stat = entry.stat()
+				except FileNotFoundError:  # removed by another process
+					continue
+				rows.append((entry.path, stat.st_size, stat.st_mtime_ns))
+	entries = pd.DataFrame(rows, columns=['path', 'bytes', 'last_used'])
+	entries['last_used'] = pd.to_datetime(entries.last_used, unit='ns')
+	return entries.sort_values('last_used', kind='stable').reset_index(drop=True)
+
+
+def evict(cache_dir, max_bytes):
+	"""Remove the least recently used entries of a cache until its size is at most max_bytes
+
+	:param cache_dir: the directory of the cache
+	:type cache_dir: str
+	:param max_bytes: the largest size of the cache
+	:type max_bytes: int
+	:return: the size of the cache after the removal
+	:rtype: int
+	"""
+	entries = cache_entries(cache_dir)
+	total = int(entries.bytes.sum())
+	removed = 0
+	for path, size in zip(entries.path, entries.bytes):
+		if total <= max_bytes:
+			break
+		try:
+			os.remove(path)
+			removed += 1
+		except FileNotFoundError:
+			pass
+		total -= size
+	if removed > 0:
+		logger.info(f'{removed} entries removed from the cache {cache_dir}')
+	return total
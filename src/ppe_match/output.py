@@ -0,0 +1,217 @@
+"""Module defining the writers of the files of the testing framework (writeFiles=True).
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+In each period, the testing framework writes the tables D^t (donors), R^t (recipients), the
+distances of the compatible pairs (distance_matrix), and the granular decisions (decisions),
+and at the end of the run all the decisions (all_decisions). The output_format selects the
+layout of the files:
+
+- 'directories': one directory for each period, named after its date, with one csv file for each table
+- 'csv': one gzip-compressed csv file for each table (e.g., decisions.csv.gz), to which the rows of each period are appended, with the date of the period in the column period
+- 'parquet': one parquet dataset for each table (e.g., the directory decisions), partitioned by the date of the period (requires pyarrow)
+
+The files are written by a background thread, which receives the tables through a bounded
+queue, so that the simulation does not wait on the disk; when the queue is full, the
+simulation waits for the writer to catch up.
+"""
+
+import gzip
+import os
+import queue
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DirectoryWriter:
+	""" Writer of one directory for each period, with one csv file for each table
+	"""
+	def __init__(self, directory, append=False):
+		"""Initialize the writer
+
+		:param directory: the output directory
+		:type directory: str
+		:param append: ignored, the files of a period are always replaced, defaults to False
+		:type append: bool, optional
+		"""
+		self.directory = directory
+
+	def write(self, date, name, frame):
+		"""Write a table of a period
+
+		:param date: the date of the period
+		:type date: pandas.Timestamp
+		:param name: the name of the table (donors, recipients, distance_matrix, or decisions)
+		:type name: str
+		:param frame: the table
+		:type frame: pandas.DataFrame
+		"""
+		directory = os.path.join(self.directory, str(date.date()))
+		os.makedirs(directory, exist_ok=True)
+		frame.to_csv(os.path.join(directory, f'{name}.csv'))
+
+	def write_all(self, name, frame):
+		"""Write a table of the whole run
+
+		:param name: the name of the table (all_decisions)
+		:type name: str
+		:param frame: the table
+		:type frame: pandas.DataFrame
+		"""
+		os.makedirs(self.directory, exist_ok=True)
+		frame.to_csv(os.path.join(self.directory, f'{name}.csv'))
+
+	def close(self):
+		"""Close the files of the writer"""
+		pass
+
+
+class CsvWriter(DirectoryWriter):
+	""" Writer of one gzip-compressed csv file for each table, with the rows of all the periods
+	"""
+	def __init__(self, directory, append=False, compresslevel=1):
+		"""Initialize the writer
+
+		:param directory: the output directory
+		:type directory: str
+		:param append: whether to append the rows to the files of a previous run (e.g., when resuming it from a checkpoint), defaults to False
+		:type append: bool, optional
+		:param compresslevel: the gzip compression level, from 1 (fastest) to 9 (smallest), defaults to 1
+		:type compresslevel: int, optional
+		"""
+		super().__init__(directory)
+		self.append = append
+		self.compresslevel = compresslevel
+		self._files = {}
+
+	def write(self, date, name, frame):
+		f = self._files.get(name)
+		if f is None:
+			os.makedirs(self.directory, exist_ok=True)
+			path = os.path.join(self.directory, f'{name}.csv.gz')
+			header = not (self.append and os.path.exists(path) and os.path.getsize(path) > 0)
+			f = gzip.open(path, 'at' if self.append else 'wt', compresslevel=self.compresslevel, newline='')
+			self._files[name] = f
+		else:
+			header = False
+		frame = frame.reset_index(drop=True)
+		frame.insert(0, 'period', date)
+		frame.to_csv(f, index=False, header=header)
+
+	def write_all(self, name, frame):
+		os.makedirs(self.directory, exist_ok=True)
+		frame.to_csv(os.path.join(self.directory, f'{name}.csv.gz'), compression={'method': 'gzip', 'compresslevel': self.compresslevel})
+
+	def close(self):
+		for f in self._files.values():
+			f.close()
+		self._files = {}
+
+
+class ParquetWriter(DirectoryWriter):
+	""" Writer of one parquet dataset for each table, partitioned by the date of the period
+	"""
+	def __init__(self, directory, append=False):
+		"""Initialize the writer
+
+		:param directory: the output directory
+		:type directory: str
+		:param append: ignored, the file of each period is named after its date and replaced, defaults to False
+		:type append: bool, optional
+		"""
+		try:
+			import pyarrow
+			import pyarrow.parquet
+		except ImportError:  # pyarrow is optional
+			raise ImportError("output_format='parquet' requires pyarrow") from None
+		super().__init__(directory)
+		self._pa = pyarrow
+
+	def write(self, date, name, frame):
+		table = self._pa.Table.from_pandas(frame.assign(period=str(date.date())), preserve_index=False)
+		self._pa.parquet.write_to_dataset(table, os.path.join(self.directory, name), partition_cols=['period'],
+										basename_template=f'part-{date:%Y%m%dT%H%M%S}-{{i}}.parquet')
+
+	def write_all(self, name, frame):
+		os.makedirs(self.directory, exist_ok=True)
+		frame.to_parquet(os.path.join(self.directory, f'{name}.parquet'))
+
+
+WRITERS = {'directories': DirectoryWriter, 'csv': CsvWriter, 'parquet': ParquetWriter}
+
+
+class AsyncWriter:
+	""" Writer that passes the tables to another writer in a background thread, through a bounded queue
+	"""
+	def __init__(self, writer, queue_size=8):
+		"""Initialize the writer and start its thread
+
+		:param writer: the writer of the files
+		:type writer: DirectoryWriter, CsvWriter, or ParquetWriter
+		:param queue_size: the largest number of tables waiting to be written, defaults to 8
+		:type queue_size: int, optional
+		"""
+		self.writer = writer
+		self._queue = queue.Queue(maxsize=queue_size)
+		self._error = None
+		self._thread = threading.Thread(target=self._work, name='ppe_match-output', daemon=True)
+		self._thread.start()
+
+	def _work(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				return
+			if self._error is not None:
+				continue  # the tables are dropped after an error, which is raised by the next write or close
+			method, args = item
+			try:
+				method(*args)
+			except Exception as e:
+				logger.error(f'Error writing the output files: {e}')
+				self._error = e
+
+	def _put(self, method, *args):
+		if self._error is not None:
+			raise self._error
+		self._queue.put((method, args))
+
+	def write(self, date, name, frame):
+		# the table is copied, since the strategy may modify it while it waits in the queue
+		self._put(self.writer.write, date, name, frame.copy())
+
+	def write_all(self, name, frame):
+		self._put(self.writer.write_all, name, frame.copy())
+
+	def close(self):
+		"""Wait for the tables in the queue to be written, and close the files of the writer"""
+		self._queue.put(None)
+		self._thread.join()
+		self.writer.close()
+		if self._error is not None:
+			raise self._error
+
+
+def open_writer(directory, output_format='directories', queue_size=8, append=False):
+	"""Open the writer of the files of a run
+
+	:param directory: the output directory
+	:type directory: str
+	:param output_format: the layout of the files, 'directories', 'csv', or 'parquet', defaults to 'directories'
+	:type output_format: str, optional
+	:param queue_size: the largest number of tables waiting to be written by the background thread; with 0, the tables are written immediately, defaults to 8
+	:type queue_size: int, optional
+	:param append: whether to append to the files of a previous run (e.g., when resuming it from a checkpoint), defaults to False
+	:type append: bool, optional
+	:return: the writer, with the methods write(date,name,frame), write_all(name,frame), and close()
+	"""
+	if output_format not in WRITERS:
+		raise ValueError(f'Unknown output_format {output_format}. Available: {list(WRITERS)}')
+	writer = WRITERS[output_format](directory, append=append)
+	if queue_size > 0:
+		writer = AsyncWriter(writer, queue_size)
+	return writer
@@ -0,0 +1,162 @@
+"""Module defining the instrumentation of the simulation loop of the testing framework.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+A Profiler records the wall time (and optionally the memory allocated) of each phase of
+each period of a run, and the sizes of the problem solved in each period (pending
+requests, compatible pairs, decisions). The phases of a period are
+
+- add_requests: the requests of the period are added to the pending requests
+- aggregate: the pending requests are aggregated by (id,ppe) into D^t and R^t
+- compatible_pairs: the (don_id,rec_id) pairs that share a ppe are listed
+- pair_distances: the distances of the compatible pairs are looked up in M
+- prune: the compatible pairs are pruned, and the decisions checked for the fallback (see the module pruning)
+- write_files: the files of the period are written, or queued to the background writer (writeFiles=True)
+- strategy: the strategy solves the matching problem
+- ship: the aggregated decisions are turned into granular decisions
+- concat: the granular decisions are appended to the decisions of the run
+- checkpoint: the state of the run is written into a checkpoint (checkpoint_path)
+
+and the run ends with the phase compute_metrics (and write_files, with writeFiles=True, which
+includes the wait for the background writer), which have no period date.
+"""
+
+import pandas as pd
+import contextlib
+import time
+import tracemalloc
+
+import logging
+logger = logging.getLogger(__name__)
+
+TIMINGS_COLUMNS = ['date', 'phase', 'seconds', 'allocated_bytes']
+PERIOD_COLUMNS = ['date', 'pending_donors', 'pending_recipients', 'pairs', 'decisions', 'seconds']
+
+
+class Profiler:
+	""" Class that records the phases of the periods of a run
+	"""
+	enabled = True
+
+	def __init__(self, memory=False, on_phase=None, on_period=None):
+		"""Initialize the profiler
+
+		:param memory: whether to record the peak memory allocated by each phase with tracemalloc, which slows the run down, defaults to False
+		:type memory: bool, optional
+		:param on_phase: function called at the end of each phase with (date, phase, seconds, allocated_bytes), defaults to None
+		:type on_phase: function, optional
+		:param on_period: function called at the end of each period with a dict (date, pending_donors, pending_recipients, pairs, decisions, seconds), defaults to None
+		:type on_period: function, optional
+		"""
+		self.memory = memory
+		self.on_phase = on_phase
+		self.on_period = on_period
+		self.reset()
+
+	def reset(self):
+		"""Forget the records of the previous run"""
+		self._phases = []
+		self._periods = []
+		self._date = None
+		self._period = None
+
+	def start_period(self, date):
+		"""Start recording the period ending at date"""
+		self._date = date
+		self._period = {'date': date, 'pending_donors': 0, 'pending_recipients': 0, 'pairs': 0, 'decisions': 0,
+						'seconds': 0.0}
+		self._start = time.perf_counter()
+
+	def end_period(self):
+		"""Stop recording the current period"""
+		self._period['seconds'] = time.perf_counter() - self._start
+		self._periods.append(self._period)
+		if self.on_period is not None:
+			self.on_period(dict(self._period))
+		self._date = None
+		self._period = None
+
+	def count(self, **sizes):
+		"""Record the sizes (pending_donors, pending_recipients, pairs, decisions) of the current period"""
+		if self._period is not None:
+			self._period.update(sizes)
+
+	@contextlib.contextmanager
+	def phase(self, name):
+		"""Context manager that records the wall time and the memory allocated by a phase"""
+		if self.memory:
+			if not tracemalloc.is_tracing():
+				tracemalloc.start()
+			before = tracemalloc.get_traced_memory()[0]
+			tracemalloc.reset_peak()
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			seconds = time.perf_counter() - start
+			allocated = tracemalloc.get_traced_memory()[1] - before if self.memory else None
+			self._phases.append((self._date, name, seconds, allocated))
+			if self.on_phase is not None:
+				self.on_phase(self._date, name, seconds, allocated)
+
+	def timings(self):
+		"""Wall time (and memory allocated) of each phase of each period
+
+		:return: the timings (date,phase,seconds,allocated_bytes), one row for each phase of each period
+		:rtype: pandas.DataFrame
+		"""
+		return pd.DataFrame(self._phases, columns=TIMINGS_COLUMNS)
+
+	def periods(self):
+		"""Sizes and wall time of each period
+
+		:return: one row for each period (date,pending_donors,pending_recipients,pairs,decisions,seconds)
+		:rtype: pandas.DataFrame
+		"""
+		return pd.DataFrame(self._periods, columns=PERIOD_COLUMNS)
+
+	def summary(self):
+		"""Total wall time of each phase over the run, and its share of the total
+
+		:rtype: pandas.DataFrame
+		"""
+		timings = self.timings()
+		result = timings.groupby('phase', sort=False)['seconds'].agg(['sum', 'mean', 'max', 'count'])
+		result['share'] = result['sum'] / result['sum'].sum()
+		return result.sort_values('sum', ascending=False)
+
+
+class _NullProfiler:
+	""" Profiler that records nothing, used when profiling is disabled
+	"""
+	enabled = False
+	_null = contextlib.nullcontext()
+
+	def reset(self):
+		pass
+
+	def start_period(self, date):
+		pass
+
+	def end_period(self):
+		pass
+
+	def count(self, **sizes):
+		pass
+
+	def phase(self, name):
+		return self._null
+
+	def timings(self):
+		return pd.DataFrame(columns=TIMINGS_COLUMNS)
+
+	def periods(self):
+		return pd.DataFrame(columns=PERIOD_COLUMNS)
+
+	def summary(self):
+		return pd.DataFrame(columns=['sum', 'mean', 'max', 'count', 'share'])
+
+
+NULL_PROFILER = _NullProfiler()
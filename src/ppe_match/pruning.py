@@ -0,0 +1,131 @@
+"""Module defining the pruning of the compatible pairs passed to the strategy in each period.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+In each period, the strategy receives the distances of all the compatible pairs (don_id,rec_id),
+i.e., of all the pending donors and recipients that share a ppe. With large backlogs this
+table has millions of rows, although the strategies ship mostly to nearby recipients.
+CandidatePruning keeps only the pairs within a maximum distance and/or, for each donor and
+each ppe it offers, the k closest recipients that request the ppe, so that the work of the
+strategy grows with k instead of with the number of recipients.
+
+With fallback=True, the decisions made on the pruned pairs are checked: if a donor is left
+with units of a ppe while a recipient it was pruned from still needs the ppe, the strategy
+is called again with all the compatible pairs of the period.
+"""
+
+import pandas as pd
+import numpy as np
+
+from .decomposition import pairs_by_ppe
+
+import logging
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = ['date', 'pairs', 'kept_pairs', 'pruned_share', 'fallback']
+
+
+class CandidatePruning:
+	""" Pruning stage of the compatible pairs of each period
+	"""
+	def __init__(self, k=None, max_distance=None, fallback=False):
+		"""Initialize the pruning stage. At least one of k and max_distance must be given; with both, a pair is kept if it satisfies both
+
+		:param k: the number of closest recipients kept for each donor and ppe, defaults to None (no limit)
+		:type k: int, optional
+		:param max_distance: the largest distance of the pairs kept, defaults to None (no limit)
+		:type max_distance: float, optional
+		:param fallback: whether to solve the period again with all the pairs when the pruning may have prevented a shipment, defaults to False
+		:type fallback: bool, optional
+		"""
+		if k is None and max_distance is None:
+			raise ValueError('CandidatePruning needs k or max_distance')
+		if k is not None and k < 1:
+			raise ValueError(f'k must be at least 1, got {k}')
+		self.k = k
+		self.max_distance = max_distance
+		self.fallback = fallback
+		self.reset()
+
+	def reset(self):
+		"""Forget the records of the previous run"""
+		self._records = []
+		self._last = None
+
+	def prune(self, date, agg_cur_donors, agg_cur_recipients, cur_distance_mat):
+		"""Prune the compatible pairs of a period
+
+		:param date: the date of the period
+		:type date: pandas.Timestamp
+		:param agg_cur_donors: the table D^t (don_id,ppe,date,qty)
+		:type agg_cur_donors: pandas.DataFrame
+		:param agg_cur_recipients: the table R^t (rec_id,ppe,date,qty)
+		:type agg_cur_recipients: pandas.DataFrame
+		:param cur_distance_mat: the distances of the compatible pairs (don_id,rec_id,distance)
+		:type cur_distance_mat: pandas.DataFrame
+		:return: the pairs kept, in the same order
+		:rtype: pandas.DataFrame
+		"""
+		keep = np.ones(len(cur_distance_mat), dtype=bool)
+		if self.max_distance is not None:
+			keep &= cur_distance_mat.distance.values <= self.max_distance
+		if self.k is not None:
+			pairs = pairs_by_ppe(cur_distance_mat[keep], agg_cur_donors, agg_cur_recipients)
+			pos = np.flatnonzero(keep)[pairs.pos.values]
+			don = pd.factorize(pairs.don_id)[0]
+			ppe = pd.factorize(pairs.ppe)[0]
+			# rank of the recipients of each (don_id,ppe) by distance, ties in the order of the pairs
+			order = np.lexsort((pos, pairs.distance.values, ppe, don))
+			group = don[order].astype(np.int64) * (ppe.max() + 1 if len(ppe) > 0 else 1) + ppe[order]
+			first = np.r_[True, group[1:] != group[:-1]]
+			rank = np.arange(len(order)) - np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+			keep = np.zeros(len(cur_distance_mat), dtype=bool)
+			keep[pos[order][rank < self.k]] = True
+
+		self._last = (cur_distance_mat, keep)
+		self._records.append([date, len(keep), int(keep.sum()), 1 - keep.mean() if len(keep) > 0 else 0.0, False])
+		logger.debug(f'{date}: {keep.sum()} of {len(keep)} pairs kept')
+		return cur_distance_mat[keep].reset_index(drop=True)
+
+	def needs_fallback(self, agg_cur_donors, agg_cur_recipients, agg_decisions):
+		"""Whether the decisions made on the pairs kept by the last call to prune leave a donor with
+		units of a ppe and a recipient that needs the ppe, whose pair was pruned. The answer is recorded
+		in the report
+
+		:param agg_cur_donors: the table D^t (don_id,ppe,date,qty)
+		:type agg_cur_donors: pandas.DataFrame
+		:param agg_cur_recipients: the table R^t (rec_id,ppe,date,qty)
+		:type agg_cur_recipients: pandas.DataFrame
+		:param agg_decisions: the decisions made on the pairs kept (don_id,rec_id,ppe,qty)
+		:type agg_decisions: pandas.DataFrame
+		:rtype: bool
+		"""
+		cur_distance_mat, keep = self._last
+		if keep.all():
+			return False
+		pruned = pairs_by_ppe(cur_distance_mat[~keep], agg_cur_donors, agg_cur_recipients)
+		qty = agg_decisions.qty.astype(np.float64)
+		supply = _remaining(agg_cur_donors, 'don_id', qty.groupby([agg_decisions.don_id, agg_decisions.ppe], observed=True).sum())
+		demand = _remaining(agg_cur_recipients, 'rec_id', qty.groupby([agg_decisions.rec_id, agg_decisions.ppe], observed=True).sum())
+		missed = ((supply.reindex(pd.MultiIndex.from_arrays([pruned.don_id, pruned.ppe])).values > 0)
+				& (demand.reindex(pd.MultiIndex.from_arrays([pruned.rec_id, pruned.ppe])).values > 0))
+		if missed.any():
+			self._records[-1][-1] = True
+			return True
+		return False
+
+	def report(self):
+		"""Pairs kept in each period of the run
+
+		:return: one row for each period (date,pairs,kept_pairs,pruned_share,fallback), with fallback True if the period was solved again with all the pairs
+		:rtype: pandas.DataFrame
+		"""
+		return pd.DataFrame(self._records, columns=REPORT_COLUMNS)
+
+
+def _remaining(agg_requests, id_column, shipped):
+	"""Quantity of each (id,ppe) of the aggregated requests that was not shipped, indexed by (id,ppe)"""
+	qty = agg_requests.set_index([id_column, 'ppe']).qty.astype(np.float64)
+	return qty - shipped.reindex(qty.index, fill_value=0).values
@@ -0,0 +1,275 @@
+"""Module defining the Monte Carlo replications of the testing framework on perturbed data.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+A run of the testing framework replays the historical requests once. A Scenario describes
+random perturbations of the tables D and R (bootstrapped requests, scaled supply and demand,
+jittered dates), and run_replications runs the framework on many perturbed copies of the data
+and summarizes the distribution of each metric with its mean and confidence interval.
+
+Replication r of a scenario with seed s is generated with the random generator seeded with
+(s, r), so it does not depend on the number of workers or on the order of the replications.
+As in the module sweep, the data are loaded once by the framework passed to run_replications,
+and the worker processes are forked after the data are loaded, so they share its memory pages
+(they are spawned instead when they cannot be forked safely, see sweep.can_fork).
+"""
+
+import pandas as pd
+import numpy as np
+import copy
+import multiprocessing
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+from .sweep import can_fork
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+	from scipy.stats import t as student_t
+except ImportError:  # scipy is optional, the quantiles of t are tabulated or approximated without it
+	student_t = None
+
+SUMMARY_COLUMNS = ['metric_name', 'description', 'mean', 'std', 'ci_low', 'ci_high', 'replications']
+
+# two-sided quantiles of Student's t distribution with 1 to 30 degrees of freedom, used without scipy
+_T_QUANTILES = {
+	0.8: [3.0777, 1.8856, 1.6377, 1.5332, 1.4759, 1.4398, 1.4149, 1.3968, 1.3830, 1.3722,
+		1.3634, 1.3562, 1.3502, 1.3450, 1.3406, 1.3368, 1.3334, 1.3304, 1.3277, 1.3253,
+		1.3232, 1.3212, 1.3195, 1.3178, 1.3163, 1.3150, 1.3137, 1.3125, 1.3114, 1.3104],
+	0.9: [6.3138, 2.9200, 2.3534, 2.1318, 2.0150, 1.9432, 1.8946, 1.8595, 1.8331, 1.8125,
+		1.7959, 1.7823, 1.7709, 1.7613, 1.7531, 1.7459, 1.7396, 1.7341, 1.7291, 1.7247,
+		1.7207, 1.7171, 1.7139, 1.7109, 1.7081, 1.7056, 1.7033, 1.7011, 1.6991, 1.6973],
+	0.95: [12.7062, 4.3027, 3.1824, 2.7764, 2.5706, 2.4469, 2.3646, 2.3060, 2.2622, 2.2281,
+		2.2010, 2.1788, 2.1604, 2.1448, 2.1314, 2.1199, 2.1098, 2.1009, 2.0930, 2.0860,
+		2.0796, 2.0739, 2.0687, 2.0639, 2.0595, 2.0555, 2.0518, 2.0484, 2.0452, 2.0423],
+	0.98: [31.8205, 6.9646, 4.5407, 3.7469, 3.3649, 3.1427, 2.9980, 2.8965, 2.8214, 2.7638,
+		2.7181, 2.6810, 2.6503, 2.6245, 2.6025, 2.5835, 2.5669, 2.5524, 2.5395, 2.5280,
+		2.5176, 2.5083, 2.4999, 2.4922, 2.4851, 2.4786, 2.4727, 2.4671, 2.4620, 2.4573],
+	0.99: [63.6567, 9.9248, 5.8409, 4.6041, 4.0321, 3.7074, 3.4995, 3.3554, 3.2498, 3.1693,
+		3.1058, 3.0545, 3.0123, 2.9768, 2.9467, 2.9208, 2.8982, 2.8784, 2.8609, 2.8453,
+		2.8314, 2.8188, 2.8073, 2.7969, 2.7874, 2.7787, 2.7707, 2.7633, 2.7564, 2.7500],
+}
+
+# framework, scenario, and seed of the current replications, inherited by the forked workers
+_framework = None
+_scenario = None
+_seed = None
+
+
+class Scenario:
+	""" Random perturbations of the donor and recipient requests
+	"""
+	def __init__(self, bootstrap_donors=False, bootstrap_recipients=False, supply_scale=1.0, demand_scale=1.0,
+				date_jitter=0.0):
+		"""Initialize the scenario. Without parameters, the scenario is the historical data
+
+		:param bootstrap_donors: whether to resample the donor requests with replacement (same number of requests), defaults to False
+		:type bootstrap_donors: bool, optional
+		:param bootstrap_recipients: whether to resample the recipient requests with replacement (same number of requests), defaults to False
+		:type bootstrap_recipients: bool, optional
+		:param supply_scale: the factor applied to the qty of the donor requests, rounded at random to an integer with the same mean, defaults to 1.0
+		:type supply_scale: float, optional
+		:param demand_scale: the factor applied to the qty of the recipient requests, rounded at random to an integer with the same mean, defaults to 1.0
+		:type demand_scale: float, optional
+		:param date_jitter: the largest shift, in days, of the date of each request; the shifts are uniform between -date_jitter and date_jitter, defaults to 0.0
+		:type date_jitter: float, optional
+		"""
+		if supply_scale < 0 or demand_scale < 0 or date_jitter < 0:
+			raise ValueError('supply_scale, demand_scale, and date_jitter must not be negative')
+		self.bootstrap_donors = bootstrap_donors
+		self.bootstrap_recipients = bootstrap_recipients
+		self.supply_scale = supply_scale
+		self.demand_scale = demand_scale
+		self.date_jitter = date_jitter
+
+	def __repr__(self):
+		return (f'Scenario(bootstrap_donors={self.bootstrap_donors}, bootstrap_recipients={self.bootstrap_recipients}, '
+				f'supply_scale={self.supply_scale}, demand_scale={self.demand_scale}, date_jitter={self.date_jitter})')
+
+	def generate(self, donors, recipients, seed):
+		"""Generate perturbed copies of the tables D and R
+
+		:param donors: the donor requests (don_id,date,ppe,qty)
+		:type donors: pandas.DataFrame
+		:param recipients: the recipient requests (rec_id,date,ppe,qty)
+		:type recipients: pandas.DataFrame
+		:param seed: the seed of the random generator, e.g., a tuple (seed, replication)
+		:type seed: int or tuple of int
+		:return: the perturbed tables D and R. Their requests are sorted by date when the dates are jittered, and the requests whose scaled qty is 0 are removed when the quantities are scaled (supply_scale or demand_scale other than 1)
+		:rtype: tuple of pandas.DataFrame
+		"""
+		rng = np.random.default_rng(seed)
+		donors = self._perturb(donors, rng, self.bootstrap_donors, self.supply_scale)
+		recipients = self._perturb(recipients, rng, self.bootstrap_recipients, self.demand_scale)
+		return donors, recipients
+
+	def _perturb(self, requests, rng, bootstrap, scale):
+		if bootstrap:
+			requests = requests.iloc[rng.integers(0, len(requests), len(requests))]
+		requests = requests.reset_index(drop=True)
+		if scale != 1.0:
+			qty = requests.qty.to_numpy(dtype=np.float64) * scale
+			qty = np.floor(qty + rng.random(len(qty)))
+			requests = requests.assign(qty=qty)[qty > 0].reset_index(drop=True)
+		if self.date_jitter > 0:
+			shift = rng.uniform(-self.date_jitter, self.date_jitter, len(requests)) * 86400e9
+			requests = requests.assign(date=requests.date + pd.to_timedelta(shift.astype(np.int64)))
+			requests = requests.sort_values('date', kind='stable').reset_index(drop=True)
+		return requests
+
+
+def run_replication(framework, scenario, replication, seed=0):
+	"""Run a copy of the framework on a replication of the scenario
+
+	:param framework: the framework with the data, strategy, interval, and max_donation_qty to use
+	:type framework: TestingFramework
+	:param scenario: the scenario of the replication
+	:type scenario: Scenario
+	:param replication: the number of the replication
+	:type replication: int
+	:param seed: the seed of the scenario, defaults to 0
+	:type seed: int, optional
+	:return: the metrics of the run
+	:rtype: pandas.DataFrame
+	"""
+	s = copy.copy(framework)
+	s.all_donors, s.all_recipients = scenario.generate(framework.all_donors, framework.all_recipients, (seed, replication))
+	# strategies with a state (e.g., warm starts) must not be shared between replications
+	s.set_strategy(copy.deepcopy(framework.strategy))
+	# the replications do not write the files and checkpoints of the framework
+	s.writeFiles = False
+	s.set_checkpoint(None)
+	s.run()
+	return s.get_metrics()
+
+
+def _init_worker(framework, scenario, seed):
+	global _framework, _scenario, _seed
+	_framework, _scenario, _seed = framework, scenario, seed
+
+
+def _run_task(replication):
+	return replication, run_replication(_framework, _scenario, replication, _seed)
+
+
+def run_replications(framework, scenario, n_replications, seed=0, max_workers=None, confidence=0.95,
+					overall_only=True, return_metrics=False):
+	"""Run the framework on n_replications replications of the scenario, in parallel, and summarize the metrics
+
+	:param framework: the framework with the data, strategy, interval, and max_donation_qty to use
+	:type framework: TestingFramework
+	:param scenario: the random perturbations of the data
+	:type scenario: Scenario
+	:param n_replications: the number of replications
+	:type n_replications: int
+	:param seed: the seed of the scenario, defaults to 0
+	:type seed: int, optional
+	:param max_workers: the number of worker processes, defaults to the number of CPUs. With max_workers=1 the replications are executed in this process
+	:type max_workers: int, optional
+	:param confidence: the confidence level of the intervals of the means, defaults to 0.95
+	:type confidence: float, optional
+	:param overall_only: whether to compute only the five "overall" metrics in each replication, defaults to True
+	:type overall_only: bool, optional
+	:param return_metrics: whether to return also the metrics of each replication, defaults to False
+	:type return_metrics: bool, optional
+	:return: the summary of each metric (metric_name,description,mean,std,ci_low,ci_high,replications) and, if return_metrics, the metrics of all replications (replication,metric_name,description,value)
+	:rtype: pandas.DataFrame, or tuple (pandas.DataFrame, pandas.DataFrame)
+	"""
+	global _framework, _scenario, _seed
+	# the copies of the framework made by the replications share the data read here
+	framework = copy.copy(framework.load())
+	framework.set_overall_metrics_only(overall_only)
+	if max_workers is None:
+		max_workers = os.cpu_count() or 1
+	max_workers = min(max_workers, n_replications) if n_replications > 0 else 1
+
+	results = [None] * n_replications
+	if max_workers <= 1:
+		for r in range(n_replications):
+			results[r] = run_replication(framework, scenario, r, seed)
+	else:
+		if can_fork():
+			# the forked workers inherit the framework without pickling it
+			_framework, _scenario, _seed = framework, scenario, seed
+			pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+		else:
+			pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+									   initializer=_init_worker, initargs=(framework, scenario, seed))
+		try:
+			with pool:
+				futures = [pool.submit(_run_task, r) for r in range(n_replications)]
+				for future in futures:
+					r, metrics = future.result()
+					results[r] = metrics
+					logger.info(f'Scenario: replication {r + 1} of {n_replications} completed')
+		finally:
+			_framework, _scenario, _seed = None, None, None
+
+	all_metrics = pd.concat([metrics.assign(replication=r) for r, metrics in enumerate(results)], ignore_index=True) \
+		if results else pd.DataFrame(columns=['replication', 'metric_name', 'description', 'value'])
+	all_metrics = all_metrics[['replication', 'metric_name', 'description', 'value']]
+	summary = summarize(all_metrics, confidence)
+	if return_metrics:
+		return summary, all_metrics
+	return summary
+
+
+def summarize(all_metrics, confidence=0.95):
+	"""Mean, standard deviation, and confidence interval of the mean of each metric over the replications.
+	The interval uses the quantile of Student's t distribution with replications - 1 degrees of freedom (see t_quantile)
+
+	:param all_metrics: the metrics of the replications (replication,metric_name,description,value)
+	:type all_metrics: pandas.DataFrame
+	:param confidence: the confidence level of the intervals, defaults to 0.95
+	:type confidence: float, optional
+	:return: one row for each metric (metric_name,description,mean,std,ci_low,ci_high,replications), in the order of the metrics of the first replications; the replications where a metric is undefined (NaN) are ignored
+	:rtype: pandas.DataFrame
+	"""
+	gb = all_metrics.groupby('metric_name', sort=False)
+	summary = pd.DataFrame({
+		'description': gb.description.first(),
+		'mean': gb.value.mean(),
+		'std': gb.value.std(),
+		'replications': gb.value.count(),
+	})
+	n = summary.replications.to_numpy(dtype=np.float64)
+	quantile = t_quantile(confidence, np.maximum(n - 1, 1))
+	half_width = quantile * summary['std'].to_numpy() / np.sqrt(np.maximum(n, 1))
+	summary['ci_low'] = summary['mean'] - half_width
+	summary['ci_high'] = summary['mean'] + half_width
+	return summary.reset_index()[SUMMARY_COLUMNS]
+
+
+def t_quantile(confidence, df):
+	"""Two-sided quantile of Student's t distribution: the value t such that P(|T| <= t) = confidence.
+	Without scipy, the quantiles are read from a table for 1 to 30 degrees of freedom and the confidence
+	levels 0.8, 0.9, 0.95, 0.98, and 0.99, and approximated with the Cornish-Fisher expansion around the
+	normal quantile otherwise (relative error below 1e-5 from 30 degrees of freedom, a warning is
+	logged for fewer degrees of freedom)
+
+	:param confidence: the confidence level, between 0 and 1
+	:type confidence: float
+	:param df: the degrees of freedom, at least 1
+	:type df: int or numpy.ndarray
+	:rtype: float or numpy.ndarray
+	"""
+	if student_t is not None:
+		return student_t.ppf((1 + confidence) / 2, df)
+	df = np.asarray(df, dtype=np.float64)
+	z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+	quantile = z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2) \
+		+ (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3) \
+		+ (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4)
+	small = df <= len(_T_QUANTILES[0.95])
+	table = next((row for level, row in _T_QUANTILES.items() if np.isclose(level, confidence)), None)
+	if table is not None:
+		quantile = np.where(small, np.take(table, np.clip(df, 1, len(table)).astype(int) - 1), quantile)
+	elif small.any():
+		logger.warning(f'The quantile of Student\'s t distribution at the confidence level {confidence} with '
+					   f'{int(df.min())} degrees of freedom is approximated (install scipy for the exact value)')
+	return quantile[()]
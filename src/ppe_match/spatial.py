@@ -0,0 +1,328 @@
+"""Module defining the distances computed on the fly from the locations of donors and recipients.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+When no distance matrix M is available, GeoDistances gives the distances between donors
+and recipients from their latitude and longitude. It is a distance provider like
+DistanceMatrix (see the module distances), so it can be passed to the TestingFramework in
+place of M: the great-circle (haversine) distances are computed lazily, in vectorized
+batches, only for the compatible pairs of each period, and never stored.
+
+The locations are also placed in a spatial index (SpatialIndex) as points on the unit
+sphere, where the Euclidean (chord) distance grows with the great-circle distance. The
+index answers k-nearest-neighbour and radius queries, e.g., the k recipients closest to
+each donor for proximity-style strategies. It is a k-d tree of scipy when scipy is
+installed, and a blocked brute-force search with NumPy otherwise.
+"""
+
+import pandas as pd
+import numpy as np
+
+from .distances import DistanceProvider
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+	from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional
+	cKDTree = None
+
+EARTH_RADIUS_MILES = 3958.8
+
+# largest number of (query,point) distances computed at once by the brute-force search
+BLOCK_SIZE = 1 << 22
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+	"""Great-circle distance in miles between points given in radians (broadcasting)"""
+	a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+	return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def unit_vectors(lat, lon):
+	"""Points (x,y,z) on the unit sphere of the locations given in radians"""
+	cos_lat = np.cos(lat)
+	return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def miles_to_chord(miles, radius=EARTH_RADIUS_MILES):
+	"""Chord length on the unit sphere of a great-circle distance"""
+	return 2 * np.sin(np.minimum(np.asarray(miles, dtype=np.float64) / (2 * radius), np.pi / 2))
+
+
+class SpatialIndex:
+	""" Nearest-neighbour index of points on the unit sphere
+	"""
+	def __init__(self, points):
+		"""Build the index
+
+		:param points: the points (x,y,z) on the unit sphere, see unit_vectors
+		:type points: numpy.ndarray of shape (n,3)
+		"""
+		self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+		self._tree = cKDTree(self.points) if cKDTree is not None and len(self.points) > 0 else None
+
+	def __len__(self):
+		return len(self.points)
+
+	def query(self, queries, k):
+		"""The k points closest to each query point, sorted by distance
+
+		:param queries: the query points (x,y,z)
+		:type queries: numpy.ndarray of shape (m,3)
+		:param k: the number of neighbours, at most the number of points
+		:type k: int
+		:return: the positions of the neighbours and their chord distances, two arrays of shape (m,k)
+		:rtype: tuple of numpy.ndarray
+		"""
+		queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+		k = min(k, len(self.points))
+		if k <= 0 or len(queries) == 0:
+			return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0))
+		if self._tree is not None:
+			chord, positions = self._tree.query(queries, k=list(range(1, k + 1)))
+			return positions.astype(np.int64), chord
+		positions = np.empty((len(queries), k), dtype=np.int64)
+		chord = np.empty((len(queries), k))
+		for lo, hi, sq in self._blocks(queries):
+			part = np.argpartition(sq, k - 1, axis=1)[:, :k] if k < sq.shape[1] else np.broadcast_to(np.arange(sq.shape[1]), sq.shape)
+			part_sq = np.take_along_axis(sq, part, axis=1)
+			order = np.argsort(part_sq, axis=1, kind='stable')
+			positions[lo:hi] = np.take_along_axis(part, order, axis=1)
+			chord[lo:hi] = np.sqrt(np.take_along_axis(part_sq, order, axis=1))
+		return positions, chord
+
+	def query_radius(self, queries, chord):
+		"""The points within a chord distance of each query point
+
+		:param queries: the query points (x,y,z)
+		:type queries: numpy.ndarray of shape (m,3)
+		:param chord: the chord distance
+		:type chord: float
+		:return: the query of each pair (query,point) found and the position of its point, sorted by query and position
+		:rtype: tuple of numpy.ndarray
+		"""
+		queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+		if len(self.points) == 0 or len(queries) == 0:
+			return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+		if self._tree is not None:
+			found = self._tree.query_ball_point(queries, chord)
+			sizes = np.fromiter((len(f) for f in found), dtype=np.int64, count=len(found))
+			positions = np.fromiter((p for f in found for p in sorted(f)), dtype=np.int64, count=sizes.sum())
+			return np.repeat(np.arange(len(queries)), sizes), positions
+		query_pos, point_pos = [], []
+		for lo, hi, sq in self._blocks(queries):
+			rows, cols = np.nonzero(sq <= chord ** 2)
+			query_pos.append(rows + lo)
+			point_pos.append(cols)
+		return np.concatenate(query_pos), np.concatenate(point_pos)
+
+	def _blocks(self, queries):
+		"""Squared chord distances between blocks of queries and all the points"""
+		step = max(1, BLOCK_SIZE // len(self.points))
+		for lo in range(0, len(queries), step):
+			hi = min(lo + step, len(queries))
+			# |q-p|^2 = 2 - 2 q.p for unit vectors
+			sq = np.maximum(2 - 2 * (queries[lo:hi] @ self.points.T), 0)
+			yield lo, hi, sq
+
+
+class GeoDistances(DistanceProvider):
+	""" Distances between donors and recipients computed from their latitude and longitude.
+	Donors or recipients without a location have no distance (NaN), like the pairs missing
+	from a DistanceMatrix
+	"""
+	def __init__(self, don_ids, don_lat, don_lon, rec_ids, rec_lat, rec_lon, dtype=np.float64):
+		"""Build the provider from the locations in degrees. When an id is repeated, its last location is kept
+
+		:param don_ids: the donors
+		:type don_ids: array-like of str
+		:param don_lat: the latitude of each donor
+		:type don_lat: array-like of float
+		:param don_lon: the longitude of each donor
+		:type don_lon: array-like of float
+		:param rec_ids: the recipients
+		:type rec_ids: array-like of str
+		:param rec_lat: the latitude of each recipient
+		:type rec_lat: array-like of float
+		:param rec_lon: the longitude of each recipient
+		:type rec_lon: array-like of float
+		:param dtype: the type of the distances returned, defaults to np.float64 (as DistanceMatrix)
+		:type dtype: numpy dtype, optional
+		"""
+		self.dtype = np.dtype(dtype)
+		self.donors, self._don_lat, self._don_lon = self._locations('donors', don_ids, don_lat, don_lon)
+		self.recipients, self._rec_lat, self._rec_lon = self._locations('recipients', rec_ids, rec_lat, rec_lon)
+		self._don_cos = np.cos(self._don_lat)
+		self._rec_cos = np.cos(self._rec_lat)
+		self._rec_index = None
+
+	@staticmethod
+	def _locations(kind, ids, lat, lon):
+		locations = pd.DataFrame({'lat': np.asarray(lat, dtype=np.float64), 'lon': np.asarray(lon, dtype=np.float64)},
+								index=pd.Index(ids))
+		missing = locations.isna().any(axis=1)
+		if missing.any():
+			logger.warning(f'{missing.sum()} {kind} without a location have no distance')
+			locations = locations[~missing]
+		locations = locations[~locations.index.duplicated(keep='last')]
+		return locations.index, np.radians(locations.lat.values), np.radians(locations.lon.values)
+
+	@classmethod
+	def from_frames(cls, donor_locations, recipient_locations, **kwargs):
+		"""Build the provider from the DataFrames (don_id,lat,lon) and (rec_id,lat,lon), in degrees"""
+		return cls(donor_locations['don_id'].values, donor_locations['lat'].values, donor_locations['lon'].values,
+					recipient_locations['rec_id'].values, recipient_locations['lat'].values, recipient_locations['lon'].values,
+					**kwargs)
+
+	@classmethod
+	def from_csv(cls, donor_path, recipient_path, **kwargs):
+		"""Build the provider from the csv files with columns (don_id,lat,lon) and (rec_id,lat,lon), in degrees"""
+		donor_locations = pd.read_csv(donor_path, usecols=['don_id', 'lat', 'lon'])
+		recipient_locations = pd.read_csv(recipient_path, usecols=['rec_id', 'lat', 'lon'])
+		return cls.from_frames(donor_locations, recipient_locations, **kwargs)
+
+	def __len__(self):
+		"""Number of (don,rec) pairs with a distance"""
+		return len(self.donors) * len(self.recipients)
+
+	def __repr__(self):
+		return f'GeoDistances({len(self.donors)} donors x {len(self.recipients)} recipients, {self.nbytes / 2**20:.1f} MB)'
+
+	@property
+	def nbytes(self):
+		arrays = [self._don_lat, self._don_lon, self._don_cos, self._rec_lat, self._rec_lon, self._rec_cos]
+		if self._rec_index is not None:
+			arrays.append(self._rec_index.points)
+		return sum(a.nbytes for a in arrays)
+
+	def lookup(self, don_codes, rec_codes):
+		"""Distances in miles of the pairs (don_codes[i],rec_codes[i]), NaN for unknown donors or recipients
+
+		:param don_codes: donor codes, as returned by donor_codes
+		:type don_codes: numpy.ndarray of int
+		:param rec_codes: recipient codes, as returned by recipient_codes
+		:type rec_codes: numpy.ndarray of int
+		:return: the distance of each pair
+		:rtype: numpy.ndarray
+		"""
+		don_codes = np.asarray(don_codes, dtype=np.int64)
+		rec_codes = np.asarray(rec_codes, dtype=np.int64)
+		result = np.full(len(don_codes), np.nan, dtype=self.dtype)
+		known = (don_codes >= 0) & (rec_codes >= 0)
+		i, j = don_codes[known], rec_codes[known]
+		result[known] = self._haversine(i, j)
+		return result
+
+	def _haversine(self, i, j):
+		# haversine_miles with the cosines of the latitudes computed once
+		a = (np.sin((self._rec_lat[j] - self._don_lat[i]) / 2) ** 2
+			+ self._don_cos[i] * self._rec_cos[j] * np.sin((self._rec_lon[j] - self._don_lon[i]) / 2) ** 2)
+		return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+	def row(self, don_code):
+		"""Distances from the donor don_code to all the recipients
+
+		:return: the recipient codes and the distances
+		:rtype: tuple of numpy.ndarray
+		"""
+		cols = np.arange(len(self.recipients))
+		return cols, self._haversine(np.full(len(cols), don_code), cols).astype(self.dtype)
+
+	def submatrix(self, don_codes, rec_codes):
+		"""Dense matrix of the distances between the given donors (rows) and recipients (columns)"""
+		don_codes = np.asarray(don_codes, dtype=np.int64)
+		rec_codes = np.asarray(rec_codes, dtype=np.int64)
+		rows = np.repeat(don_codes, len(rec_codes))
+		cols = np.tile(rec_codes, len(don_codes))
+		return self.lookup(rows, cols).reshape(len(don_codes), len(rec_codes))
+
+	def to_frame(self):
+		"""DataFrame (don_id,rec_id,distance) of all the pairs, i.e., the full distance matrix M.
+		Its size is the number of donors times the number of recipients"""
+		rows = np.repeat(np.arange(len(self.donors)), len(self.recipients))
+		cols = np.tile(np.arange(len(self.recipients)), len(self.donors))
+		return pd.DataFrame({
+			'don_id': self.donors.values[rows],
+			'rec_id': self.recipients.values[cols],
+			'distance': self.lookup(rows, cols),
+		})
+
+	def _candidates(self, rec_codes):
+		"""Spatial index of the given recipients (all the recipients if None) and their codes"""
+		if rec_codes is None:
+			if self._rec_index is None:
+				self._rec_index = SpatialIndex(unit_vectors(self._rec_lat, self._rec_lon))
+			return self._rec_index, np.arange(len(self.recipients))
+		rec_codes = np.unique(np.asarray(rec_codes, dtype=np.int64))
+		rec_codes = rec_codes[rec_codes >= 0]
+		return SpatialIndex(unit_vectors(self._rec_lat[rec_codes], self._rec_lon[rec_codes])), rec_codes
+
+	def kneighbors(self, don_codes, k, rec_codes=None):
+		"""The k recipients closest to each donor
+
+		:param don_codes: the donor codes (all known)
+		:type don_codes: numpy.ndarray of int
+		:param k: the number of recipients of each donor (fewer if there are fewer candidates)
+		:type k: int
+		:param rec_codes: the candidate recipients, defaults to None (all the recipients)
+		:type rec_codes: numpy.ndarray of int, optional
+		:return: the codes of the recipients closest to each donor and their distances, sorted by distance, two arrays of shape (len(don_codes),k)
+		:rtype: tuple of numpy.ndarray
+		"""
+		don_codes = np.asarray(don_codes, dtype=np.int64)
+		index, codes = self._candidates(rec_codes)
+		positions, _ = index.query(unit_vectors(self._don_lat[don_codes], self._don_lon[don_codes]), k)
+		neighbors = codes[positions]
+		# the exact distances of the neighbours, consistent with lookup
+		distance = self.lookup(np.repeat(don_codes, neighbors.shape[1]), neighbors.ravel()).reshape(neighbors.shape)
+		return neighbors, distance
+
+	def within(self, don_codes, radius, rec_codes=None):
+		"""The recipients within a distance from each donor
+
+		:param don_codes: the donor codes (all known)
+		:type don_codes: numpy.ndarray of int
+		:param radius: the largest distance in miles
+		:type radius: float
+		:param rec_codes: the candidate recipients, defaults to None (all the recipients)
+		:type rec_codes: numpy.ndarray of int, optional
+		:return: the donor codes, recipient codes, and distances of the pairs found
+		:rtype: tuple of numpy.ndarray
+		"""
+		don_codes = np.asarray(don_codes, dtype=np.int64)
+		index, codes = self._candidates(rec_codes)
+		query_pos, point_pos = index.query_radius(unit_vectors(self._don_lat[don_codes], self._don_lon[don_codes]),
+												miles_to_chord(radius) * (1 + 1e-9))
+		dons, recs = don_codes[query_pos], codes[point_pos]
+		distance = self.lookup(dons, recs)
+		# the chord test is only a filter: the exact distance decides
+		keep = distance <= radius
+		return dons[keep], recs[keep], distance[keep]
+
+	def nearest(self, don_ids, k, rec_ids=None):
+		"""DataFrame of the k recipients closest to each donor, e.g., for a proximity-style strategy
+
+		:param don_ids: the donors
+		:type don_ids: array-like of str
+		:param k: the number of recipients of each donor
+		:type k: int
+		:param rec_ids: the candidate recipients, defaults to None (all the recipients)
+		:type rec_ids: array-like of str, optional
+		:return: the pairs (don_id,rec_id,distance,rank), with rank 0 for the closest recipient of each donor; donors without a location are left out
+		:rtype: pandas.DataFrame
+		"""
+		don_ids = pd.unique(np.asarray(don_ids))
+		don_codes = self.donor_codes(don_ids)
+		don_codes = don_codes[don_codes >= 0]
+		rec_codes = self.recipient_codes(pd.unique(np.asarray(rec_ids))) if rec_ids is not None else None
+		neighbors, distance = self.kneighbors(don_codes, k, rec_codes)
+		return pd.DataFrame({
+			'don_id': self.donors.values[np.repeat(don_codes, neighbors.shape[1])],
+			'rec_id': self.recipients.values[neighbors.ravel()],
+			'distance': distance.ravel(),
+			'rank': np.tile(np.arange(neighbors.shape[1]), len(don_codes)),
+		})
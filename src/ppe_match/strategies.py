@@ -6,14 +6,15 @@ Unless required by applicable law or agreed to in writing, software distributed
 """
 
 import pandas as pd
+import numpy as np
+from . import transportation
+from .decomposition import ppe_separable
+from .coding import categorical_aware
 import logging
 logger = logging.getLogger(__name__)
-stream_hdlr = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-stream_hdlr.setFormatter(formatter)
-logger.addHandler(stream_hdlr)
-logger.setLevel(logging.WARN)
 
+@ppe_separable
+@categorical_aware
 def FCFM_strategy(date,Dt,Rt,M):
     """simple first-come-first-matched strategy that matches the i-th donor request with the i-th recipient request for the same PPE
 
@@ -51,6 +52,8 @@ def FCFM_strategy(date,Dt,Rt,M):
     return result
 
 
+@ppe_separable
+@categorical_aware
 def proximity_match_strategy(date,Dt,Rt,M):
     """Proximity-matching strategy. For each ppe, match each donor with the closest recipient
 
@@ -78,7 +81,11 @@ def proximity_match_strategy(date,Dt,Rt,M):
                 break # if we don't have any more recipient with this ppe, consider the next ppe
 
             # find the closest recipient to drow.don_id
-            dr = M[(M.don_id == drow.don_id)].merge(recipients_ppe,on='rec_id').sort_values('distance').iloc[0]
+            candidates = M[(M.don_id == drow.don_id)].merge(recipients_ppe,on='rec_id')
+            if len(candidates) == 0:
+                logger.warning(f'donor {drow.don_id} has no distance to any recipient of {ppe}')
+                continue
+            dr = candidates.sort_values('distance').iloc[0]
             dqty = drow.qty # donor's qty
             rqty = recipients_ppe.loc[recipients_ppe.rec_id == dr.rec_id,'qty'].values[0] #recipient's qty
             qty = min(dqty,rqty) #qty to ship
@@ -91,3 +98,184 @@ def proximity_match_strategy(date,Dt,Rt,M):
             result.loc[len(result),:] = [dr.don_id, dr.rec_id,ppe,qty]
 
     return result
+
+
+@ppe_separable
+@categorical_aware
+def fast_proximity_match_strategy(date,Dt,Rt,M):
+    """Vectorized version of the proximity-matching strategy, which makes the same decisions as proximity_match_strategy.
+    The candidate recipients of each donor are sorted by distance once; then the donors walk their sorted list,
+    skipping the recipients that have already been removed
+
+    :param date: the current date
+    :type date: date
+    :param Dt: current donor requests (don_id,date,ppe,qty)
+    :type Dt: pandas.DataFrame
+    :param Rt: current recipient requests (rec_id,date,ppe,qty)
+    :type Rt: pandas.DataFrame
+    :param M: distance matrix M
+    :type M: pandas.DataFrame
+    :return: the list of decisions made
+    :rtype: pandas.DataFrame (don_id,rec_id,ppe,qty)
+    """
+    rows = []
+    ppes_to_consider = set(Dt.ppe.unique())
+    ppes_to_consider = ppes_to_consider.intersection(set(Rt.ppe.unique()))
+
+    m_don = M.don_id.values
+    m_rec = M.rec_id.values
+    m_dist = M.distance.values
+    for ppe in ppes_to_consider:
+        donors_ppe = Dt[Dt.ppe == ppe]
+        recipients_ppe = Rt[Rt.ppe == ppe]
+        rec_ids = recipients_ppe.rec_id.values
+        don_ids = donors_ppe.don_id.values
+
+        # remaining qty of each recipient and removal bitmap
+        rem_qty = recipients_ppe.qty.values.copy()
+        removed = np.zeros(len(rec_ids), dtype=bool)
+        n_removed = 0
+
+        # candidate pairs of this ppe (position of the donor in donors_ppe, position of the recipient in recipients_ppe), in the order of M
+        cand_don = pd.Index(don_ids).get_indexer(m_don)
+        cand_rec = pd.Index(rec_ids).get_indexer(m_rec)
+        cand = np.flatnonzero((cand_don >= 0) & (cand_rec >= 0))
+        cand_don, cand_rec, cand_dist = cand_don[cand], cand_rec[cand], m_dist[cand]
+
+        # sort the candidates of each donor by distance (ties and NaN in the order of M)
+        order = np.lexsort((cand_dist, cand_don))
+        cand_rec, cand_dist = cand_rec[order], cand_dist[order]
+        bounds = np.searchsorted(cand_don[order], np.arange(len(don_ids) + 1))
+
+        for i, dqty in enumerate(donors_ppe.qty.tolist()):
+            if n_removed == len(rec_ids):
+                break # if we don't have any more recipient with this ppe, consider the next ppe
+
+            # find the closest recipient to the i-th donor
+            lo, hi = bounds[i], bounds[i + 1]
+            alive = np.flatnonzero(~removed[cand_rec[lo:hi]])
+            if len(alive) == 0:
+                logger.warning(f'donor {don_ids[i]} has no distance to any recipient of {ppe}')
+                continue
+            first = lo + alive[0]
+            if len(alive) > 1 and cand_dist[lo + alive[1]] == cand_dist[first]:
+                # tie: break it as sort_values('distance') does on the candidates in the order of M
+                m_rows = cand[order[lo + alive]]
+                first = lo + alive[np.argmax(m_rows == _first_by_distance(m_rows, m_dist))]
+            r = cand_rec[first]
+
+            rqty = rem_qty[r] #recipient's qty
+            qty = min(dqty,rqty) #qty to ship
+            if qty == 0:
+                logger.info('qty is zero')
+            if qty == rqty:
+                removed[r] = True # remove recipient
+                n_removed += 1
+            else:
+                rem_qty[r] -= qty #update recipient's qty
+            rows.append([don_ids[i], rec_ids[r], ppe, qty])
+
+    return pd.DataFrame(rows, columns=['don_id','rec_id','ppe','qty'], dtype=object)
+
+
+def _first_by_distance(m_rows, m_dist):
+    """row of M that comes first when the rows m_rows of M are sorted by distance with sort_values (quicksort, NaN last)"""
+    m_rows = np.sort(m_rows)
+    dist = m_dist[m_rows]
+    non_nan = np.flatnonzero(~pd.isna(dist))
+    if len(non_nan) == 0:
+        return m_rows[0]
+    return m_rows[non_nan[dist[non_nan].argsort(kind='quicksort')[0]]]
+
+
+class TransportationStrategy:
+    """Optimal strategy. For each ppe, solve the transportation problem defined by D^t, R^t, and M:
+    maximize the units shipped and, among the maximum shipments, minimize the unit-miles.
+    With warm_start, the potentials (dual prices) of the recipients of each ppe are kept between
+    calls and seed the potentials of the next period. The solution still starts from zero flow,
+    so the warm start does not save augmentations and is usually not faster
+
+    :param solver: 'ssp' (successive shortest paths, NumPy only) or 'linprog' (scipy HiGHS, no warm start), defaults to 'ssp'
+    :type solver: str, optional
+    :param warm_start: whether to seed each solution with the potentials of the previous period, defaults to False. The potentials are lost when the framework solves the ppes in a pool of processes (ppe_executor='process'), which logs a warning
+    :type warm_start: bool, optional
+    """
+    ppe_separable = True
+    categorical_aware = True
+
+    def __init__(self, solver='ssp', warm_start=False):
+        if solver not in ('ssp', 'linprog'):
+            raise ValueError(f'Unknown solver {solver}. Available solvers: ssp, linprog')
+        if solver == 'linprog' and transportation.linprog is None:
+            raise ImportError('the linprog solver requires scipy')
+        self.__name__ = 'transportation_strategy'
+        self.solver = solver
+        self.warm_start = warm_start
+        self.potentials = {} # ppe -> potentials of the recipients (pandas.Series indexed by rec_id)
+
+    @property
+    def stateful(self):
+        """Whether the strategy keeps the potentials between periods (see decomposition.is_stateful)"""
+        return self.warm_start and self.solver == 'ssp'
+
+    def reset(self):
+        """Forget the potentials of the previous periods"""
+        self.potentials = {}
+
+    def __call__(self, date, Dt, Rt, M):
+        """Solve the matching problem of the current period
+
+        :param date: the current date
+        :type date: date
+        :param Dt: current donor requests (don_id,date,ppe,qty)
+        :type Dt: pandas.DataFrame
+        :param Rt: current recipient requests (rec_id,date,ppe,qty)
+        :type Rt: pandas.DataFrame
+        :param M: distance matrix M
+        :type M: pandas.DataFrame
+        :return: the list of decisions made
+        :rtype: pandas.DataFrame (don_id,rec_id,ppe,qty)
+        """
+        rows = []
+        ppes_to_consider = set(Dt.ppe.unique())
+        ppes_to_consider = ppes_to_consider.intersection(set(Rt.ppe.unique()))
+
+        # codes of the donors and recipients of each row of M
+        don_index = pd.Index(Dt.don_id.unique())
+        rec_index = pd.Index(Rt.rec_id.unique())
+        m_don = don_index.get_indexer(M.don_id)
+        m_rec = rec_index.get_indexer(M.rec_id)
+        m_dist = M.distance.values.astype(np.float64)
+
+        for ppe in ppes_to_consider:
+            donors_ppe = Dt[Dt.ppe == ppe]
+            recipients_ppe = Rt[Rt.ppe == ppe]
+            don_ids = donors_ppe.don_id.values
+            rec_ids = recipients_ppe.rec_id.values
+
+            # cost matrix: position in donors_ppe x position in recipients_ppe
+            don_pos = np.full(len(don_index), -1)
+            don_pos[don_index.get_indexer(don_ids)] = np.arange(len(don_ids))
+            rec_pos = np.full(len(rec_index), -1)
+            rec_pos[rec_index.get_indexer(rec_ids)] = np.arange(len(rec_ids))
+            i = np.where(m_don >= 0, don_pos[m_don], -1)
+            j = np.where(m_rec >= 0, rec_pos[m_rec], -1)
+            known = (i >= 0) & (j >= 0) & ~np.isnan(m_dist)
+            cost = np.full((len(don_ids), len(rec_ids)), np.inf)
+            cost[i[known], j[known]] = m_dist[known]
+
+            supply = donors_ppe.qty.values.astype(np.float64)
+            demand = recipients_ppe.qty.values.astype(np.float64)
+            if self.solver == 'linprog':
+                x = transportation.solve_linprog(supply, demand, cost)
+            else:
+                warm = None
+                if self.warm_start and ppe in self.potentials:
+                    warm = self.potentials[ppe].reindex(rec_ids).values
+                x, potentials = transportation.solve_ssp(supply, demand, cost, warm)
+                self.potentials[ppe] = pd.Series(potentials, index=rec_ids)
+
+            for d, r in zip(*np.nonzero(x > 0)):
+                rows.append([don_ids[d], rec_ids[r], ppe, x[d, r]])
+
+        return pd.DataFrame(rows, columns=['don_id','rec_id','ppe','qty'])
@@ -0,0 +1,218 @@
+"""Module defining the streaming (online) mode of the testing framework.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+In the streaming mode the donor and recipient requests are not read from the tables of
+the framework, but received in batches from a feed (an iterator or an async generator).
+The clock advances by the interval of the framework: when a batch with a date past the
+end of the current period is received, the matching problem of the period is solved with
+the strategy of the framework, and its granular decisions are yielded immediately. Only
+the pending requests and the requests of the current period are kept in memory.
+
+The batches must be in chronological order: the requests of a batch must not be older
+than the requests of the previous batches. With this assumption, replaying the tables
+D and R as a stream (see replay) gives the same decisions as TestingFramework.run.
+"""
+
+import pandas as pd
+import datetime
+
+from . import engines
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StreamingEngine(engines.PandasEngine):
+	""" Engine of the PandasEngine family whose requests are received in batches. The
+	received requests wait in a buffer until the period they belong to is solved
+	"""
+	def __init__(self):
+		# buffers of the received requests that were not added to the pending requests yet
+		self.all_donors = None
+		self.all_recipients = None
+		self.cur_donors = None
+		self.cur_recipients = None
+		self._n_received = 0
+
+	def receive(self, donors, recipients):
+		"""Add a batch of requests to the buffers
+
+		:param donors: the donor requests of the batch (don_id,date,ppe,qty), or None
+		:type donors: pandas.DataFrame
+		:param recipients: the recipient requests of the batch (rec_id,date,ppe,qty), or None
+		:type recipients: pandas.DataFrame
+		"""
+		self.all_donors = self._append(self.all_donors, donors)
+		self.all_recipients = self._append(self.all_recipients, recipients)
+
+	def _append(self, buffer, batch):
+		if batch is None or len(batch) == 0:
+			return buffer
+		# the rows of the pending requests are identified by their index, which must be unique
+		batch = batch.set_axis(range(self._n_received, self._n_received + len(batch)))
+		self._n_received += len(batch)
+		return batch if buffer is None else pd.concat([buffer, batch])
+
+	def add_requests(self, d1, d2):
+		"""Move the requests received strictly between d1 and d2 from the buffers to the pending requests"""
+		self.cur_recipients, self.all_recipients = self._take(self.cur_recipients, self.all_recipients, d1, d2)
+		self.cur_donors, self.all_donors = self._take(self.cur_donors, self.all_donors, d1, d2)
+
+	def _take(self, cur, buffer, d1, d2):
+		if buffer is None:
+			return cur, buffer
+		if cur is None:
+			cur = buffer.drop(index=buffer.index)
+		late = buffer.date < d1
+		if late.any():
+			logger.warning(f'{late.sum()} requests received after the end of their period are added to the period ending at {d2}')
+		# as in TestingFramework.run, the requests made exactly at the end of a period are ignored
+		cur = pd.concat([cur, buffer.loc[late | ((buffer.date > d1) & (buffer.date < d2))].copy()])
+		return cur, buffer.loc[buffer.date > d2]
+
+	def aggregate(self):
+		"""Aggregate the pending requests by (id,ppe)
+
+		:return: the tables D^t (don_id,ppe,date,qty) and R^t (rec_id,ppe,date,qty)
+		:rtype: tuple of pandas.DataFrame
+		"""
+		if self.cur_donors is None or self.cur_recipients is None:
+			# no donor or no recipient request received yet
+			return pd.DataFrame(columns=['don_id', 'ppe', 'date', 'qty']), pd.DataFrame(columns=['rec_id', 'ppe', 'date', 'qty'])
+		return super().aggregate()
+
+
+class StreamingMatcher:
+	""" Class that solves the matching problem on a stream of request batches, with the
+	strategy, interval, max_donation_qty, and distance matrix of a TestingFramework
+	"""
+	def __init__(self, framework):
+		"""Initialize the matcher with an empty stream
+
+		:param framework: the framework whose strategy, interval, max_donation_qty, and distance matrix are used
+		:type framework: TestingFramework
+		"""
+		self.framework = framework
+		self.state = StreamingEngine()
+		self.d1 = None  # start of the current period, None until the first request is received
+		self.d2 = None  # end of the current period
+		self.last_date = None  # date of the latest request received
+		self.closed = False
+
+	def push(self, donors=None, recipients=None):
+		"""Receive a batch of requests and solve the periods that ended before its latest request
+
+		:param donors: the donor requests of the batch (don_id,date,ppe,qty), defaults to None
+		:type donors: pandas.DataFrame, optional
+		:param recipients: the recipient requests of the batch (rec_id,date,ppe,qty), defaults to None
+		:type recipients: pandas.DataFrame, optional
+		:return: the granular decisions of each period solved
+		:rtype: list of pandas.DataFrame
+		"""
+		if self.closed:
+			raise RuntimeError('The stream is closed')
+		if donors is not None:
+			donors = donors[donors.qty <= self.framework.max_donation_qty]
+		dates = [batch.date for batch in [donors, recipients] if batch is not None and len(batch) > 0]
+		if not dates:
+			return []
+		first = min(d.min() for d in dates)
+		last = max(d.max() for d in dates)
+		if self.d1 is None:
+			# the clock starts one minute before the first request, as in TestingFramework.run
+			self.d1 = first - datetime.timedelta(minutes=1)
+			self.d2 = self.d1 + datetime.timedelta(days=self.framework.interval)
+		if self.last_date is not None and first < self.last_date:
+			logger.warning(f'The batch contains requests older than the previous batches ({first} < {self.last_date})')
+		self.last_date = last if self.last_date is None else max(self.last_date, last)
+		self.state.receive(donors, recipients)
+
+		# the next batches have no requests before last_date, so all the periods ending by then can be solved
+		result = []
+		while self.d2 <= self.last_date:
+			result.extend(self._solve(self.d2))
+		return result
+
+	def close(self):
+		"""Signal the end of the stream and solve the last periods
+
+		:return: the granular decisions of each period solved
+		:rtype: list of pandas.DataFrame
+		"""
+		self.closed = True
+		if self.d1 is None:
+			return []
+		result = []
+		max_date = self.last_date + datetime.timedelta(minutes=1)
+		while self.d2 <= max_date:
+			result.extend(self._solve(self.d2))
+		result.extend(self._solve(max_date + datetime.timedelta(minutes=2)))
+		self.framework.close_ppe_pool()
+		self.framework.close_output()
+		return result
+
+	def _solve(self, d2):
+		logger.info(f'===== From {self.d1} to {d2} ======')
+		self.framework.profiler.start_period(d2)
+		granular_decisions = self.framework.solve_period(self.state, self.d1, d2)
+		self.framework.profiler.end_period()
+		self.d1 = d2
+		self.d2 = d2 + datetime.timedelta(days=self.framework.interval)
+		return [granular_decisions] if granular_decisions is not None else []
+
+
+def stream_decisions(framework, batches):
+	"""Solve the matching problem on a stream of request batches
+
+	:param framework: the framework whose strategy, interval, max_donation_qty, and distance matrix are used
+	:type framework: TestingFramework
+	:param batches: the batches (donors,recipients) of requests, in chronological order; either table can be None
+	:type batches: iterable of tuples (pandas.DataFrame, pandas.DataFrame)
+	:return: the granular decisions (don_id,rec_id,ppe,date,qty,holding_time,distance) of each period, as soon as they are made
+	:rtype: generator of pandas.DataFrame
+	"""
+	matcher = StreamingMatcher(framework)
+	for donors, recipients in batches:
+		yield from matcher.push(donors, recipients)
+	yield from matcher.close()
+
+
+async def astream_decisions(framework, batches):
+	"""Solve the matching problem on an asynchronous stream of request batches, see stream_decisions
+
+	:param framework: the framework whose strategy, interval, max_donation_qty, and distance matrix are used
+	:type framework: TestingFramework
+	:param batches: the batches (donors,recipients) of requests, in chronological order; either table can be None
+	:type batches: async iterable of tuples (pandas.DataFrame, pandas.DataFrame)
+	:return: the granular decisions (don_id,rec_id,ppe,date,qty,holding_time,distance) of each period, as soon as they are made
+	:rtype: async generator of pandas.DataFrame
+	"""
+	matcher = StreamingMatcher(framework)
+	async for donors, recipients in batches:
+		for granular_decisions in matcher.push(donors, recipients):
+			yield granular_decisions
+	for granular_decisions in matcher.close():
+		yield granular_decisions
+
+
+def replay(donors, recipients, freq='1D'):
+	"""Replay the tables D and R as a stream of batches, e.g., to test the streaming mode
+
+	:param donors: the table D of donor requests (don_id,date,ppe,qty)
+	:type donors: pandas.DataFrame
+	:param recipients: the table R of recipient requests (rec_id,date,ppe,qty)
+	:type recipients: pandas.DataFrame
+	:param freq: the time span of each batch, defaults to '1D'
+	:type freq: str, optional
+	:return: the batches (donors,recipients) of the requests made in each time span, in chronological order
+	:rtype: generator of tuples (pandas.DataFrame, pandas.DataFrame)
+	"""
+	donors = donors.sort_values('date', kind='stable')
+	recipients = recipients.sort_values('date', kind='stable')
+	don_span = donors.date.dt.floor(freq)
+	rec_span = recipients.date.dt.floor(freq)
+	for span in sorted(set(don_span).union(rec_span)):
+		yield donors[don_span == span], recipients[rec_span == span]
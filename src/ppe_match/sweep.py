@@ -0,0 +1,178 @@
+"""Module defining the parallel parameter sweep over strategies, intervals, and max_donation_qty.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+The data (donors, recipients, distance matrix) are loaded once by the TestingFramework
+passed to run_sweep, before the runs start. The worker processes are forked after the data are loaded, so they
+share its memory pages copy-on-write instead of receiving a pickled copy for each run.
+On platforms without fork, or when this process runs other threads (see can_fork), the workers
+are spawned, and each worker receives the data once, when it starts.
+"""
+
+import pandas as pd
+import collections
+import copy
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from . import profiling
+
+import logging
+logger = logging.getLogger(__name__)
+
+CONFIGURATION_COLUMNS = ['strategy', 'interval', 'max_donation_qty']
+
+# framework and grid of the current sweep, inherited by the forked workers
+_framework = None
+_grid = None
+
+
+def parameter_grid(strategies, intervals, max_donation_qtys):
+	"""All the combinations (strategy, interval, max_donation_qty)
+
+	:param strategies: the strategies to test
+	:type strategies: list of functions
+	:param intervals: the intervals to test
+	:type intervals: list of int
+	:param max_donation_qtys: the values of max_donation_qty to test
+	:type max_donation_qtys: list of int
+	:return: the grid of configurations
+	:rtype: list of tuples (strategy, interval, max_donation_qty)
+	"""
+	return list(itertools.product(strategies, intervals, max_donation_qtys))
+
+
+def can_fork():
+	"""Whether the worker processes can be forked: fork is available and this process runs no other
+	thread. A forked worker inherits the locks held by the threads of its parent (e.g., the writer of
+	the files of a framework, or a pool of threads of the ppe subproblems) without the threads that
+	would release them, and can wait for them forever
+	"""
+	return 'fork' in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+
+
+def run_configuration(framework, strategy, interval, max_donation_qty):
+	"""Run a copy of the framework with the given configuration
+
+	:return: the metrics and the decisions of the run
+	:rtype: tuple of pandas.DataFrame
+	"""
+	s = _run(framework, strategy, interval, max_donation_qty)
+	return s.get_metrics(), s.get_decisions()
+
+
+def _run(framework, strategy, interval, max_donation_qty):
+	"""Run a copy of the framework with the given configuration, and return the copy"""
+	s = copy.copy(framework)
+	# strategies with a state (e.g., warm starts) must not be shared between runs
+	s.set_strategy(copy.deepcopy(strategy))
+	s.set_interval(interval)
+	s.set_max_donation_qty(max_donation_qty)
+	s.run()
+	if hasattr(s.strategy, 'stats'):
+		# memoized strategy (see the module memo)
+		logger.info(f'{_strategy_name(strategy)}, interval {interval}, max_donation_qty {max_donation_qty}: {s.strategy.stats()}')
+	return s
+
+
+def _init_worker(framework, grid):
+	global _framework, _grid
+	_framework = framework
+	_grid = grid
+
+
+def _run_task(k, return_decisions, return_timings):
+	strategy, interval, max_donation_qty = _grid[k]
+	s = _run(_framework, strategy, interval, max_donation_qty)
+	return k, s.get_metrics(), s.get_decisions() if return_decisions else None, s.get_timings() if return_timings else None
+
+
+def run_sweep(framework, grid, max_workers=None, return_decisions=False, return_timings=False):
+	"""Run the framework once for each configuration of the grid, in parallel
+
+	:param framework: the framework with the data to use; its strategy, interval and max_donation_qty are ignored
+	:type framework: TestingFramework
+	:param grid: the configurations (strategy, interval, max_donation_qty) to run, e.g., as returned by parameter_grid
+	:type grid: list of tuples
+	:param max_workers: the number of worker processes, defaults to the number of CPUs. With max_workers=1 the runs are executed in this process
+	:type max_workers: int, optional
+	:param return_decisions: whether to return also the decisions of each run, defaults to False
+	:type return_decisions: bool, optional
+	:param return_timings: whether to return also the timings of each run, which are empty unless the framework profiles its runs (profile=True), defaults to False
+	:type return_timings: bool, optional
+	:raises ValueError: if two configurations have the same strategy name, interval, and max_donation_qty
+	:return: the metrics of all runs (strategy,interval,max_donation_qty,metric_name,description,value), then, if return_decisions, the decisions of all runs keyed by configuration, and, if return_timings, the timings of all runs (strategy,interval,max_donation_qty,date,phase,seconds,allocated_bytes)
+	:rtype: pandas.DataFrame, or tuple (pandas.DataFrame, dict and/or pandas.DataFrame)
+	"""
+	global _framework, _grid
+	grid = list(grid)
+	# the runs are identified by the name of their strategy (see _strategy_name)
+	keys = [(_strategy_name(strategy), interval, max_donation_qty) for strategy, interval, max_donation_qty in grid]
+	repeated = [key for key, count in collections.Counter(keys).items() if count > 1]
+	if repeated:
+		raise ValueError(f'The configurations of the grid must have different (strategy name, interval, max_donation_qty): {repeated} '
+						 f'are repeated. Give the strategies different names with their attribute __name__')
+	# the copies of the framework made by the runs share the data read here
+	framework.load()
+	if max_workers is None:
+		max_workers = os.cpu_count() or 1
+	max_workers = min(max_workers, len(grid)) if len(grid) > 0 else 1
+
+	results = [None] * len(grid)
+	if max_workers <= 1:
+		for k in range(len(grid)):
+			_init_worker(framework, grid)
+			results[k] = _run_task(k, return_decisions, return_timings)[1:]
+	else:
+		if can_fork():
+			# the forked workers inherit the framework and the grid without pickling them
+			_framework, _grid = framework, grid
+			pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+		else:
+			pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+									   initializer=_init_worker, initargs=(framework, grid))
+		try:
+			with pool:
+				futures = [pool.submit(_run_task, k, return_decisions, return_timings) for k in range(len(grid))]
+				for future in futures:
+					k, metrics, decisions, timings = future.result()
+					results[k] = (metrics, decisions, timings)
+					logger.info(f'Sweep: configuration {k + 1} of {len(grid)} completed')
+		finally:
+			_framework, _grid = None, None
+
+	all_metrics = []
+	all_decisions = {}
+	all_timings = []
+	for (strategy, interval, max_donation_qty), (metrics, decisions, timings) in zip(grid, results):
+		key = (_strategy_name(strategy), interval, max_donation_qty)
+		all_metrics.append(_with_configuration(metrics, key))
+		all_decisions[key] = decisions
+		if return_timings:
+			all_timings.append(_with_configuration(timings, key))
+	result = pd.concat(all_metrics, ignore_index=True) if all_metrics else \
+				pd.DataFrame(columns=CONFIGURATION_COLUMNS + ['metric_name', 'description', 'value'])
+	returned = [result]
+	if return_decisions:
+		returned.append(all_decisions)
+	if return_timings:
+		returned.append(pd.concat(all_timings, ignore_index=True) if all_timings else
+						pd.DataFrame(columns=CONFIGURATION_COLUMNS + profiling.TIMINGS_COLUMNS))
+	return tuple(returned) if len(returned) > 1 else result
+
+
+def _with_configuration(frame, key):
+	"""Copy of the table with the columns (strategy,interval,max_donation_qty) first"""
+	frame = frame.copy()
+	for column, value in zip(CONFIGURATION_COLUMNS, key):
+		frame.insert(CONFIGURATION_COLUMNS.index(column), column, value)
+	return frame
+
+
+def _strategy_name(strategy):
+	return getattr(strategy, '__name__', type(strategy).__name__)
@@ -0,0 +1,142 @@
+"""Module defining a generator of synthetic instances of the PPE matching problem.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+An instance has the same format as the GetUsPPE.org data set: the table D of donor
+requests (don_id,date,ppe,qty), the table R of recipient requests (rec_id,date,ppe,qty),
+and the distance matrix M (don_id,rec_id,distance) between all donors and recipients.
+Donors and recipients are located around a center point, and their distances are
+great-circle distances in miles. The same seed always generates the same instance.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+
+from .spatial import EARTH_RADIUS_MILES, haversine_miles
+
+import logging
+logger = logging.getLogger(__name__)
+
+# geographic center of the contiguous United States (lat,lon)
+CENTER = (39.83, -98.58)
+
+
+def _arrival_days(rng, arrival, n_days, size):
+	"""Day (float, from 0 to n_days) of each request"""
+	if callable(arrival):
+		days = np.asarray(arrival(rng, size), dtype=np.float64)
+	elif arrival == 'uniform':
+		days = rng.uniform(0, n_days, size)
+	elif arrival == 'decreasing':
+		# most requests at the beginning, as in the first weeks of the pandemic
+		days = rng.exponential(n_days / 4, size)
+	elif arrival == 'peak':
+		# requests concentrated around the middle of the horizon
+		days = rng.normal(n_days / 2, n_days / 6, size)
+	else:
+		raise ValueError(f'Unknown arrival distribution {arrival}. Available: uniform, decreasing, peak, or a function')
+	return np.clip(days, 0, np.nextafter(n_days, 0))
+
+
+def _requests(rng, id_prefix, n_ids, requests_per_id, n_ppes, n_days, arrival, qty_mean, start):
+	n_requests = 1 + rng.poisson(requests_per_id - 1, n_ids) if requests_per_id > 1 else np.ones(n_ids, dtype=int)
+	ids = np.repeat(np.arange(n_ids), n_requests)
+	# a few ppes are requested much more often than the others
+	popularity = 1 / np.arange(1, n_ppes + 1)
+	ppes = rng.choice(n_ppes, size=len(ids), p=popularity / popularity.sum())
+	minutes = np.floor(_arrival_days(rng, arrival, n_days, len(ids)) * 24 * 60).astype(np.int64)
+	qty = np.maximum(1, np.round(rng.lognormal(np.log(qty_mean), 1.0, len(ids))))
+	requests = pd.DataFrame({
+		f'{id_prefix}_id': np.array([f'{id_prefix}{i}' for i in range(n_ids)], dtype=object)[ids],
+		'date': pd.Timestamp(start, tz='UTC') + pd.to_timedelta(minutes, unit='m'),
+		'ppe': np.array([f'ppe{p}' for p in range(n_ppes)], dtype=object)[ppes],
+		'qty': qty,
+	})
+	return requests.sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def _locations(rng, n, spread):
+	lat = np.clip(CENTER[0] + rng.normal(0, spread, n), -89.9, 89.9)
+	lon = CENTER[1] + rng.normal(0, spread, n)
+	return lat, lon
+
+
+def generate_instance(n_donors=100, n_recipients=300, n_ppes=5, n_days=60,
+						donor_requests=2.0, recipient_requests=3.0,
+						arrival='uniform', spread=8.0, seed=0, start='2020-04-01', locations=False):
+	"""Generate a random instance of the PPE matching problem
+
+	:param n_donors: the number of donors, defaults to 100
+	:type n_donors: int, optional
+	:param n_recipients: the number of recipients, defaults to 300
+	:type n_recipients: int, optional
+	:param n_ppes: the number of ppe types, defaults to 5
+	:type n_ppes: int, optional
+	:param n_days: the number of days in which the requests are made, defaults to 60
+	:type n_days: int, optional
+	:param donor_requests: the average number of requests of each donor, defaults to 2.0
+	:type donor_requests: float, optional
+	:param recipient_requests: the average number of requests of each recipient, defaults to 3.0
+	:type recipient_requests: float, optional
+	:param arrival: the distribution of the dates of the requests: 'uniform', 'decreasing' (most requests at the beginning), 'peak' (most requests in the middle), or a function (rng, size) returning the day of each request, defaults to 'uniform'
+	:type arrival: str or function, optional
+	:param spread: the standard deviation (in degrees of latitude and longitude) of the locations around the center of the United States, defaults to 8.0
+	:type spread: float, optional
+	:param seed: the random seed, defaults to 0
+	:type seed: int, optional
+	:param start: the date of the first day, defaults to '2020-04-01'
+	:type start: str, optional
+	:param locations: whether to return also the locations (don_id,lat,lon) and (rec_id,lat,lon) of the donors and recipients, in degrees (see spatial.GeoDistances), defaults to False
+	:type locations: bool, optional
+	:return: the table D of donor requests (don_id,date,ppe,qty), the table R of recipient requests (rec_id,date,ppe,qty), and the distance matrix M (don_id,rec_id,distance), followed by the locations of the donors and recipients with locations=True
+	:rtype: tuple of pandas.DataFrame
+	"""
+	rng = np.random.default_rng(seed)
+	donors = _requests(rng, 'don', n_donors, donor_requests, n_ppes, n_days, arrival, 20, start)
+	recipients = _requests(rng, 'rec', n_recipients, recipient_requests, n_ppes, n_days, arrival, 200, start)
+	don_lat, don_lon = _locations(rng, n_donors, spread)
+	rec_lat, rec_lon = _locations(rng, n_recipients, spread)
+	distance = haversine_miles(np.radians(don_lat)[:, None], np.radians(don_lon)[:, None],
+								np.radians(rec_lat)[None, :], np.radians(rec_lon)[None, :])
+	don_ids = np.array([f'don{i}' for i in range(n_donors)], dtype=object)
+	rec_ids = np.array([f'rec{j}' for j in range(n_recipients)], dtype=object)
+	distance_mat = pd.DataFrame({
+		'don_id': np.repeat(don_ids, n_recipients),
+		'rec_id': np.tile(rec_ids, n_donors),
+		'distance': np.round(distance.ravel(), 4),
+	})
+	if not locations:
+		return donors, recipients, distance_mat
+	donor_locations = pd.DataFrame({'don_id': don_ids, 'lat': don_lat, 'lon': don_lon})
+	recipient_locations = pd.DataFrame({'rec_id': rec_ids, 'lat': rec_lat, 'lon': rec_lon})
+	return donors, recipients, distance_mat, donor_locations, recipient_locations
+
+
+def write_instance(directory, donors, recipients, distance_mat):
+	"""Write an instance in the format of the data set (anon_donors.csv, anon_recipients.csv, anon_distance_matrix.csv)
+
+	:return: the paths of the donor, recipient, and distance matrix files
+	:rtype: tuple of str
+	"""
+	os.makedirs(directory, exist_ok=True)
+	paths = tuple(os.path.join(directory, name) for name in ['anon_donors.csv', 'anon_recipients.csv', 'anon_distance_matrix.csv'])
+	donors.to_csv(paths[0])
+	recipients.to_csv(paths[1])
+	distance_mat.to_csv(paths[2], index=False)
+	return paths
+
+
+def write_locations(directory, donor_locations, recipient_locations):
+	"""Write the locations of an instance (anon_donor_locations.csv, anon_recipient_locations.csv), see spatial.GeoDistances.from_csv
+
+	:return: the paths of the donor and recipient location files
+	:rtype: tuple of str
+	"""
+	os.makedirs(directory, exist_ok=True)
+	paths = tuple(os.path.join(directory, name) for name in ['anon_donor_locations.csv', 'anon_recipient_locations.csv'])
+	donor_locations.to_csv(paths[0], index=False)
+	recipient_locations.to_csv(paths[1], index=False)
+	return paths
@@ -10,17 +10,24 @@ Unless required by applicable law or agreed to in writing, software distributed
 import pandas as pd
 import numpy as np
 import datetime
+import functools
 import os
 
 from . import strategies
+from . import engines
+from . import cache
+from . import profiling
+from . import pruning
+from . import decomposition
+from . import output
+from . import coding
+from .checkpoint import Checkpoint
+from .distances import DistanceMatrix
 
 import logging
 logger = logging.getLogger(__name__)
-stream_hdlr = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-stream_hdlr.setFormatter(formatter)
-logger.addHandler(stream_hdlr)
-logger.setLevel(logging.INFO)
+
+DECISION_COLUMNS = ['don_id', 'rec_id', 'ppe', 'date', 'qty', 'distance', 'holding_time']
 
 
 class TestingFramework:
@@ -32,8 +39,12 @@ class TestingFramework:
 				distance_matrix_path= "data/anon_distance_matrix.csv",
 				strategy=strategies.proximity_match_strategy,
 				interval=7, max_donation_qty=1000,
-				writeFiles=False, output_directory = 'output/'):
-		"""Initialize the framework. 
+				writeFiles=False, output_directory = 'output/',
+				engine='pandas', cache_dir=None, overall_metrics_only=False,
+				profile=False, distances=None, pruning=None, ppe_jobs=1, ppe_executor='thread',
+				checkpoint_path=None, checkpoint_every=10, output_format='directories', output_queue=8,
+				strategy_strings=None):
+		"""Initialize the framework. The data are read at their first use (see load)
 
 		:param donor_path: the file name (csv) of the table D of donor requests, defaults to 'data/anon_donors.csv'
 		:type donor_path: str, optional
@@ -51,23 +62,71 @@ class TestingFramework:
 		:type writeFiles: bool, optional
 		:param output_directory: the output directory, defaults to 'output/'
 		:type output_directory: str, optional
+		:param output_format: the layout of the files, either 'directories' (one directory of csv files for each period), 'csv' (one gzip-compressed csv file for each table, with the rows of all the periods), or 'parquet' (one parquet dataset for each table, partitioned by period; requires pyarrow), defaults to 'directories'
+		:type output_format: str, optional
+		:param output_queue: the largest number of tables waiting to be written by the background writer (see the module output); with 0, the files are written before the simulation continues, defaults to 8
+		:type output_queue: int, optional
+		:param engine: the simulation engine, either 'pandas' (the reference implementation) or 'array' (integer-coded NumPy arrays, much faster on large data sets), defaults to 'pandas'
+		:type engine: str, optional
+		:param cache_dir: directory of the binary cache of the input files (see the module cache); the csv files are parsed only the first time, defaults to None (no cache)
+		:type cache_dir: str, optional
+		:param overall_metrics_only: whether to compute only the five "overall" metrics, skipping the metrics of each recipient and ppe (e.g., in parameter sweeps), defaults to False
+		:type overall_metrics_only: bool, optional
+		:param profile: whether to record the wall time of each phase of each period (see get_timings), or a profiling.Profiler with callback hooks, defaults to False
+		:type profile: bool or profiling.Profiler, optional
+		:param distances: the distances between donors and recipients, used instead of the file distance_matrix_path (e.g., a spatial.GeoDistances that computes them from the locations when there is no distance matrix), defaults to None
+		:type distances: distances.DistanceProvider, optional
+		:param pruning: the pruning stage of the compatible pairs of each period, which keeps only the k closest recipients of each donor and/or the pairs within a maximum distance (see the module pruning), defaults to None (no pruning)
+		:type pruning: pruning.CandidatePruning, optional
+		:param ppe_jobs: the number of workers that solve the subproblems of the ppes of each period in parallel; with more than one, the periods are split by ppe if the strategy is marked as ppe-separable (see the module decomposition), defaults to 1
+		:type ppe_jobs: int, optional
+		:param ppe_executor: the pool of workers of the ppe subproblems, either 'thread' or 'process', defaults to 'thread'
+		:type ppe_executor: str, optional
+		:param checkpoint_path: the file where run writes the checkpoints of the loop (see the module checkpoint and resume); with '{period}' in the name, each checkpoint is written into a new file, defaults to None (no checkpoints)
+		:type checkpoint_path: str, optional
+		:param checkpoint_every: the number of periods between two checkpoints, defaults to 10
+		:type checkpoint_every: int, optional
+		:param strategy_strings: whether the strategy receives the ids and ppes of D^t, R^t, and M as strings instead of categorical codes (see the module coding), defaults to None: as strings, unless the strategy is marked as categorical-aware (see coding.categorical_aware)
+		:type strategy_strings: bool or None, optional
 		"""
-		# Data
-		dirname = os.path.dirname(__file__)
-		self.all_donors = pd.read_csv(os.path.join(dirname, donor_path),parse_dates=['date'],index_col=0)
-		self.all_recipients = pd.read_csv(os.path.join(dirname, recipient_path),parse_dates=['date'],index_col=0)
-		self.distance_mat = pd.read_csv(os.path.join(dirname, distance_matrix_path))
+		# Data, read at their first use (see load)
+		self.cache_dir = cache_dir
+		self.donor_path = self.recipient_path = self.distance_matrix_path = None
+		self._all_donors = self._all_recipients = self._distances = None
+		self.set_data(donor_path, recipient_path, distance_matrix_path, distances)
 		# Initialize dataframes
-		self.all_granular_decisions = pd.DataFrame(columns=['don_id', 'rec_id', 'ppe','date', 'qty', 'distance', 'holding_time'])
+		self.all_granular_decisions = pd.DataFrame(columns=DECISION_COLUMNS)
 		self.metrics = None
 
 		# Strategy
 		self.strategy = strategy
 		self.interval = interval
 		self.max_donation_qty = max_donation_qty
+		self.set_engine(engine)
+		self.overall_metrics_only = overall_metrics_only
+		self.set_profile(profile)
+		self.pruning = pruning
+		self._ppe_pool = None
+		self.set_ppe_jobs(ppe_jobs, ppe_executor)
+		self.checkpoint_path = checkpoint_path
+		self.checkpoint_every = checkpoint_every
+		self.strategy_strings = strategy_strings
 		# Misc
 		self.writeFiles = writeFiles
 		self.output_directory = output_directory
+		if output_format not in output.WRITERS:
+			raise ValueError(f'Unknown output_format {output_format}. Available: {list(output.WRITERS)}')
+		self.output_format = output_format
+		self.output_queue = output_queue
+		self._output = None
+
+	def __getstate__(self):
+		# the copies and pickles of the framework (e.g., for the workers of a sweep) do not share its
+		# pool of ppe workers and its writer of the files, and their threads: they start their own
+		state = self.__dict__.copy()
+		state['_ppe_pool'] = None
+		state['_output'] = None
+		return state
 
 	# ----------------
 	# Getter Functions
@@ -82,6 +141,60 @@ class TestingFramework:
 	def get_max_donation_qty(self):
 		return self.max_donation_qty
 
+	def get_engine(self):
+		return self.engine
+
+	def get_overall_metrics_only(self):
+		return self.overall_metrics_only
+
+	def get_pruning(self):
+		return self.pruning
+
+	def get_ppe_jobs(self):
+		return self.ppe_jobs
+
+	@property
+	def all_donors(self):
+		"""The table D of donor requests (don_id,date,ppe,qty), with the ids and ppes coded (see the module coding)"""
+		if self._all_donors is None:
+			self._load_requests()
+		return self._all_donors
+
+	@all_donors.setter
+	def all_donors(self, all_donors):
+		self._all_donors = all_donors
+
+	@property
+	def all_recipients(self):
+		"""The table R of recipient requests (rec_id,date,ppe,qty), with the ids and ppes coded (see the module coding)"""
+		if self._all_recipients is None:
+			self._load_requests()
+		return self._all_recipients
+
+	@all_recipients.setter
+	def all_recipients(self, all_recipients):
+		self._all_recipients = all_recipients
+
+	@property
+	def distances(self):
+		"""The distances between donors and recipients M (a distances.DistanceProvider)"""
+		if self._distances is None:
+			self._load_distances()
+		return self._distances
+
+	@distances.setter
+	def distances(self, distances):
+		self._distances = distances
+
+	@property
+	def distance_mat(self):
+		"""DataFrame view (don_id,rec_id,distance) of the distance matrix M (all the pairs of a spatial.GeoDistances)"""
+		return self.distances.to_frame()
+
+	@distance_mat.setter
+	def distance_mat(self, distance_mat):
+		self.distances = DistanceMatrix.from_frame(distance_mat)
+
 
 	# ----------------
 	# Setter Functions
@@ -96,16 +209,144 @@ class TestingFramework:
 	def set_max_donation_qty(self, max_donation_qty):
 		self.max_donation_qty = max_donation_qty
 
+	def set_engine(self, engine):
+		if engine not in engines.ENGINES:
+			raise ValueError(f'Unknown engine {engine}. Available engines: {list(engines.ENGINES)}')
+		self.engine = engine
+
+	def set_overall_metrics_only(self, overall_metrics_only):
+		self.overall_metrics_only = overall_metrics_only
+
+	def set_profile(self, profile):
+		if isinstance(profile, bool) or profile is None:
+			self.profiler = profiling.Profiler() if profile else profiling.NULL_PROFILER
+		else:
+			self.profiler = profile
+
+	def set_pruning(self, pruning):
+		self.pruning = pruning
+
+	def set_ppe_jobs(self, ppe_jobs, ppe_executor=None):
+		if ppe_executor is None:
+			ppe_executor = self.ppe_executor
+		if ppe_executor not in decomposition.EXECUTORS:
+			raise ValueError(f'Unknown ppe_executor {ppe_executor}. Available: {list(decomposition.EXECUTORS)}')
+		self.close_ppe_pool()
+		self.ppe_jobs = ppe_jobs
+		self.ppe_executor = ppe_executor
+
+	def set_data(self, donor_path=None, recipient_path=None, distance_matrix_path=None, distances=None):
+		"""Replace the data of the framework. The files are read at the first use of the data (see load)
+
+		:param donor_path: the file name (csv) of the table D of donor requests, defaults to None (unchanged)
+		:type donor_path: str, optional
+		:param recipient_path: the file name (csv) of the table R of recipient requests, defaults to None (unchanged)
+		:type recipient_path: str, optional
+		:param distance_matrix_path: the file name (csv) of the distance matrix M, defaults to None (unchanged)
+		:type distance_matrix_path: str, optional
+		:param distances: the distances between donors and recipients, used instead of the file distance_matrix_path, defaults to None
+		:type distances: distances.DistanceProvider, optional
+		"""
+		dirname = os.path.dirname(__file__)
+		if donor_path is not None or recipient_path is not None:
+			# D and R are coded together (the dictionary of the ppes is shared), so both are read again
+			self.donor_path = os.path.join(dirname, donor_path) if donor_path is not None else self.donor_path
+			self.recipient_path = os.path.join(dirname, recipient_path) if recipient_path is not None else self.recipient_path
+			self._all_donors = self._all_recipients = None
+		if distance_matrix_path is not None:
+			self.distance_matrix_path = os.path.join(dirname, distance_matrix_path)
+			self._distances = None
+		if distances is not None:
+			self._distances = distances
+
+	def load(self):
+		"""Read the data now instead of at their first use, e.g., before the framework is copied into worker
+		processes, so that they share the data. The data read from the same files are shared by the frameworks
+		of this process
+
+		:return: the framework
+		:rtype: TestingFramework
+		"""
+		if self._all_donors is None or self._all_recipients is None:
+			self._load_requests()
+		if self._distances is None:
+			self._load_distances()
+		return self
+
+	def _load_requests(self):
+		# the ids and ppes are coded once, and decoded by get_decisions
+		all_donors, all_recipients = _read_requests(_file_key(self.donor_path), _file_key(self.recipient_path), self.cache_dir)
+		if self._all_donors is None:
+			self._all_donors = all_donors
+		if self._all_recipients is None:
+			self._all_recipients = all_recipients
+
+	def _load_distances(self):
+		self._distances = _read_distances(_file_key(self.distance_matrix_path), self.cache_dir)
+
+	def set_checkpoint(self, checkpoint_path, checkpoint_every=None):
+		self.checkpoint_path = checkpoint_path
+		if checkpoint_every is not None:
+			self.checkpoint_every = checkpoint_every
+
+	def open_output(self, append=False):
+		"""Open the writer of the files (writeFiles=True), which is closed by close_output
+
+		:param append: whether to append to the files of a previous run (e.g., when resuming it), defaults to False
+		:type append: bool, optional
+		"""
+		self.close_output()
+		self._output = output.open_writer(self.output_directory, self.output_format, self.output_queue, append)
+		return self._output
+
+	def close_output(self):
+		"""Wait for the files to be written and close the writer, if any"""
+		if self._output is not None:
+			writer, self._output = self._output, None
+			writer.close()
+
+	def close_ppe_pool(self):
+		"""Shut down the workers of the ppe subproblems, if any (they are started again when needed)"""
+		if self._ppe_pool is not None:
+			self._ppe_pool.shutdown()
+			self._ppe_pool = None
+
 	# -------------
 	# Class Methods
 	# -------------
 
 	def get_decisions(self):
-		return self.all_granular_decisions
+		return coding.decode(self.all_granular_decisions)
 
 	def get_metrics(self):
 		return self.metrics
 
+	def get_timings(self):
+		"""Wall time of each phase of each period of the last run, empty if profiling is disabled
+
+		:return: the timings (date,phase,seconds,allocated_bytes)
+		:rtype: pandas.DataFrame
+		"""
+		return self.profiler.timings()
+
+	def get_period_stats(self):
+		"""Sizes of the problem solved in each period of the last run, empty if profiling is disabled
+
+		:return: one row for each period (date,pending_donors,pending_recipients,pairs,decisions,seconds)
+		:rtype: pandas.DataFrame
+		"""
+		return self.profiler.periods()
+
+	def get_pruning_report(self):
+		"""Compatible pairs kept by the pruning stage in each period of the last run, empty if there is no pruning
+
+		:return: one row for each period (date,pairs,kept_pairs,pruned_share,fallback)
+		:rtype: pandas.DataFrame
+		"""
+		if self.pruning is None:
+			return pd.DataFrame(columns=pruning.REPORT_COLUMNS)
+		return self.pruning.report()
+
 	def debug(self, bool_flag):
 		if bool_flag:
 			logger.setLevel(logging.DEBUG)
@@ -117,267 +358,353 @@ class TestingFramework:
 			logger.setLevel(10)
 
 	# computes the metrics and return a DataFrame
-	def compute_metrics(self):
-		# fill rate
-		donors = self.all_donors.copy()
-		decisions = self.all_granular_decisions.copy()
-		recipients = self.all_recipients.copy()
-		recipients = recipients[recipients['qty']>0]
-
-		all_ppes = set(donors.ppe.unique()) ##--## So we need this?
-		all_ppes = all_ppes.union(set(recipients.ppe.unique()))
-
-		# set up result DataFrame
-		result = pd.DataFrame(columns=['metric_name','description','value','overall'])
-		# Note: the overall column is used to sort the metrics, it will be dropped at the end
+	def compute_metrics(self, overall_only=None):
+		"""Compute the metrics of the decisions made by run
 
+		:param overall_only: whether to compute only the five "overall" metrics, skipping the metrics of each (recipient,ppe) and of each ppe, defaults to the overall_metrics_only parameter of the framework
+		:type overall_only: bool, optional
+		"""
+		if overall_only is None:
+			overall_only = self.overall_metrics_only
+		decisions = self.all_granular_decisions
+		recipients = self.all_recipients[self.all_recipients['qty'] > 0]
+
+		# Each metric is a row (metric_name,description,value,overall); the rows are listed in the
+		# order of the original implementation, which appended them one at a time, so that ties in
+		# the final sort are broken in the same way.
+		# Note: the overall column is used to sort the metrics, it will be dropped at the end
+		names, descriptions, values, overall, index = [], [], [], [], []
+		n_rows = 0
+
+		def add_rows(metric_names, metric_descriptions, metric_values, is_overall):
+			nonlocal n_rows
+			metric_values = np.asarray(metric_values, dtype=np.float64)
+			if not overall_only or is_overall:
+				names.extend(metric_names)
+				descriptions.extend(metric_descriptions)
+				values.append(metric_values)
+				overall.extend([is_overall] * len(metric_values))
+				index.append(np.arange(n_rows, n_rows + len(metric_values)))
+			n_rows += len(metric_values)
+
+		# the ids and ppes are coded: observed=True skips the combinations without rows, but does not
+		# sort the groups, hence sort_index (by code, i.e., in the order of the strings)
 		############ FILL RATE for rec_id, ppe ############
-		total_request = recipients.groupby(['rec_id','ppe'])['qty'].agg(['sum'])
-		total_request =total_request.reset_index()
-		total_request.columns=['rec_id','ppe','qty']
-		fr = total_request.merge(decisions,how='left',on=['rec_id','ppe'],suffixes=['_rec','_dec'])\
-						.groupby(['rec_id','ppe'])\
-						.agg({'qty_rec':['mean'],'qty_dec':['sum','size']})
-		fr = fr.reset_index()
-		fr.columns = ['rec_id','ppe','requested','received','fill_rate']
-		fr['fill_rate'] = fr['received'] / fr['requested']
-		fr.loc[fr['fill_rate'] > 1,'fill_rate'] = 1
-		fr['fill_rate'] = fr['fill_rate'].fillna(0)
-
-		result['metric_name'] = "fill rate (" + fr['rec_id'] + "," + fr['ppe'] + ")"
-		result['description'] = "fill rate of recipient " + fr['rec_id'] + " limited to " + fr['ppe']
-		result['value'] = fr['fill_rate']
-		result['overall'] = 0
+		requested = recipients.groupby(['rec_id', 'ppe'], observed=True)['qty'].sum().sort_index()
+		received = decisions.groupby(['rec_id', 'ppe'], observed=True)['qty'].sum().reindex(requested.index, fill_value=0)
+		fill_rate = (received.to_numpy(dtype=np.float64) / requested.to_numpy(dtype=np.float64))
+		fill_rate[fill_rate > 1] = 1
+		fill_rate[np.isnan(fill_rate)] = 0
+		fr = pd.DataFrame({'ppe': requested.index.get_level_values('ppe'), 'fill_rate': fill_rate})
+
+		if overall_only:
+			n_rows += len(fr)
+		else:
+			rec_ppe = list(zip(requested.index.get_level_values('rec_id'), fr['ppe']))
+			add_rows([f'fill rate ({rec_id},{ppe})' for rec_id, ppe in rec_ppe],
+					[f'fill rate of recipient {rec_id} limited to {ppe}' for rec_id, ppe in rec_ppe], fill_rate, 0)
 
 		############ FILL RATE FOR EACH PPE ############
-		fr_p = fr.groupby('ppe')['fill_rate'].mean()
-
-		for ppe, val in fr_p.items():
-			result.loc[len(result)] = [f'fill rate ({ppe})', f'average fill rate among recipients who requested {ppe}',val,0]
+		fr_p = fr.groupby('ppe', observed=True)['fill_rate'].mean().sort_index()
+		add_rows([f'fill rate ({ppe})' for ppe in fr_p.index],
+				[f'average fill rate among recipients who requested {ppe}' for ppe in fr_p.index], fr_p.values, 0)
 
-		fr_p_zero = fr[fr.fill_rate > 0].groupby('ppe')['fill_rate'].mean()
-		fr_p_zero
-
-		for ppe, val in fr_p_zero.items():
-			result.loc[len(result)] = [f'fill rate exc zeros ({ppe})',
-				f'average fill rate among recipients who requested {ppe} and received at least one unit',val,0]
+		fr_p_zero = fr[fr.fill_rate > 0].groupby('ppe', observed=True)['fill_rate'].mean().sort_index()
+		add_rows([f'fill rate exc zeros ({ppe})' for ppe in fr_p_zero.index],
+				[f'average fill rate among recipients who requested {ppe} and received at least one unit' for ppe in fr_p_zero.index],
+				fr_p_zero.values, 0)
 
 		############ OVERALL FILL RATE ############
-		result.loc[len(result)] = [f'fill rate', f'overall fill rate, i.e., the average of the fill rates (ppe)',fr_p.mean(),1]
-		result.loc[len(result)] = [f'fill rate exc zeros', f'overall fill rate among recipients who received something, i.e., the average of the fill rates (ppe) among recipients who received at least one unit',fr_p_zero.mean(),1]
+		add_rows(['fill rate', 'fill rate exc zeros'],
+				['overall fill rate, i.e., the average of the fill rates (ppe)',
+				'overall fill rate among recipients who received something, i.e., the average of the fill rates (ppe) among recipients who received at least one unit'],
+				[fr_p.mean(), fr_p_zero.mean()], 1)
 
 		############ UNIT_MILES ############
-		decisions['unit_miles'] = decisions['distance'] * decisions['qty']
-
-		gb = decisions.groupby('ppe')
-		rr = (gb['unit_miles'].sum() / gb['qty'].sum()).to_frame().reset_index()
-		rr.columns=['ppe','avg_unit_miles']
-
-		for _, row in rr.iterrows():
-			ppe = row['ppe']
-			result.loc[len(result)] = [f'avg unit-miles ({ppe})', f'average miles travelled by each unit of {ppe}',row['avg_unit_miles'],0]
-
-		overall_unit_miles = decisions.unit_miles.sum() / decisions.qty.sum()
-		result.loc[len(result)] = [f'avg unit-miles', f'average miles travelled by each unit of ppe',overall_unit_miles,1]
+		gb = decisions['qty'].groupby(decisions['ppe'], observed=True)
+		qty = gb.sum().sort_index()
+		unit_miles = (decisions['distance'] * decisions['qty']).groupby(decisions['ppe'], observed=True).sum().sort_index()
+		avg_unit_miles = unit_miles / qty
+		add_rows([f'avg unit-miles ({ppe})' for ppe in avg_unit_miles.index],
+				[f'average miles travelled by each unit of {ppe}' for ppe in avg_unit_miles.index], avg_unit_miles.values, 0)
+		add_rows(['avg unit-miles'], ['average miles travelled by each unit of ppe'],
+				[(decisions['distance'] * decisions['qty']).sum() / decisions['qty'].sum()], 1)
 
 		############ HOLDING TIME ############
-		decisions['unit_holding_time'] = decisions['holding_time'] * decisions['qty']
-
-		gb = decisions.groupby('ppe')
-		rr = (gb['unit_holding_time'].sum() / gb['qty'].sum()).to_frame().reset_index()
-		rr.columns=['ppe','avg_unit_days']
-
-		for _,row in rr.iterrows():
-			ppe = row['ppe']
-			result.loc[len(result)] = [f'avg unit-days ({ppe})', f'average days that each unit of {ppe} stayed idle',row['avg_unit_days'],0]
-
-		overall_holding_time = decisions.unit_holding_time.sum() / decisions.qty.sum()
-		result.loc[len(result)] = [f'avg holding time', f'average days that each unit of ppe stayed idle',overall_holding_time,1]
+		unit_holding_time = (decisions['holding_time'] * decisions['qty']).groupby(decisions['ppe'], observed=True).sum().sort_index()
+		avg_unit_days = unit_holding_time / qty
+		add_rows([f'avg unit-days ({ppe})' for ppe in avg_unit_days.index],
+				[f'average days that each unit of {ppe} stayed idle' for ppe in avg_unit_days.index], avg_unit_days.values, 0)
+		add_rows(['avg holding time'], ['average days that each unit of ppe stayed idle'],
+				[(decisions['holding_time'] * decisions['qty']).sum() / decisions['qty'].sum()], 1)
 
 		########## NUMBER OF SHIPMENTS ############
-		total_shipments = len(decisions.groupby(['don_id','rec_id','date']).size())
+		total_shipments = decisions.groupby(['don_id', 'rec_id', 'date'], observed=True).ngroups
 		donors = decisions['don_id'].nunique()
-		result.loc[len(result)] = [f'avg number of shipments', f'average number of shipments among donors',total_shipments/donors,1]
+		add_rows(['avg number of shipments'], ['average number of shipments among donors'], [total_shipments / donors], 1)
 
-		result = result.sort_values(['overall','metric_name'])
-		result.drop(columns=['overall'],inplace=True)
+		result = pd.DataFrame({
+			'metric_name': names,
+			'description': descriptions,
+			'value': np.concatenate(values),
+			'overall': overall,
+		}, index=np.concatenate(index))
+		result = result.sort_values(['overall', 'metric_name'])
+		result.drop(columns=['overall'], inplace=True)
 
 		self.metrics = result
 		return
 
+	def call_strategy(self, date, agg_cur_donors, agg_cur_recipients, cur_distance_mat):
+		"""Call the strategy on the matching problem of a period. With ppe_jobs > 1 and a ppe-separable
+		strategy, the problem is split by ppe and the subproblems are solved in parallel
+
+		:return: the decisions of the strategy (don_id,rec_id,ppe,qty)
+		:rtype: pandas.DataFrame
+		"""
+		strategy_strings = self.strategy_strings
+		if strategy_strings is None:
+			strategy_strings = not coding.is_categorical_aware(self.strategy)
+		if strategy_strings:
+			agg_cur_donors = coding.decode(agg_cur_donors)
+			agg_cur_recipients = coding.decode(agg_cur_recipients)
+			cur_distance_mat = coding.decode(cur_distance_mat)
+		if self.ppe_jobs > 1 and decomposition.is_ppe_separable(self.strategy):
+			if self._ppe_pool is None:
+				self._ppe_pool = decomposition.EXECUTORS[self.ppe_executor](max_workers=self.ppe_jobs)
+			return decomposition.solve_by_ppe(self.strategy, date, agg_cur_donors, agg_cur_recipients,
+											cur_distance_mat, self._ppe_pool)
+		return self.strategy(date, agg_cur_donors, agg_cur_recipients, cur_distance_mat)
+
+	def solve_period(self, state, d1, d2):
+		"""Solve the matching problem at the end of the period (d1,d2): add the requests received
+		in the period to the pending requests, call the strategy, and ship the decided units
+
+		:param state: the engine with the pending requests
+		:type state: an engine of the module engines
+		:param d1: the start of the period (excluded)
+		:type d1: pandas.Timestamp
+		:param d2: the end of the period (excluded), which is the date of the decisions
+		:type d2: pandas.Timestamp
+		:return: the granular decisions made at d2, None if there were no compatible pending requests
+		:rtype: pandas.DataFrame
+		"""
+		profiler = self.profiler
+		with profiler.phase('add_requests'):
+			state.add_requests(d1, d2)
+
+		# Aggregate the pending requests: one row for each donor_id (or recipient_id) and ppe.
+		# We will pass these tables to the method strategy below
+		with profiler.phase('aggregate'):
+			agg_cur_donors, agg_cur_recipients = state.aggregate()
+
+		# for each date, write the current pending requests
+		with profiler.phase('compatible_pairs'):
+			don_rec = state.compatible_pairs(agg_cur_donors, agg_cur_recipients)
+		profiler.count(pending_donors=len(agg_cur_donors), pending_recipients=len(agg_cur_recipients), pairs=len(don_rec))
+		# if there are no recipients, no donors, or no compatible pairs of donor-recipient, there is nothing to decide
+		if len(agg_cur_recipients) == 0 or \
+			len(agg_cur_donors) == 0 or \
+			len(don_rec) == 0:
+			return None
+
+		with profiler.phase('pair_distances'):
+			cur_distance_mat = state.pair_distances(don_rec, self.distances)
+		all_distance_mat = cur_distance_mat
+		if self.pruning is not None:
+			with profiler.phase('prune'):
+				cur_distance_mat = self.pruning.prune(d2, agg_cur_donors, agg_cur_recipients, all_distance_mat)
+		if logger.isEnabledFor(logging.DEBUG):
+			logger.debug("Donor_receipient pending requests")
+			logger.debug('\n\t'+ don_rec.head().to_string().replace('\n', '\n\t'))
+			logger.debug("Distance Matrix")
+			logger.debug('\n\t'+ cur_distance_mat.head().to_string().replace('\n', '\n\t'))
+
+		if self.writeFiles:
+			with profiler.phase('write_files'):
+				writer = self._output if self._output is not None else self.open_output()
+				writer.write(d2, 'recipients', agg_cur_recipients)
+				writer.write(d2, 'donors', agg_cur_donors)
+				writer.write(d2, 'distance_matrix', cur_distance_mat)
+
+		with profiler.phase('strategy'):
+			agg_decisions = self.call_strategy(d2, agg_cur_donors, agg_cur_recipients, cur_distance_mat)
+		if self.pruning is not None and self.pruning.fallback:
+			with profiler.phase('prune'):
+				fallback = self.pruning.needs_fallback(agg_cur_donors, agg_cur_recipients, agg_decisions)
+			if fallback:
+				# the pruned pairs may have prevented a shipment: solve the period with all the pairs
+				logger.info(f'Pruning fallback: solving the period with all the {len(all_distance_mat)} pairs')
+				cur_distance_mat = all_distance_mat
+				with profiler.phase('strategy'):
+					agg_decisions = self.call_strategy(d2, agg_cur_donors, agg_cur_recipients, cur_distance_mat)
+		agg_decisions['date'] = d2
+		agg_decisions = agg_decisions.merge(cur_distance_mat, on=['don_id', 'rec_id'])
+
+		# The dataframe of agg_decisions contains the aggregated shipping decisions
+		# example
+		#    don_id rec_id          ppe   qty                      date     distance
+		# 0   don0   rec0  faceShields  10.0 2020-04-09 16:26:00+00:00  2548.016134
+		# 1   don1   rec1  faceShields   1.0 2020-04-09 16:26:00+00:00  2527.163615
+		# 2   don3   rec2  faceShields   5.0 2020-04-09 16:26:00+00:00  2359.760082
+
+		# turn it into granular decisions, shipping the oldest requests first
+		with profiler.phase('ship'):
+			granular_decisions = state.ship(agg_decisions)
+			granular_decisions = granular_decisions.merge(cur_distance_mat, on=['don_id', 'rec_id'])
+		profiler.count(decisions=len(granular_decisions))
+
+		# save current decisions
+		if self.writeFiles:
+			with profiler.phase('write_files'):
+				writer.write(d2, 'decisions', granular_decisions)
+		return granular_decisions
+
 	def run(self):
-		self.all_donors = self.all_donors[self.all_donors.qty <= self.max_donation_qty]
+		# the donors table is filtered into a local variable, so that the framework can be run again with another max_donation_qty
+		all_donors = self.all_donors[self.all_donors.qty <= self.max_donation_qty]
+		self.all_granular_decisions = self._empty_decisions()
 
-		cur_donors = self.all_donors.drop(index=self.all_donors.index)
-		cur_recipients = self.all_recipients.drop(index=self.all_recipients.index)
+		# the engine keeps track of the pending requests (cur_donors and cur_recipients)
+		state = engines.ENGINES[self.engine](all_donors, self.all_recipients)
+		if self.writeFiles:
+			self.open_output()
 
 		# Fetch date ranges
 		cur_date = min(self.all_recipients.date.min(),
-					   self.all_donors.date.min()) - datetime.timedelta(minutes=1)
-		max_date = max(self.all_recipients.date.max(),
-					   self.all_donors.date.max()) + datetime.timedelta(minutes=1)
+					   all_donors.date.min()) - datetime.timedelta(minutes=1)
 
 		# Intialize dates
 		d1 = cur_date
 		d2 = cur_date + datetime.timedelta(days=self.interval)
+		return self._run_periods(state, all_donors, d1, d2, 0)
 
-		last_iteration = False
-		while not last_iteration:
-			if d2 > max_date:
-				d2 = max_date + datetime.timedelta(minutes=2) ##--## Is this needed?
-				last_iteration = True
-			logger.info(f'===== From {d1} to {d2} ======')
-			cur_recipients = pd.concat([
-										cur_recipients,
-										self.all_recipients.loc[(self.all_recipients.date > d1) & (self.all_recipients.date < d2)].copy()
-										])
-			cur_donors = pd.concat([
-									cur_donors,
-									self.all_donors.loc[(self.all_donors.date > d1) & (self.all_donors.date < d2)].copy()
-									])
-
-			'''
-			Aggregate cur_donors and cur_recipients:
-			These tables could have multiple rows for each donor (or recipient)
-			for the same ppe. We need to create new dataframes with one row for
-			each donor_id (or recipient_id) and ppe. We will pass these tables to
-			the method strategy below
-			'''
-			agg_cur_donors = cur_donors.groupby(['don_id', 'ppe'])\
-								.agg({'date': 'min', 'qty': 'sum'})\
-								.reset_index()
-			agg_cur_recipients = cur_recipients.groupby(['rec_id', 'ppe'])\
-								.agg({'date': 'min', 'qty': 'sum'})\
-								.reset_index()
-
-			# for each date, write the current pending requests
-			don_rec = pd.DataFrame(agg_cur_donors.merge(agg_cur_recipients, on=['ppe'])\
-									.groupby(['don_id', 'rec_id']).groups.keys())
-			# if there are no recipients, no donors, or no compatible pairs of donor-recipient, continue
-			if len(agg_cur_recipients) == 0 or \
-				len(agg_cur_donors) == 0 or \
-				len(don_rec) == 0:
-				d1 = d2
-				d2 = d1 + datetime.timedelta(days=self.interval)
-				continue
+	def resume(self, checkpoint, strategy=None, interval=None):
+		"""Continue a run from a checkpoint written by run (see checkpoint_path), and compute the metrics of
+		the whole run. The run continues with the strategy, interval, and max_donation_qty of the checkpoint,
+		unless another strategy or interval is given (e.g., to compare what-if changes from a mid-horizon snapshot)
 
-			don_rec.columns = ['don_id', 'rec_id']
-			logger.debug("Donor_receipient pending requests")
-			logger.debug('\n\t'+ don_rec.head().to_string().replace('\n', '\n\t'))
-			logger.debug("Distance Matrix")
-			logger.debug('\n\t'+ self.distance_mat.head().to_string().replace('\n', '\n\t'))
-			cur_distance_mat = don_rec.merge(self.distance_mat, on=['don_id', 'rec_id'])
+		:param checkpoint: the checkpoint, or the file of the checkpoint
+		:type checkpoint: checkpoint.Checkpoint or str
+		:param strategy: the strategy of the rest of the run, defaults to None (the strategy of the checkpoint)
+		:type strategy: a function with 4 inputs: current date, D^t, R^t, M, optional
+		:param interval: the interval of the rest of the run, defaults to None (the interval of the checkpoint)
+		:type interval: int, optional
+		"""
+		if isinstance(checkpoint, str):
+			checkpoint = Checkpoint.load(checkpoint)
+		if strategy is None:
+			strategy = checkpoint.strategy
+			if strategy is None:
+				raise ValueError('The checkpoint does not contain the strategy: pass it to resume')
+		self.strategy = strategy
+		if checkpoint.max_donation_qty is not None:
+			self.max_donation_qty = checkpoint.max_donation_qty
+		d1, d2 = checkpoint.d1, checkpoint.d2
+		if interval is not None:
+			self.interval = interval
+			d2 = d1 + datetime.timedelta(days=interval)
+		elif checkpoint.interval is not None:
+			self.interval = checkpoint.interval
+		logger.info(f'Resuming from {checkpoint}')
+
+		all_donors = self.all_donors[self.all_donors.qty <= self.max_donation_qty]
+		self.all_granular_decisions = checkpoint.decisions.copy()
+		state = engines.ENGINES[self.engine](all_donors, self.all_recipients)
+		state.restore(checkpoint.cur_donors, checkpoint.cur_recipients)
+		if self.writeFiles:
+			self.open_output(append=True)
+		return self._run_periods(state, all_donors, d1, d2, checkpoint.period)
+
+	def _run_periods(self, state, all_donors, d1, d2, period):
+		"""Solve the periods from (d1,d2) to the end of the horizon, then compute the metrics"""
+		self.profiler.reset()
+		if self.pruning is not None:
+			self.pruning.reset()
+		if self.ppe_jobs > 1 and not decomposition.is_ppe_separable(self.strategy):
+			logger.warning(f'The strategy {self.get_strategy()} is not marked as ppe-separable: the periods are not split by ppe')
+		elif self.ppe_jobs > 1 and self.ppe_executor == 'process' and decomposition.is_stateful(self.strategy):
+			logger.warning(f'The strategy {self.get_strategy()} keeps a state between periods (e.g., the warm start potentials), '
+						   f'which is lost in the worker processes of ppe_executor=\'process\': use ppe_executor=\'thread\' to keep it')
+		max_date = max(self.all_recipients.date.max(),
+					   all_donors.date.max()) + datetime.timedelta(minutes=1)
 
-			if self.writeFiles:
-				dir = os.path.join(self.output_directory, str(d2.date()))
-				if not os.path.exists(dir):
-					os.makedirs(dir)
-				agg_cur_recipients.to_csv(dir + f'/recipients.csv')
-				agg_cur_donors.to_csv(dir + f'/donors.csv')
-				cur_distance_mat.to_csv(dir + f'/distance_matrix.csv')
-
-			agg_decisions = self.strategy(d2, agg_cur_donors, agg_cur_recipients, cur_distance_mat)
-			agg_decisions['date'] = d2
-			agg_decisions = agg_decisions.merge(cur_distance_mat, on=['don_id', 'rec_id'])
-
-			# The dataframe of agg_decisions contains the aggregated shipping decisions
-			# example
-			#    don_id rec_id          ppe   qty                      date     distance
-			# 0   don0   rec0  faceShields  10.0 2020-04-09 16:26:00+00:00  2548.016134
-			# 1   don1   rec1  faceShields   1.0 2020-04-09 16:26:00+00:00  2527.163615
-			# 2   don3   rec2  faceShields   5.0 2020-04-09 16:26:00+00:00  2359.760082
-
-			# turn it into granular decisions
-			granular_decisions = pd.DataFrame(columns=[
-					'don_id',
-					'rec_id',
-					'ppe',
-					'date',
-					'qty',
-					'holding_time']
-			)
-			for _, cur_dec in agg_decisions.iterrows():
-				don = cur_dec.don_id
-				rec = cur_dec.rec_id
-				ppe = cur_dec.ppe
-				dd = cur_dec.date
-				totremqty = cur_dec.qty
-				don_df = cur_donors[(cur_donors.don_id == don) & \
-									(cur_donors.ppe == ppe)]\
-									.sort_values('date')  # just this ppe and don-rec
-				rec_df = cur_recipients[(cur_recipients.rec_id == rec) & \
-										(cur_recipients.ppe == ppe)]\
-										.sort_values('date')
-
-				dilocx = 0
-				rilocx = 0
-				while totremqty > 0:
-					drow = don_df.iloc[dilocx]
-					rrow = rec_df.iloc[rilocx]
-					dix = drow.name
-					rix = rrow.name
-					shipped_qty = min(drow.qty, rrow.qty, totremqty)
-					# make the granular decision of shipping
-					granular_decisions.loc[len(granular_decisions)] = [
-						drow.don_id, rrow.rec_id, ppe, dd, shipped_qty, np.round((dd - drow.date).total_seconds() / 24 / 3600)]
-
-					# update quantities
-					totremqty -= shipped_qty
-
-					# update donors table
-					cur_donors.loc[dix, 'qty'] -= shipped_qty
-					don_df.loc[dix, 'qty'] -= shipped_qty
-
-					# update recipient qty
-					cur_recipients.loc[rix, 'qty'] -= shipped_qty
-					rec_df.loc[rix, 'qty'] -= shipped_qty
-
-					'''
-					This shipping action has one of the following outcomes:
-					(1) brings rrow.qty to 0,
-					(2) brings drow.qty to 0,
-					(3) brings neither to 0
-					'''
-
-					if rec_df.loc[rix, 'qty'] == 0:
-						rilocx += 1
-						if rilocx == len(rec_df) and totremqty > 0:
-							# The decisions is infeasible because I am trying to
-							# ship more than requested
-							logger.error(
-								'The decisions is infeasible because I am trying to ship more than requested')
-					elif don_df.loc[dix, 'qty'] == 0:
-						dilocx += 1
-						if dilocx == len(don_df) and totremqty > 0:
-							# The decisions is infeasible because I am trying to
-							# ship more than supplied
-							logger.error(
-								'The decisions is infeasible because I am trying to ship more than supplied')
-					else:
-						# should be totremqty == 0
-						if totremqty != 0:
-							logger.error(
-								'Weird error. If I am here, I should have totremqty == 0')
-
-				# remove from tables those with qty == 0
-				cur_donors = cur_donors.loc[cur_donors.qty > 0]
-				cur_recipients = cur_recipients.loc[cur_recipients.qty > 0]
+		last_iteration = False
+		try:
+			while not last_iteration:
+				if d2 > max_date:
+					d2 = max_date + datetime.timedelta(minutes=2) ##--## Is this needed?
+					last_iteration = True
+				logger.info(f'===== From {d1} to {d2} ======')
+				self.profiler.start_period(d2)
+				granular_decisions = self.solve_period(state, d1, d2)
+				if granular_decisions is not None:
+					with self.profiler.phase('concat'):
+						self.all_granular_decisions = pd.concat([self.all_granular_decisions, granular_decisions], ignore_index=True)
 
-			granular_decisions = granular_decisions.merge(cur_distance_mat, on=['don_id', 'rec_id'])
+				d1 = d2
+				d2 = d1 + datetime.timedelta(days=self.interval)
+				period += 1
+				if self.checkpoint_path is not None and not last_iteration and period % self.checkpoint_every == 0:
+					with self.profiler.phase('checkpoint'):
+						self._save_checkpoint(state, d1, d2, period)
+				self.profiler.end_period()
 
-			self.all_granular_decisions = pd.concat([self.all_granular_decisions, granular_decisions], ignore_index=True)
-			# update decisions and save current decisions
+			# save all decisions made, and wait for the files to be written
 			if self.writeFiles:
-				granular_decisions.to_csv(dir + f'/decisions.csv')
-
-			d1 = d2
-			d2 = d1 + datetime.timedelta(days=self.interval)
-
-		# save all decisions made
-		if self.writeFiles:
-			self.all_granular_decisions.to_csv('output/all_decisions.csv')
+				with self.profiler.phase('write_files'):
+					writer = self._output if self._output is not None else self.open_output()
+					writer.write_all('all_decisions', self.all_granular_decisions)
+					self.close_output()
+		except BaseException:
+			# raise the error of the run, not an error of the writer (e.g., of a file already queued) when closing it
+			self.close_ppe_pool()
+			try:
+				self.close_output()
+			except Exception:
+				logger.exception('Error while closing the writer of the files after an error of the run')
+			raise
+		self.close_ppe_pool()
+		self.close_output()
 
 		# Run metrics for results
-		self.compute_metrics()
+		with self.profiler.phase('compute_metrics'):
+			self.compute_metrics()
 
 		return {"status": "Success"}
+
+	def _empty_decisions(self):
+		"""Table of the granular decisions with no rows, with the codes of the ids and ppes of D and R"""
+		decisions = pd.DataFrame(columns=DECISION_COLUMNS)
+		return decisions.astype({'don_id': self.all_donors.don_id.dtype, 'rec_id': self.all_recipients.rec_id.dtype,
+								'ppe': self.all_donors.ppe.dtype})
+
+	def _save_checkpoint(self, state, d1, d2, period):
+		cur_donors, cur_recipients = state.pending()
+		checkpoint = Checkpoint(d1, d2, period, cur_donors, cur_recipients, self.all_granular_decisions,
+								strategy=self.strategy, interval=self.interval,
+								max_donation_qty=self.max_donation_qty, engine=self.engine)
+		path = self.checkpoint_path.format(period=period)
+		checkpoint.save(path)
+		logger.info(f'Checkpoint written to {path}')
+
+
+def _file_key(path):
+	"""Key of the content of a file in the caches of the data: its absolute path, size, and modification time"""
+	stat = os.stat(path)
+	return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+@functools.lru_cache(maxsize=2)
+def _read_requests(donor_file, recipient_file, cache_dir):
+	"""The coded tables D and R read from the files with the given keys (see _file_key), shared by the frameworks
+	that read the same files; the frameworks replace these tables, and never modify them in place"""
+	all_donors = cache.read_requests(donor_file[0], cache_dir)
+	all_recipients = cache.read_requests(recipient_file[0], cache_dir)
+	return coding.encode_requests(all_donors, all_recipients)
+
+
+@functools.lru_cache(maxsize=2)
+def _read_distances(distance_file, cache_dir):
+	"""The distance matrix read from the file with the given key (see _file_key), shared by the frameworks"""
+	return cache.read_distance_matrix(distance_file[0], cache_dir)
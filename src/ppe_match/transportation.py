@@ -0,0 +1,195 @@
+"""Module defining the solvers of the transportation problem used by the optimal matching strategy.
+Copyright 2021 M Samorani, R Bala, R Jacob, S He
+Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except in compliance with the License. You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific language governing permissions and limitations under the License.
+
+Given the supply s_i of each donor i, the demand d_j of each recipient j, and the
+cost c_ij of shipping one unit from i to j (np.inf if i cannot ship to j), the
+transportation problem finds the shipments x_ij that maximize the units shipped
+and, among the maximum shipments, minimize the total cost (unit-miles).
+"""
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+	from scipy.optimize import linprog
+	from scipy import sparse
+except ImportError:  # scipy is optional
+	linprog = None
+
+
+def solve_ssp(supply, demand, cost, rec_potentials=None):
+	"""Solve the transportation problem with the successive shortest path algorithm.
+	Each iteration finds a cheapest augmenting path from a donor with residual supply to
+	a recipient with residual demand (Dijkstra with node potentials, dense over the
+	recipients) and ships the largest quantity along it. The algorithm stops when no
+	augmenting path exists, so the flow is maximum and of minimum cost.
+
+	:param supply: the supply of each donor
+	:type supply: numpy.ndarray (n_don)
+	:param demand: the demand of each recipient
+	:type demand: numpy.ndarray (n_rec)
+	:param cost: the unit cost of each (donor, recipient) pair, np.inf for missing pairs
+	:type cost: numpy.ndarray (n_don, n_rec)
+	:param rec_potentials: potentials of the recipients from a previous solution, lowered where needed to keep the reduced costs nonnegative, defaults to None. They only seed the potentials: the solution starts from zero flow
+	:type rec_potentials: numpy.ndarray (n_rec), optional
+	:return: the shipments x and the final potentials of the recipients
+	:rtype: tuple of numpy.ndarray
+	"""
+	supply = np.asarray(supply, dtype=np.float64).copy()
+	demand = np.asarray(demand, dtype=np.float64).copy()
+	cost = np.asarray(cost, dtype=np.float64)
+	n_don, n_rec = cost.shape
+	x = np.zeros((n_don, n_rec))
+	if n_don == 0 or n_rec == 0:
+		return x, np.zeros(n_rec)
+
+	'''
+	Potentials: p_S = 0 for the source, p_i for the donors, p_j for the recipients, p_T
+	for the sink. The reduced cost of an arc u->v is c_uv + p_u - p_v and it is kept
+	nonnegative on all residual arcs, so that Dijkstra can be used. Donors with residual
+	supply always have p_i = 0.
+	'''
+	p_don = np.zeros(n_don)
+	# closest donor with residual supply of each recipient, and its cost
+	col_arg = _argmin_over_rows(cost, supply > 0)
+	col_min = np.where(col_arg >= 0, cost[np.maximum(col_arg, 0), np.arange(n_rec)], np.inf)
+	if rec_potentials is None:
+		p_rec = np.zeros(n_rec)
+	else:
+		p_rec = np.asarray(rec_potentials, dtype=np.float64).copy()
+		p_rec[~np.isfinite(p_rec)] = 0.0
+	# lower the potentials that would make the reduced cost of a forward arc negative
+	p_rec = np.where(np.isfinite(col_min), np.minimum(p_rec, col_min), p_rec)
+	p_sink = p_rec[demand > 0].min() if (demand > 0).any() else 0.0
+
+	while (supply > 0).any() and (demand > 0).any():
+		# labels (reduced distances from the source). The donors with residual supply are at 0;
+		# their forward arcs are relaxed at once with the column minimum of the cost matrix
+		dist_don = np.full(n_don, np.inf)
+		dist_rec = np.full(n_rec, np.inf)
+		done_don = supply > 0
+		done_rec = np.zeros(n_rec, dtype=bool)
+		dist_don[done_don] = 0.0
+		pred_rec = col_arg.copy()
+		dist_rec = np.maximum(col_min - p_rec, 0.0)
+		pred_don = np.full(n_don, -1)
+		dist_sink = np.inf
+		last_rec = -1
+
+		while True:
+			cand_rec = np.where(done_rec, np.inf, dist_rec)
+			j = int(np.argmin(cand_rec))
+			cand_don = np.where(done_don, np.inf, dist_don)
+			i = int(np.argmin(cand_don))
+			if min(cand_rec[j], cand_don[i]) >= dist_sink or min(cand_rec[j], cand_don[i]) == np.inf:
+				break
+			if cand_rec[j] <= cand_don[i]:
+				# settle recipient j: arc to the sink and backward arcs to the donors shipping to j
+				done_rec[j] = True
+				if demand[j] > 0:
+					label = dist_rec[j] + p_rec[j] - p_sink
+					if label < dist_sink:
+						dist_sink = label
+						last_rec = j
+				back = np.flatnonzero((x[:, j] > 0) & ~done_don)
+				if len(back) > 0:
+					label = dist_rec[j] + np.maximum(-cost[back, j] + p_rec[j] - p_don[back], 0.0)
+					better = label < dist_don[back]
+					dist_don[back[better]] = label[better]
+					pred_don[back[better]] = j
+			else:
+				# settle donor i (reached through a backward arc): forward arcs to all recipients
+				done_don[i] = True
+				label = dist_don[i] + np.maximum(cost[i] + p_don[i] - p_rec, 0.0)
+				better = (label < dist_rec) & ~done_rec
+				dist_rec[better] = label[better]
+				pred_rec[better] = i
+
+		if last_rec < 0:
+			break  # no augmenting path: the flow is maximum
+
+		# update the potentials so that the reduced costs stay nonnegative
+		p_don += np.minimum(np.where(supply > 0, 0.0, dist_don), dist_sink)
+		p_rec += np.minimum(dist_rec, dist_sink)
+		p_sink += dist_sink
+
+		# find the path and the quantity to ship along it
+		path = []
+		j = last_rec
+		delta = demand[j]
+		while True:
+			i = pred_rec[j]
+			path.append((i, j))
+			if pred_don[i] < 0:
+				delta = min(delta, supply[i])
+				break
+			j = pred_don[i]
+			path.append((i, j))
+			delta = min(delta, x[i, j])
+		for k, (i, j) in enumerate(path):
+			if k % 2 == 0:
+				x[i, j] += delta
+			else:
+				x[i, j] -= delta
+		supply[path[-1][0]] -= delta
+		demand[last_rec] -= delta
+		if supply[path[-1][0]] <= 0:
+			# the donor has no more supply: update the closest donor of the recipients it was closest to
+			cols = np.flatnonzero(col_arg == path[-1][0])
+			col_arg[cols] = _argmin_over_rows(cost[:, cols], supply > 0)
+			col_min[cols] = np.where(col_arg[cols] >= 0, cost[np.maximum(col_arg[cols], 0), cols], np.inf)
+
+	return x, p_rec - p_sink
+
+
+def solve_linprog(supply, demand, cost):
+	"""Solve the transportation problem with scipy.optimize.linprog (HiGHS) in two stages:
+	first maximize the units shipped, then minimize the cost of shipping that many units
+
+	:param supply: the supply of each donor
+	:type supply: numpy.ndarray (n_don)
+	:param demand: the demand of each recipient
+	:type demand: numpy.ndarray (n_rec)
+	:param cost: the unit cost of each (donor, recipient) pair, np.inf for missing pairs
+	:type cost: numpy.ndarray (n_don, n_rec)
+	:return: the shipments x
+	:rtype: numpy.ndarray
+	"""
+	if linprog is None:
+		raise ImportError('solve_linprog requires scipy')
+	cost = np.asarray(cost, dtype=np.float64)
+	n_don, n_rec = cost.shape
+	x = np.zeros((n_don, n_rec))
+	rows, cols = np.nonzero(np.isfinite(cost))
+	if len(rows) == 0:
+		return x
+	n = len(rows)
+	A = sparse.vstack([
+		sparse.csr_matrix((np.ones(n), (rows, np.arange(n))), shape=(n_don, n)),
+		sparse.csr_matrix((np.ones(n), (cols, np.arange(n))), shape=(n_rec, n)),
+	])
+	b = np.concatenate([supply, demand])
+	stage1 = linprog(-np.ones(n), A_ub=A, b_ub=b, bounds=(0, None), method='highs')
+	if stage1.status != 0:
+		raise RuntimeError(f'linprog failed: {stage1.message}')
+	shipped = -stage1.fun
+	A2 = sparse.vstack([A, -sparse.csr_matrix(np.ones((1, n)))])
+	b2 = np.concatenate([b, [-shipped * (1 - 1e-9)]])
+	stage2 = linprog(cost[rows, cols], A_ub=A2, b_ub=b2, bounds=(0, None), method='highs')
+	if stage2.status != 0:
+		raise RuntimeError(f'linprog failed: {stage2.message}')
+	x[rows, cols] = np.round(stage2.x, 6)
+	return x
+
+
+def _argmin_over_rows(cost, rows):
+	"""row (index into cost) of the minimum of each column over the given rows, -1 if there are no rows"""
+	if not rows.any():
+		return np.full(cost.shape[1], -1)
+	idx = np.flatnonzero(rows)
+	return idx[cost[idx].argmin(axis=0)]